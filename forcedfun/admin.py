@@ -1,7 +1,149 @@
+import typing
+
 from django.contrib import admin
+from django.contrib import messages
+from django.contrib.auth import admin as auth_admin
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db.models import Model
+from django.db.models import QuerySet
+from django.http import FileResponse
+from django.http import HttpRequest
+from django.http import HttpResponse
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.template.response import SimpleTemplateResponse
+from django.template.response import TemplateResponse
+from django.urls import URLPattern
+from django.urls import path
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.html import format_html_join
+from django.utils.safestring import SafeString
+
+from forcedfun import answers
+from forcedfun import outbox
+from forcedfun import purge
+from forcedfun import shards
+from forcedfun import utils
+from forcedfun.forms import MembersForm
+from forcedfun.models import AnalyticsReport
 from forcedfun.models import Game
+from forcedfun.models import OutboxEvent
 from forcedfun.models import Question
+from forcedfun.models import RequestProfile
 from forcedfun.models import Selection
+from forcedfun.models import SlowQuery
+
+M = typing.TypeVar("M", bound=Model)
+
+
+def queue_purge(
+    model_admin: admin.ModelAdmin[typing.Any],
+    request: HttpRequest,
+    kind: str,
+    ids: list[int],
+    shard: str = "",
+) -> None:
+    # a purge of a big game outlasts the request timeout, the purge --queued
+    # job deletes the rows batch by batch and refreshes the leaderboard
+    purge.enqueue(kind, ids, shard=shard)
+    model_admin.message_user(
+        request,
+        f"Queued {len(ids)} {kind}s for purge --queued, which deletes them "
+        "with their questions and selections and then refreshes the "
+        "leaderboard. They are listed until it ran.",
+        messages.WARNING,
+    )
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    # picks the shard ShardedAdmin reads, shown with several shards only
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(
+        self, request: HttpRequest, model_admin: admin.ModelAdmin[typing.Any]
+    ) -> list[tuple[str, str]]:
+        return [(alias, alias) for alias in shards.names()]
+
+    def has_output(self) -> bool:
+        return len(self.lookup_choices) > 1
+
+    def queryset(
+        self, request: HttpRequest, queryset: QuerySet[typing.Any]
+    ) -> QuerySet[typing.Any]:
+        return queryset
+
+    def choices(self, changelist: typing.Any) -> typing.Iterator[typing.Any]:
+        # no "All", a changelist reads one shard
+        selected = self.value() or shards.names()[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                "selected": alias == selected,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: alias}
+                ),
+                "display": title,
+            }
+
+
+def rendered(response: HttpResponse) -> HttpResponse:
+    # templates evaluate querysets, which read the shard of the block they
+    # are evaluated in
+    if isinstance(response, SimpleTemplateResponse):
+        response.render()
+    return response
+
+
+class ShardedAdmin(admin.ModelAdmin[M]):
+    """
+    Reads and writes the model on one shard per request: a changelist the
+    shard of its ?shard= filter, an object the shard it is on.
+    """
+
+    def get_list_filter(self, request: HttpRequest) -> list[typing.Any]:
+        return [ShardListFilter, *super().get_list_filter(request)]
+
+    def request_shard(self, request: HttpRequest) -> str:
+        alias = request.GET.get("shard", "")
+        return alias if alias in shards.names() else shards.names()[0]
+
+    def object_shard(self, object_id: str) -> str:
+        if not object_id.isdigit():
+            return shards.current()
+        pk = int(object_id)
+        return shards.locate(self.model, shards.for_id(pk), pk=pk)
+
+    def changelist_view(
+        self, request: HttpRequest, extra_context: dict[str, typing.Any] | None = None
+    ) -> HttpResponse:
+        with shards.using(self.request_shard(request)):
+            return rendered(super().changelist_view(request, extra_context))
+
+    def changeform_view(
+        self,
+        request: HttpRequest,
+        object_id: str | None = None,
+        form_url: str = "",
+        extra_context: dict[str, typing.Any] | None = None,
+    ) -> HttpResponse:
+        alias = (
+            self.object_shard(object_id) if object_id else self.request_shard(request)
+        )
+        with shards.using(alias):
+            return rendered(
+                super().changeform_view(request, object_id, form_url, extra_context)
+            )
+
+    def delete_view(
+        self,
+        request: HttpRequest,
+        object_id: str,
+        extra_context: dict[str, typing.Any] | None = None,
+    ) -> HttpResponse:
+        with shards.using(self.object_shard(object_id)):
+            return rendered(super().delete_view(request, object_id, extra_context))
 
 
 class QuestionInline(admin.StackedInline[Question, Game]):
@@ -11,24 +153,100 @@ class QuestionInline(admin.StackedInline[Question, Game]):
 
 
 @admin.register(Game)
-class GameAdmin(admin.ModelAdmin[Game]):
+class GameAdmin(ShardedAdmin[Game]):
+    show_full_result_count = False
     list_display = ["id", "slug", "created_at"]
     search_fields = ["slug", "id"]
     inlines = [QuestionInline]
-    filter_horizontal = [
-        "users",
-    ]
+    # a select of every user does not scale, see members_view
+    exclude = ["users"]
+    readonly_fields = ["members"]
+
+    @admin.display(description="Players")
+    def members(self, obj: Game | None) -> str:
+        if obj is None or obj.pk is None:
+            return "Save the game to add players"
+        url = reverse("admin:forcedfun_game_members", args=[obj.pk])
+        return format_html('{} <a href="{}">add or remove</a>', obj.users.count(), url)
+
+    def members_view(self, request: HttpRequest, pk: int) -> HttpResponse:
+        with shards.using(self.object_shard(str(pk))):
+            return rendered(self.members_form_view(request, pk))
+
+    def members_form_view(self, request: HttpRequest, pk: int) -> HttpResponse:
+        game = get_object_or_404(Game, pk=pk)
+        if not self.has_change_permission(request, game):
+            raise PermissionDenied
+        form = MembersForm(request.POST or None, admin_site=self.admin_site)
+        if request.method == "POST" and form.is_valid():
+            user_ids = form.cleaned_data["user_ids"]
+            with shards.atomic():
+                if form.cleaned_data["action"] == "add":
+                    n = utils.add_members(game, user_ids)
+                    message = f"Added {n} players to {game.slug}"
+                else:
+                    n = utils.remove_members(game, user_ids)
+                    message = f"Removed {n} players from {game.slug}"
+            self.message_user(request, message, messages.SUCCESS)
+            return HttpResponseRedirect(request.path)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": f"Players of {game.slug}",
+            "opts": self.opts,
+            "original": game,
+            "form": form,
+            "media": self.media + form.media,
+            "n_members": game.users.count(),
+        }
+        return TemplateResponse(request, "admin/forcedfun/game/members.html", context)
+
+    # questions and selections do not cascade, see forcedfun.purge
+    def delete_model(self, request: HttpRequest, obj: Game) -> None:
+        queue_purge(self, request, "game", [obj.pk], shard=obj._state.db or "")
+
+    def delete_queryset(self, request: HttpRequest, queryset: QuerySet[Game]) -> None:
+        ids = list(queryset.values_list("id", flat=True))
+        queue_purge(self, request, "game", ids, shard=queryset.db)
+
+    def get_urls(self) -> list[URLPattern]:
+        urls = [
+            path(
+                "<int:pk>/members/",
+                self.admin_site.admin_view(self.members_view),
+                name="forcedfun_game_members",
+            )
+        ]
+        return urls + super().get_urls()
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class UserAdmin(auth_admin.UserAdmin[User]):
+    show_full_result_count = False
+
+    # their selections and questions do not cascade, see forcedfun.purge
+    def delete_model(self, request: HttpRequest, obj: User) -> None:
+        queue_purge(self, request, "user", [obj.pk])
+
+    def delete_queryset(self, request: HttpRequest, queryset: QuerySet[User]) -> None:
+        queue_purge(self, request, "user", list(queryset.values_list("id", flat=True)))
 
 
 @admin.register(Selection)
-class SelectionAdmin(admin.ModelAdmin[Selection]):
+class SelectionAdmin(ShardedAdmin[Selection]):
+    show_full_result_count = False
     list_display = ["id", "option_text", "option_idx", "question", "user", "points"]
+    readonly_fields = ["option_text"]
     search_fields = ["user__id", "question__id"]
     autocomplete_fields = ["user", "question"]
 
 
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin[Question]):
+class QuestionAdmin(ShardedAdmin[Question]):
+    show_full_result_count = False
     list_display = [
         "id",
         "respondent",
@@ -38,5 +256,192 @@ class QuestionAdmin(admin.ModelAdmin[Question]):
         "answer_idx",
         "answer_text",
     ]
+    list_filter = [("scored_at", admin.EmptyFieldListFilter)]
+    readonly_fields = ["answer_text"]
     autocomplete_fields = ["respondent", "game"]
-    search_fields = ["id", "answer_text"]
+    search_fields = ["id"]
+    actions = ["score_questions"]
+
+    @admin.action(description="Score selected questions", permissions=["change"])
+    def score_questions(
+        self, request: HttpRequest, queryset: QuerySet[Question]
+    ) -> None:
+        with shards.atomic():
+            # a player's answer scoring one at the same time waits for the
+            # lock, then finds it scored
+            question_ids = utils.lock_unscored(queryset.values_list("pk", flat=True))
+            questions = list(
+                Question.objects.filter(pk__in=question_ids).order_by(
+                    "game_id", "points", "id"
+                )
+            )
+            scored = utils.score_questions(questions)
+            scored_questions = [q for q in questions if q.pk in scored]
+            answers.record([], scored=scored_questions)
+            outbox.emit([], scored=scored_questions)
+        self.message_user(request, f"Scored {len(scored)} questions", messages.SUCCESS)
+        n_skipped = queryset.count() - len(scored)
+        if n_skipped:
+            self.message_user(
+                request,
+                f"Skipped {n_skipped} questions that are scored already or miss "
+                "the respondent's or any other selection",
+                messages.WARNING,
+            )
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin[RequestProfile]):
+    show_full_result_count = False
+    list_display = [
+        "id",
+        "created_at",
+        "path",
+        "url_name",
+        "user",
+        "duration_ms",
+        "sql_ms",
+        "n_queries",
+        "download",
+    ]
+    list_filter = ["url_name"]
+    search_fields = ["path", "url_name"]
+    list_select_related = ["user"]
+    readonly_fields = [
+        "user",
+        "path",
+        "url_name",
+        "duration_ms",
+        "sql_ms",
+        "n_queries",
+        "file",
+    ]
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
+
+    @admin.display(description="Speedscope")
+    def download(self, obj: RequestProfile) -> str:
+        url = reverse("admin:forcedfun_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">download</a>', url)
+
+    def download_view(self, request: HttpRequest, pk: int) -> FileResponse:
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        return FileResponse(
+            profile.file.open("rb"),
+            as_attachment=True,
+            filename=profile.file.name.split("/")[-1],
+        )
+
+    def get_urls(self) -> list[URLPattern]:
+        urls = [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="forcedfun_requestprofile_download",
+            )
+        ]
+        return urls + super().get_urls()
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin[SlowQuery]):
+    show_full_result_count = False
+    list_display = ["id", "created_at", "duration_ms", "url_name", "call_site"]
+    list_filter = ["url_name"]
+    search_fields = ["fingerprint", "call_site"]
+    ordering = ["-duration_ms"]
+    readonly_fields = [
+        "fingerprint",
+        "sql",
+        "duration_ms",
+        "path",
+        "url_name",
+        "call_site",
+        "explain",
+    ]
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ShardedAdmin[OutboxEvent]):
+    show_full_result_count = False
+    list_display = ["id", "created_at", "kind", "delivered_at", "attempts"]
+    list_filter = ["kind", ("delivered_at", admin.EmptyFieldListFilter)]
+    ordering = ["-id"]
+    readonly_fields = ["kind", "payload", "delivered_at", "attempts", "last_error"]
+    actions = ["retry"]
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
+
+    @admin.action(description="Deliver selected events again", permissions=["change"])
+    def retry(self, request: HttpRequest, queryset: QuerySet[OutboxEvent]) -> None:
+        # the relay skips events past OUTBOX_MAX_ATTEMPTS until they are reset
+        n = queryset.filter(delivered_at__isnull=True).update(attempts=0, last_error="")
+        self.message_user(request, f"{n} events will be delivered again")
+
+
+def html_table(
+    header: typing.Sequence[typing.Any],
+    rows: typing.Iterable[typing.Sequence[typing.Any]],
+) -> SafeString:
+    def cells(tag: str, values: typing.Sequence[typing.Any]) -> SafeString:
+        return format_html_join("", f"<{tag}>{{}}</{tag}>", ((v,) for v in values))
+
+    return format_html(
+        "<table><thead><tr>{}</tr></thead><tbody>{}</tbody></table>",
+        cells("th", header),
+        format_html_join(
+            "",
+            "<tr>{}</tr>",
+            ((cells("td", ["-" if v is None else v for v in row]),) for row in rows),
+        ),
+    )
+
+
+@admin.register(AnalyticsReport)
+class AnalyticsReportAdmin(admin.ModelAdmin[AnalyticsReport]):
+    show_full_result_count = False
+    list_display = ["id", "created_at", "n_users", "n_games"]
+    fields = ["created_at", "users", "games"]
+    readonly_fields = ["created_at", "users", "games"]
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
+
+    @admin.display(description="Players")
+    def n_users(self, obj: AnalyticsReport) -> int:
+        return len(obj.report["users"])
+
+    @admin.display(description="Games")
+    def n_games(self, obj: AnalyticsReport) -> int:
+        return len(obj.report["games"])
+
+    @admin.display(description="Players")
+    def users(self, obj: AnalyticsReport) -> SafeString:
+        fields = ["user", "guesses", "accuracy", "asked", "majority_rate"]
+        return html_table(
+            fields, ([user[f] for f in fields] for user in obj.report["users"])
+        )
+
+    @admin.display(description="Games")
+    def games(self, obj: AnalyticsReport) -> SafeString:
+        fields = ["game", "questions", "guesses", "difficulty"]
+        tables = []
+        for game in obj.report["games"]:
+            users = game["agreement"]["users"]
+            matrix = game["agreement"]["matrix"]
+            tables.append(
+                format_html(
+                    "<h3>{}</h3>{}<p>Agreement</p>{}",
+                    game["game"],
+                    html_table(fields, [[game[f] for f in fields]]),
+                    html_table(
+                        ["", *users], ([u, *row] for u, row in zip(users, matrix))
+                    ),
+                )
+            )
+        return format_html_join("", "{}", ((table,) for table in tables))
@@ -0,0 +1,269 @@
+import csv
+import typing
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db.models import Model
+from django.db.models import QuerySet
+
+from . import scoring
+from . import shards
+from .models import Game
+from .models import Question
+from .models import Selection
+
+# numpy is optional, uv sync --group analytics, and only imported by the
+# functions that need it
+if typing.TYPE_CHECKING:
+    import numpy as np
+    import numpy.typing as npt
+
+    Column = npt.NDArray[np.int64]
+
+Report = dict[str, typing.Any]
+
+
+def iter_chunks(
+    queryset: QuerySet[typing.Any],
+    fields: typing.Sequence[str],
+    *,
+    chunk_size: int,
+) -> typing.Iterator[list[tuple[int, ...]]]:
+    # keyset chunks keep memory flat and every query on the primary key
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", *fields)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def load_columns(
+    queryset: QuerySet[typing.Any],
+    fields: typing.Sequence[str],
+    *,
+    chunk_size: int,
+) -> dict[str, "Column"]:
+    """
+    ``id`` and ``fields`` of every row as int64 columns, ordered by id.
+    """
+    import numpy as np
+
+    names = ["id", *fields]
+    chunks = [
+        np.array(rows, dtype=np.int64)
+        for rows in iter_chunks(queryset, fields, chunk_size=chunk_size)
+    ]
+    data = np.concatenate(chunks) if chunks else np.empty((0, len(names)), np.int64)
+    return {name: data[:, i] for i, name in enumerate(names)}
+
+
+def load_sharded_columns(
+    queryset: QuerySet[typing.Any],
+    fields: typing.Sequence[str],
+    *,
+    chunk_size: int,
+) -> dict[str, "Column"]:
+    """
+    load_columns of ``queryset`` on every shard, ordered by id. The rows of
+    a shard keep their ids when they move, so the shards' ids interleave.
+    """
+    import numpy as np
+
+    columns = []
+    for alias in shards.names():
+        with shards.using(alias):
+            columns.append(load_columns(queryset, fields, chunk_size=chunk_size))
+    order = np.argsort(np.concatenate([c["id"] for c in columns]), kind="stable")
+    return {
+        name: np.concatenate([c[name] for c in columns])[order] for name in columns[0]
+    }
+
+
+def ratio(
+    numerator: "npt.NDArray[typing.Any]", denominator: "npt.NDArray[typing.Any]"
+) -> list[float | None]:
+    return [
+        round(float(n) / float(d), 4) if d else None
+        for n, d in zip(numerator, denominator)
+    ]
+
+
+def names(model: type[Model], field: str, ids: "Column") -> list[str]:
+    by_id: dict[int, str] = {}
+    # games are on their own shard, users are on the first one too
+    sharded = model._meta.db_table in shards.SHARDED_TABLES
+    for alias in shards.names() if sharded else shards.names()[:1]:
+        by_id |= dict(
+            model._default_manager.using(alias)
+            .filter(pk__in=ids.tolist())
+            .values_list("pk", field)
+        )
+    return [by_id[pk] for pk in ids.tolist()]
+
+
+def report(games: QuerySet[Game], *, chunk_size: int = 10000) -> Report:
+    """
+    Per player, the share of right guesses and how often they had the
+    majority on their side as the respondent, per game, how hard its
+    questions were to guess and how often every two players picked the same
+    option. The majority threshold is the active scoring rule's. ``games``
+    is filtered on every shard.
+    """
+    import numpy as np
+
+    questions = load_sharded_columns(
+        Question.objects.filter(game__in=games),
+        ["game_id", "respondent_id"],
+        chunk_size=chunk_size,
+    )
+    selections = load_sharded_columns(
+        Selection.objects.filter(question__game__in=games),
+        ["user_id", "question_id", "option_idx"],
+        chunk_size=chunk_size,
+    )
+    n_questions = len(questions["id"])
+    # question ids are sorted, so every selection finds its question by bisection
+    question_idx = np.searchsorted(questions["id"], selections["question_id"])
+    option_idx = selections["option_idx"]
+    respondent_ids = questions["respondent_id"]
+
+    is_respondent = selections["user_id"] == respondent_ids[question_idx]
+    respondent_option_idx = np.full(n_questions, -1, dtype=np.int64)
+    respondent_option_idx[question_idx[is_respondent]] = option_idx[is_respondent]
+    answer = respondent_option_idx[question_idx]
+    is_guess = ~is_respondent & (answer >= 0)
+    is_correct = is_guess & (option_idx == answer)
+
+    user_ids = np.unique(np.concatenate([selections["user_id"], respondent_ids]))
+    n_users = len(user_ids)
+    user_idx = np.searchsorted(user_ids, selections["user_id"])
+    respondent_idx = np.searchsorted(user_ids, respondent_ids)
+
+    guesses = np.bincount(user_idx[is_guess], minlength=n_users)
+    correct = np.bincount(user_idx[is_correct], minlength=n_users)
+    question_guesses = np.bincount(question_idx[is_guess], minlength=n_questions)
+    question_correct = np.bincount(question_idx[is_correct], minlength=n_questions)
+    is_answered = question_guesses > 0
+    has_majority = is_answered & (
+        question_correct >= scoring.get_rule().majority * question_guesses
+    )
+    asked = np.bincount(respondent_idx[is_answered], minlength=n_users)
+    majorities = np.bincount(respondent_idx[has_majority], minlength=n_users)
+
+    usernames = names(User, "username", user_ids)
+    users = [
+        {
+            "user": username,
+            "guesses": int(n_guesses),
+            "accuracy": accuracy,
+            "asked": int(n_asked),
+            "majority_rate": majority_rate,
+        }
+        for username, n_guesses, accuracy, n_asked, majority_rate in zip(
+            usernames,
+            guesses,
+            ratio(correct, guesses),
+            asked,
+            ratio(majorities, asked),
+        )
+    ]
+
+    game_ids, game_idx = np.unique(questions["game_id"], return_inverse=True)
+    selection_game_idx = game_idx[question_idx]
+    game_guesses = np.bincount(selection_game_idx[is_guess], minlength=len(game_ids))
+    game_correct = np.bincount(selection_game_idx[is_correct], minlength=len(game_ids))
+    # the share of wrong guesses
+    difficulty = ratio(game_guesses - game_correct, game_guesses)
+    game_questions = np.bincount(game_idx, minlength=len(game_ids))
+    # sorted by game once, each game's selections are a slice
+    by_game = np.argsort(selection_game_idx, kind="stable")
+    bounds = np.searchsorted(selection_game_idx[by_game], np.arange(len(game_ids) + 1))
+    slugs = names(Game, "slug", game_ids)
+    report_games = []
+    for i, slug in enumerate(slugs):
+        in_game = by_game[bounds[i] : bounds[i + 1]]
+        game_user_idx, local_user_idx = np.unique(
+            user_idx[in_game], return_inverse=True
+        )
+        _, local_question_idx = np.unique(question_idx[in_game], return_inverse=True)
+        report_games.append(
+            {
+                "game": slug,
+                "questions": int(game_questions[i]),
+                "guesses": int(game_guesses[i]),
+                "difficulty": difficulty[i],
+                "agreement": {
+                    "users": [usernames[idx] for idx in game_user_idx.tolist()],
+                    "matrix": agreement(
+                        local_question_idx, local_user_idx, option_idx[in_game]
+                    ),
+                },
+            }
+        )
+    return {"users": users, "games": report_games}
+
+
+def agreement(
+    question_idx: "Column", user_idx: "Column", option_idx: "Column"
+) -> list[list[float | None]]:
+    """
+    Share of the questions answered by both players where they picked the
+    same option, for every pair of players.
+    """
+    import numpy as np
+
+    n_questions = int(question_idx.max(initial=-1)) + 1
+    n_users = int(user_idx.max(initial=-1)) + 1
+    options = np.full((n_questions, n_users), -1, dtype=np.int64)
+    options[question_idx, user_idx] = option_idx
+    answered = (options >= 0).astype(np.float64)
+    both = answered.T @ answered
+    same = np.zeros_like(both)
+    for option in np.unique(option_idx):
+        picked = (options == option).astype(np.float64)
+        same += picked.T @ picked
+    return [ratio(same_row, both_row) for same_row, both_row in zip(same, both)]
+
+
+def write_csv(report: Report, output: Path) -> list[Path]:
+    """
+    users.csv, games.csv and one agreement matrix per game in ``output``.
+    """
+    output.mkdir(parents=True, exist_ok=True)
+    paths = []
+
+    def write(name: str, rows: typing.Iterable[typing.Sequence[typing.Any]]) -> None:
+        path = output / name
+        with path.open("w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        paths.append(path)
+
+    user_fields = ["user", "guesses", "accuracy", "asked", "majority_rate"]
+    write(
+        "users.csv",
+        [user_fields, *([user[f] for f in user_fields] for user in report["users"])],
+    )
+    game_fields = ["game", "questions", "guesses", "difficulty"]
+    write(
+        "games.csv",
+        [game_fields, *([game[f] for f in game_fields] for game in report["games"])],
+    )
+    for game in report["games"]:
+        users = game["agreement"]["users"]
+        write(
+            f"agreement-{game['game']}.csv",
+            [
+                ["", *users],
+                *(
+                    [user, *row]
+                    for user, row in zip(users, game["agreement"]["matrix"])
+                ),
+            ],
+        )
+    return paths
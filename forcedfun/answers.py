@@ -0,0 +1,215 @@
+import collections
+import dataclasses
+import typing
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import shards
+from . import tracing
+from .models import AnswerRow
+from .models import Question
+from .models import Selection
+
+ROW_FIELDS = ["respondent_id", "user_ids", "picks", "answer", "updated_at"]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Cell:
+    option_idx: int | None
+    is_respondent: bool
+    # None unless the question is scored and this is a player's guess
+    correct: bool | None
+    # the player answered, also when the pick is not shown
+    answered: bool
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class GridRow:
+    question_id: int
+    cells: list[Cell]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class PlayerAccuracy:
+    user_id: int
+    guesses: int
+    correct: int
+
+    @property
+    def accuracy(self) -> float | None:
+        return self.correct / self.guesses if self.guesses else None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Grid:
+    user_ids: list[int]
+    rows: list[GridRow]
+    accuracy: list[PlayerAccuracy]
+
+
+def build(question_ids: typing.Iterable[int]) -> list[AnswerRow]:
+    """
+    The rows of ``question_ids`` from the Selection table, unsaved, with the
+    players in the order they picked.
+    """
+    question_ids = list(question_ids)
+    picks: dict[int, dict[int, int]] = collections.defaultdict(dict)
+    for question_id, user_id, option_idx in (
+        Selection.objects.filter(question__in=question_ids)
+        .order_by("id")
+        .values_list("question_id", "user_id", "option_idx")
+    ):
+        picks[question_id][user_id] = option_idx + 1
+    return [
+        AnswerRow(
+            question_id=question_id,
+            game_id=game_id,
+            respondent_id=respondent_id,
+            user_ids=list(picks[question_id]),
+            picks=bytes(picks[question_id].values()),
+            answer=0 if scored_at is None or answer_idx is None else answer_idx + 1,
+        )
+        for question_id, game_id, respondent_id, answer_idx, scored_at in (
+            Question.objects.filter(pk__in=question_ids)
+            .order_by("id")
+            .values_list("id", "game_id", "respondent_id", "answer_idx", "scored_at")
+        )
+    ]
+
+
+def save(rows: typing.Sequence[AnswerRow]) -> None:
+    # one upsert, so two requests building the same rows at once do not
+    # conflict
+    AnswerRow.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["question"],
+        update_fields=ROW_FIELDS,
+        batch_size=1000,
+    )
+
+
+@tracing.traced
+def rebuild(game_id: int) -> list[AnswerRow]:
+    """
+    Builds the rows of every question of ``game_id`` and saves them.
+    """
+    rows = build(Question.objects.filter(game_id=game_id).values_list("id", flat=True))
+    save(rows)
+    return rows
+
+
+@receiver(post_save, sender=Question)
+def create_row(
+    sender: type[Question], instance: Question, created: bool, **kwargs: typing.Any
+) -> None:
+    # a new question has nothing to build from, questions from before the
+    # rows get theirs on their next pick or from the rebuild_answer_matrix
+    # command
+    if created:
+        AnswerRow.objects.create(
+            question=instance,
+            game_id=instance.game_id,
+            respondent_id=instance.respondent_id,
+        )
+
+
+def game_rows(game_id: int) -> list[AnswerRow]:
+    return list(AnswerRow.objects.filter(game_id=game_id))
+
+
+def set_pick(row: AnswerRow, user_id: int, option_idx: int) -> None:
+    picks = bytearray(row.picks)
+    if user_id in row.user_ids:
+        picks[row.user_ids.index(user_id)] = option_idx + 1
+    else:
+        # a new player adds a byte to this question's row only
+        row.user_ids.append(user_id)
+        picks.append(option_idx + 1)
+    row.picks = bytes(picks)
+
+
+@tracing.traced
+def record(
+    selections: typing.Sequence[Selection], scored: typing.Sequence[Question] = ()
+) -> None:
+    """
+    Adds ``selections`` and the answers of the ``scored`` questions to the
+    rows of their questions, with one query locking those rows and one
+    saving them, so picks of different questions do not wait on each other.
+    Call it once they are saved: a question without a row gets one built
+    from the Selection table instead.
+    """
+    question_ids = {selection.question_id for selection in selections}
+    question_ids |= {question.pk for question in scored}
+    if not question_ids:
+        return
+    # no savepoint: a failure here fails the caller's transaction anyway
+    with shards.atomic(savepoint=False):
+        rows = {
+            row.pk: row
+            for row in AnswerRow.objects.select_for_update()
+            .filter(question__in=question_ids)
+            .order_by("question")
+        }
+        missing = question_ids - rows.keys()
+        if missing:
+            save(build(sorted(missing)))
+        for selection in selections:
+            if row := rows.get(selection.question_id):
+                set_pick(row, selection.user_id, selection.option_idx)
+        for question in scored:
+            if (row := rows.get(question.pk)) and question.answer_idx is not None:
+                row.answer = question.answer_idx + 1
+        if rows:
+            now = timezone.now()
+            for row in rows.values():
+                row.updated_at = now
+            AnswerRow.objects.bulk_update(list(rows.values()), ROW_FIELDS)
+
+
+def read(
+    rows: typing.Iterable[AnswerRow],
+    member_ids: typing.Iterable[int],
+    viewer_id: int,
+) -> Grid:
+    """
+    The picks of ``rows`` by question and player id, without the questions
+    nobody answered yet, and the accuracy of each player's guesses of scored
+    questions. The picks of a question that is not scored are shown only
+    to a viewer who answered it, the others see who answered.
+    """
+    rows = sorted(rows, key=lambda row: row.pk)
+    user_ids = sorted(
+        {*member_ids, *(user_id for row in rows for user_id in row.user_ids)}
+    )
+    guesses = [0] * len(user_ids)
+    correct = [0] * len(user_ids)
+    grid_rows = []
+    for row in rows:
+        if not row.user_ids:
+            continue
+        picks = dict(zip(row.user_ids, bytes(row.picks)))
+        shown = bool(row.answer) or viewer_id in picks
+        cells = []
+        for k, user_id in enumerate(user_ids):
+            pick = picks.get(user_id, 0)
+            is_respondent = user_id == row.respondent_id
+            is_correct = None
+            if row.answer and pick and not is_respondent:
+                is_correct = pick == row.answer
+                guesses[k] += 1
+                correct[k] += is_correct
+            option_idx = pick - 1 if pick and shown else None
+            cells.append(Cell(option_idx, is_respondent, is_correct, bool(pick)))
+        grid_rows.append(GridRow(row.pk, cells))
+    return Grid(
+        user_ids=user_ids,
+        rows=grid_rows,
+        accuracy=[
+            PlayerAccuracy(user_id, guesses[k], correct[k])
+            for k, user_id in enumerate(user_ids)
+        ],
+    )
@@ -0,0 +1,100 @@
+import dataclasses
+import typing
+
+from django.apps.registry import Apps
+from django.db import models
+from django.utils import timezone
+
+
+@dataclasses.dataclass
+class Result:
+    checked: int = 0
+    # the index did not point at the stored text, which is one of the options
+    fixed: list[int] = dataclasses.field(default_factory=list)
+    # the stored text is none of the options, the index is kept
+    unresolved: list[int] = dataclasses.field(default_factory=list)
+
+
+def iter_batches(
+    queryset: models.QuerySet[typing.Any],
+    fields: typing.Sequence[str],
+    *,
+    batch_size: int,
+) -> typing.Iterator[list[tuple[typing.Any, ...]]]:
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", *fields)[:batch_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def backfill_idx(
+    queryset: models.QuerySet[typing.Any],
+    *,
+    idx_field: str,
+    text_field: str,
+    options_field: str,
+    batch_size: int,
+    fix: bool,
+) -> Result:
+    result = Result()
+    model = queryset.model
+    for rows in iter_batches(
+        queryset, [idx_field, text_field, options_field], batch_size=batch_size
+    ):
+        to_update = []
+        for pk, idx, text, options in rows:
+            result.checked += 1
+            if idx is not None and idx < len(options) and options[idx] == text:
+                continue
+            if text not in options:
+                result.unresolved.append(pk)
+                continue
+            result.fixed.append(pk)
+            to_update.append(
+                model(
+                    pk=pk,
+                    **{idx_field: options.index(text)},
+                    updated_at=timezone.now(),
+                )
+            )
+        if fix and to_update:
+            model._default_manager.bulk_update(to_update, [idx_field, "updated_at"])
+    return result
+
+
+def option_idx(
+    apps: Apps, *, batch_size: int = 1000, fix: bool = False
+) -> tuple[Result, Result]:
+    """
+    Checks that every Selection.option_idx and Question.answer_idx points at
+    the option_text and answer_text stored next to it, in keyset batches,
+    and with ``fix`` stores the index of the text where it does not.
+    ``apps`` holds the models from before the text columns were dropped,
+    the 0009_backfill_option_idx_sharded migration state.
+    """
+    Selection = apps.get_model("forcedfun", "Selection")
+    Question = apps.get_model("forcedfun", "Question")
+    selections = backfill_idx(
+        Selection._default_manager.all(),
+        idx_field="option_idx",
+        text_field="option_text",
+        options_field="question__options",
+        batch_size=batch_size,
+        fix=fix,
+    )
+    questions = backfill_idx(
+        Question._default_manager.exclude(answer_text=""),
+        idx_field="answer_idx",
+        text_field="answer_text",
+        options_field="options",
+        batch_size=batch_size,
+        fix=fix,
+    )
+    return selections, questions
@@ -0,0 +1,169 @@
+import dataclasses
+import statistics
+import time
+import tracemalloc
+import typing
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import readmodels
+from . import utils
+from .loaders import Loader
+from .models import Game
+from .models import Question
+from .models import Selection
+
+# setup(size) builds the fixture and returns the function that is timed
+Setup = typing.Callable[[int], typing.Callable[[], object]]
+
+
+@dataclasses.dataclass
+class Benchmark:
+    name: str
+    setup: Setup
+    db: bool
+
+
+@dataclasses.dataclass
+class Result:
+    name: str
+    size: int
+    # best and mean wall time of one call
+    seconds: float
+    mean_seconds: float
+    # peak traced memory of one call
+    peak_bytes: int
+
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def register(name: str, *, db: bool = False) -> typing.Callable[[Setup], Setup]:
+    def decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name] = Benchmark(name=name, setup=setup, db=db)
+        return setup
+
+    return decorator
+
+
+@register("score_selections")
+def score_selections_benchmark(size: int) -> typing.Callable[[], object]:
+    selections = [Selection(option_idx=i % 2) for i in range(size)]
+    respondent_selection = Selection(option_idx=0)
+    return lambda: utils.score_selections(
+        selections=selections, respondent_selection=respondent_selection, points=1
+    )
+
+
+@register("option_percentages")
+def option_percentages_benchmark(size: int) -> typing.Callable[[], object]:
+    option_idx_list = [i % 2 for i in range(size)]
+    return lambda: utils.option_percentages(option_idx_list, n_options=2)
+
+
+def question_with_selections(size: int) -> Question:
+    users = User.objects.bulk_create(
+        User(username=f"benchmark-{i}") for i in range(size + 1)
+    )
+    game = Game.objects.create(slug="benchmark")
+    game.users.add(*users)
+    question = Question.objects.create(
+        game=game, respondent=users[0], options=["a", "b"], points=1
+    )
+    Selection.objects.bulk_create(
+        Selection(user=user, question=question, option_idx=i % 2)
+        for i, user in enumerate(users)
+    )
+    return question
+
+
+@register("score_selections_db", db=True)
+def score_selections_db_benchmark(size: int) -> typing.Callable[[], object]:
+    # what the batch answer API and the admin action run to score questions
+    question = question_with_selections(size)
+    return lambda: utils.score_questions([question])
+
+
+@register("option_percentages_db", db=True)
+def option_percentages_db_benchmark(size: int) -> typing.Callable[[], object]:
+    # the results table of question_detail_view, with a new request's loader
+    pk = question_with_selections(size).pk
+
+    def run() -> object:
+        loader = Loader()
+        question = loader.question_or_404(pk)
+        players = readmodels.player_selections(
+            question, loader.question_selections(question)
+        )
+        option_idx_list = [p.option_idx for p in players if p.option_idx is not None]
+        return utils.option_percentages(
+            option_idx_list, n_options=len(question.options)
+        )
+
+    return run
+
+
+def measure(
+    name: str, size: int, func: typing.Callable[[], object], *, repeat: int
+) -> Result:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Result(
+        name=name,
+        size=size,
+        seconds=min(timings),
+        mean_seconds=statistics.mean(timings),
+        peak_bytes=peak_bytes,
+    )
+
+
+def run(
+    *,
+    names: typing.Sequence[str],
+    sizes: typing.Sequence[int],
+    db_max_size: int,
+    repeat: int,
+) -> list[Result]:
+    results = []
+    for name in names:
+        benchmark = BENCHMARKS[name]
+        for size in sizes:
+            if not benchmark.db:
+                func = benchmark.setup(size)
+                results.append(measure(name, size, func, repeat=repeat))
+            elif size <= db_max_size:
+                # fixtures are rolled back so a run leaves no rows behind
+                with transaction.atomic():
+                    func = benchmark.setup(size)
+                    results.append(measure(name, size, func, repeat=repeat))
+                    transaction.set_rollback(True)
+    return results
+
+
+def regressions(
+    results: typing.Sequence[Result],
+    baseline: typing.Sequence[Result],
+    *,
+    tolerance: float,
+) -> list[tuple[Result, Result]]:
+    """
+    (result, baseline) pairs where the best time got slower than the
+    baseline by more than ``tolerance``, e.g. 0.2 for 20%.
+    """
+    previous = {(result.name, result.size): result for result in baseline}
+    slower = []
+    for result in results:
+        before = previous.get((result.name, result.size))
+        if before and result.seconds > before.seconds * (1 + tolerance):
+            slower.append((result, before))
+    return slower
@@ -3,3 +3,11 @@ class Http302(Exception):
 
     def __init__(self, url: str) -> None:
         self.url = url
+
+
+class QueryInspectError(Exception):
+    pass
+
+
+class QueryInspectWarning(UserWarning):
+    pass
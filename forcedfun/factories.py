@@ -2,9 +2,12 @@ import typing
 from datetime import datetime
 
 from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
 
+from . import shards
 from .models import Game
 from .models import Question
+from .models import RequestProfile
 from .models import Selection
 
 
@@ -21,15 +24,14 @@ def user_factory(
 def selection_factory(
     user: User | None = None,
     question: Question | None = None,
-    option_text: str = "optiondefault",
     option_idx: int = 0,
     points: int | None = None,
 ) -> Selection:
     user = user or user_factory()
+    shards.mirror_users([user.pk])
     return Selection.objects.create(
         user=user,
         question=question or question_factory(respondent=user),
-        option_text=option_text,
         option_idx=option_idx,
         points=points,
     )
@@ -37,6 +39,7 @@ def selection_factory(
 
 def game_factory(slug: str = "gamedefault", users: typing.Sequence[User] = ()) -> Game:
     game = Game.objects.create(slug=slug)
+    shards.mirror_users([user.pk for user in users])
     game.users.add(*users)
     return game
 
@@ -47,10 +50,10 @@ def question_factory(
     options: typing.Sequence[str] = ("option1", "option2"),
     points: int = 1,
     answer_idx: int | None = None,
-    answer_text: str = "",
     scored_at: datetime | None = None,
 ) -> Question:
     respondent = respondent or user_factory()
+    shards.mirror_users([respondent.pk])
     return Question.objects.create(
         game=game or game_factory(users=(respondent,)),
         respondent=respondent,
@@ -58,5 +61,14 @@ def question_factory(
         points=points,
         scored_at=scored_at,
         answer_idx=answer_idx,
-        answer_text=answer_text,
     )
+
+
+def request_profile_factory(
+    path: str = "/", url_name: str = "index", content: bytes = b"{}"
+) -> RequestProfile:
+    profile = RequestProfile(
+        path=path, url_name=url_name, duration_ms=1, sql_ms=1, n_queries=1
+    )
+    profile.file.save("index.speedscope.json", ContentFile(content))
+    return profile
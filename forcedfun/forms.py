@@ -1,12 +1,29 @@
+import typing
+
 from django import forms
+from django.contrib.admin import AdminSite
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
+from forcedfun import invites
 from forcedfun.models import Game
 
 
 class SelectionForm(forms.Form):
-    option_idx = forms.IntegerField(widget=forms.HiddenInput())
-    option_text = forms.CharField(widget=forms.HiddenInput())
+    option_idx = forms.IntegerField(widget=forms.HiddenInput(), min_value=0)
+
+    def __init__(
+        self, *args: typing.Any, options: typing.Sequence[str], **kwargs: typing.Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.options = options
+
+    def clean_option_idx(self) -> int:
+        option_idx: int = self.cleaned_data["option_idx"]
+        if option_idx >= len(self.options):
+            raise ValidationError("Invalid option")
+        return option_idx
 
 
 class GameForm(forms.Form):
@@ -14,6 +31,51 @@ class GameForm(forms.Form):
 
     def clean_slug(self) -> str:
         slug: str = self.cleaned_data["slug"]
-        if not Game.objects.filter(slug=slug).exists():
+        game_id = invites.game_id_for_slug(slug)
+        if game_id is None:
             raise ValidationError("Game does not exist")
+        self.cleaned_data["game_id"] = game_id
         return slug
+
+
+class MembersForm(forms.Form):
+    action = forms.ChoiceField(choices=[("add", "Add"), ("remove", "Remove")])
+    users = forms.ModelMultipleChoiceField(queryset=User.objects.all(), required=False)
+    usernames = forms.CharField(
+        widget=forms.Textarea,
+        required=False,
+        help_text="Usernames separated by commas or new lines",
+    )
+
+    def __init__(
+        self, *args: typing.Any, admin_site: AdminSite, **kwargs: typing.Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        # searches users as you type instead of rendering every user
+        field = typing.cast(
+            "forms.ModelMultipleChoiceField[User]", self.fields["users"]
+        )
+        field.widget = AutocompleteSelectMultiple(
+            Game._meta.get_field("users"), admin_site
+        )
+        field.widget.choices = field.choices
+
+    def clean_usernames(self) -> set[str]:
+        value: str = self.cleaned_data["usernames"]
+        # usernames have no whitespace
+        return set(value.replace(",", " ").split())
+
+    def clean(self) -> dict[str, typing.Any]:
+        cleaned_data = super().clean() or {}
+        usernames = cleaned_data.get("usernames", set())
+        user_ids = dict(
+            User.objects.filter(username__in=usernames).values_list("username", "id")
+        )
+        unknown = sorted(usernames - set(user_ids))
+        if unknown:
+            raise ValidationError(f"Unknown users: {', '.join(unknown[:10])}")
+        cleaned_data["user_ids"] = {
+            *user_ids.values(),
+            *(user.pk for user in cleaned_data.get("users", [])),
+        }
+        return cleaned_data
@@ -0,0 +1,41 @@
+# gunicorn -c python:forcedfun.gunicorn_conf forcedfun.wsgi
+import os
+import typing
+
+from forcedfun.settings.utils import getbool
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("GUNICORN_CONCURRENCY", "3"))
+# "sync" or "gthread"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", "4")) if worker_class == "gthread" else 1
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# import Django and the project once in the master, workers share the
+# memory copy on write
+preload_app = getbool("GUNICORN_PRELOAD", True)
+
+
+def when_ready(server: typing.Any) -> None:
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+
+    from forcedfun import warmup
+
+    timings = warmup.warm_up(templates=True, database=False)
+    # a connection opened here would be shared by every forked worker
+    connections.close_all()
+    server.log.info("Warmed up the master in %s ms", timings)
+
+
+def post_worker_init(worker: typing.Any) -> None:
+    # runs before the worker accepts connections
+    from forcedfun import warmup
+
+    try:
+        timings = warmup.warm_up(templates=not worker.cfg.preload_app, database=True)
+    except Exception:
+        # an unreachable database should fail requests, not worker boots
+        worker.log.exception("Warm-up failed")
+        return
+    worker.log.info("Warmed up worker %s in %s ms", worker.pid, timings)
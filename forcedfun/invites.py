@@ -0,0 +1,102 @@
+import typing
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import shards
+from . import tracing
+from .models import Game
+
+SALT = "forcedfun.invites"
+
+
+class Invite(typing.NamedTuple):
+    game_id: int
+    slug: str
+
+
+def make_code(game: Game) -> str:
+    """
+    A signed code with the game's id and slug, so joining through it needs
+    no lookup of the game. Not timestamped, a game has one code.
+    """
+    return signing.Signer(salt=SALT).sign_object([game.pk, game.slug])
+
+
+def read_code(code: str) -> Invite | None:
+    try:
+        game_id, slug = signing.Signer(salt=SALT).unsign_object(code)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return Invite(game_id=int(game_id), slug=str(slug))
+
+
+def slug_key(slug: str) -> str:
+    return f"game-id:{slug}"
+
+
+# cached for a slug no game has, ids start at 1
+MISSING = 0
+
+
+def game_id_for_slug(slug: str) -> int | None:
+    """
+    The id of the game with ``slug``, cached for GAME_ID_CACHE_SECONDS.
+    Unknown slugs are cached for the much shorter
+    GAME_ID_MISSING_CACHE_SECONDS: the cache is per process and only this
+    one learns that a game was created with the slug. A cached id of a game
+    deleted in another process is forgotten by the join that finds it gone.
+    """
+    game_id: int | None = cache.get(slug_key(slug))
+    if game_id is None:
+        game_id = Game.objects.filter(slug=slug).values_list("id", flat=True).first()
+        if game_id is None:
+            cache.set(
+                slug_key(slug),
+                MISSING,
+                timeout=settings.GAME_ID_MISSING_CACHE_SECONDS,
+            )
+        else:
+            cache.set(slug_key(slug), game_id, timeout=settings.GAME_ID_CACHE_SECONDS)
+    return game_id or None
+
+
+def forget_slug_id(slug: str) -> None:
+    cache.delete(slug_key(slug))
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def forget_slug(sender: type[Game], instance: Game, **kwargs: typing.Any) -> None:
+    # a renamed game also leaves the slug it was loaded with, a created one
+    # replaces the cached MISSING
+    cache.delete_many(
+        {slug_key(slug) for slug in (instance.slug, instance.loaded_slug) if slug}
+    )
+
+
+@tracing.traced
+def join(game_id: int, user_id: int) -> bool:
+    """
+    Adds the user to the game in one statement. The game is selected in it
+    rather than looked up first, and an existing membership is left alone.
+    Returns whether the user was added, False when they were a member or
+    the game does not exist.
+    """
+    shards.mirror_users([user_id])
+    connection = connections[shards.current()]
+    membership = Game.users.through._meta
+    quote = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {quote(membership.db_table)} (game_id, user_id) "
+        f"SELECT id, %s FROM {quote(Game._meta.db_table)} WHERE id = %s "
+        "ON CONFLICT DO NOTHING"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, game_id])
+        return bool(cursor.rowcount == 1)
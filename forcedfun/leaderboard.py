@@ -0,0 +1,154 @@
+import collections
+
+from django.db import connections
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from . import shards
+from . import tracing
+from .models import Leaderboard
+from .models import LeaderboardRow
+from .models import LeaderboardState
+from .models import LeaderboardTotal
+
+# the single LeaderboardState row, created by the 0013 migration or by the
+# first mark_stale or refresh_if_stale that finds it missing
+STATE_ID = 1
+
+GUESS = "q.scored_at IS NOT NULL AND s.user_id <> q.respondent_id"
+
+# the materialized view's query without Postgres syntax, to fill the plain
+# table other databases get instead, see the 0007_leaderboard migration
+SELECT_ROWS = f"""
+SELECT
+    s.user_id,
+    COALESCE(SUM(s.points), 0),
+    COUNT(DISTINCT q.game_id),
+    SUM(CASE WHEN {GUESS} THEN 1 ELSE 0 END),
+    CAST(SUM(CASE WHEN {GUESS} AND s.points > 0 THEN 1 ELSE 0 END) AS REAL)
+        / NULLIF(SUM(CASE WHEN {GUESS} THEN 1 ELSE 0 END), 0)
+FROM forcedfun_selection s
+JOIN forcedfun_question q ON q.id = s.question_id
+GROUP BY s.user_id
+"""
+
+
+def refresh(*, concurrently: bool = True) -> None:
+    """
+    Refreshes the leaderboard of every shard, and with several shards sums
+    them per player into LeaderboardTotal.
+    """
+    for alias in shards.names():
+        refresh_shard(alias, concurrently=concurrently)
+    if len(shards.names()) > 1:
+        sum_shards()
+
+
+def refresh_shard(alias: str, *, concurrently: bool = True) -> None:
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        with (
+            tracing.span("leaderboard.refresh", shard=alias),
+            transaction.atomic(using=alias),
+        ):
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM forcedfun_leaderboard")
+                cursor.execute(
+                    "INSERT INTO forcedfun_leaderboard "
+                    "(user_id, points, games, guesses, accuracy)" + SELECT_ROWS
+                )
+        return
+    # CONCURRENTLY keeps the old rows readable and writers unblocked while
+    # the view is rebuilt, at the cost of a slower refresh
+    sql = "REFRESH MATERIALIZED VIEW {}forcedfun_leaderboard".format(
+        "CONCURRENTLY " if concurrently else ""
+    )
+    with (
+        tracing.span("leaderboard.refresh", shard=alias),
+        connection.cursor() as cursor,
+    ):
+        cursor.execute(sql)
+
+
+@tracing.traced
+def sum_shards() -> None:
+    # a player's games are on several shards, the views only know their own
+    totals: dict[int, LeaderboardTotal] = {}
+    correct: dict[int, float] = collections.defaultdict(float)
+    for alias in shards.names():
+        rows = Leaderboard.objects.using(alias).values_list(
+            "user_id", "points", "games", "guesses", "accuracy"
+        )
+        for user_id, points, games, guesses, accuracy in rows.iterator(chunk_size=2000):
+            total = totals.setdefault(
+                user_id,
+                LeaderboardTotal(user_id=user_id, points=0, games=0, guesses=0),
+            )
+            total.points += points
+            total.games += games
+            total.guesses += guesses
+            correct[user_id] += (accuracy or 0) * guesses
+    for total in totals.values():
+        total.accuracy = (
+            correct[total.user_id] / total.guesses if total.guesses else None
+        )
+    # readers see the old totals until the new ones commit
+    with transaction.atomic():
+        LeaderboardTotal.objects.all().delete()
+        LeaderboardTotal.objects.bulk_create(totals.values(), batch_size=1000)
+
+
+def rows() -> QuerySet[LeaderboardRow]:
+    """
+    The leaderboard of every game, the first shard's view or, with several
+    shards, their sums.
+    """
+    if len(shards.names()) > 1:
+        return LeaderboardTotal.objects.all()
+    return Leaderboard.objects.all()
+
+
+def mark_stale() -> None:
+    now = timezone.now()
+    # only the first score after a refresh writes, the rest match no row
+    if not LeaderboardState.objects.filter(stale_since__isnull=True).update(
+        stale_since=now
+    ):
+        LeaderboardState.objects.get_or_create(
+            pk=STATE_ID, defaults={"stale_since": now}
+        )
+
+
+def schedule_refresh() -> None:
+    """
+    Marks the leaderboard stale once the transaction of the current shard
+    commits, for the refresh_leaderboard --if-stale job to refresh.
+    Whichever score is saved last, a refresh starts after it, and requests
+    never wait for one.
+    """
+    transaction.on_commit(mark_stale, using=shards.current())
+
+
+def refresh_if_stale(*, concurrently: bool = True) -> bool:
+    """
+    Refreshes the leaderboard if scores were saved since the last refresh.
+    The flag is cleared first, so scores saved during the refresh mark it
+    stale again, and of jobs running at once only one refreshes.
+    """
+    claimed = LeaderboardState.objects.filter(stale_since__isnull=False).update(
+        stale_since=None, refreshed_at=timezone.now()
+    )
+    if not claimed:
+        # a missing row is created claimed, nothing says the view is fresh
+        _, created = LeaderboardState.objects.get_or_create(
+            pk=STATE_ID, defaults={"refreshed_at": timezone.now()}
+        )
+        if not created:
+            return False
+    try:
+        refresh(concurrently=concurrently)
+    except Exception:
+        mark_stale()
+        raise
+    return True
@@ -0,0 +1,106 @@
+import typing
+
+from django.db.models import Model
+from django.http import Http404
+from django.http import HttpRequest
+
+from .models import Game
+from .models import Question
+from .models import Selection
+
+M = typing.TypeVar("M", bound=Model)
+
+
+class Loader:
+    """
+    Request scoped identity map. Rows are fetched at most once per request by
+    primary key, in batches, and the common relations of a question (its game,
+    respondent, the game's members and the question's selections) are
+    memoized so views, utils and templates share them.
+    """
+
+    def __init__(self) -> None:
+        self._identity_map: dict[tuple[type[Model], typing.Any], Model] = {}
+        self._game_user_ids: dict[int, frozenset[int]] = {}
+        self._question_selections: dict[int, list[Selection]] = {}
+
+    def prime(self, *instances: Model) -> None:
+        for instance in instances:
+            self._identity_map[(type(instance), instance.pk)] = instance
+
+    def load_many(
+        self, model: type[M], pks: typing.Iterable[typing.Any]
+    ) -> dict[typing.Any, M]:
+        pks = list(pks)
+        missing = {pk for pk in pks if (model, pk) not in self._identity_map}
+        if missing:
+            self.prime(*model._default_manager.filter(pk__in=missing))
+        found = {}
+        for pk in pks:
+            instance = self._identity_map.get((model, pk))
+            if instance is not None:
+                found[pk] = typing.cast(M, instance)
+        return found
+
+    def load(self, model: type[M], pk: typing.Any) -> M | None:
+        return self.load_many(model, [pk]).get(pk)
+
+    def get_or_404(self, model: type[M], pk: typing.Any) -> M:
+        instance = self.load(model, pk)
+        if instance is None:
+            raise Http404(f"No {model._meta.object_name} matches the given query.")
+        return instance
+
+    def question_or_404(self, pk: int) -> Question:
+        if (Question, pk) not in self._identity_map:
+            question = (
+                Question.objects.select_related("game", "respondent")
+                .filter(pk=pk)
+                .first()
+            )
+            if question is None:
+                raise Http404("No Question matches the given query.")
+            self.prime(question, question.game, question.respondent)
+        return typing.cast(Question, self._identity_map[(Question, pk)])
+
+    def game_user_ids(self, game: Game) -> frozenset[int]:
+        if game.pk not in self._game_user_ids:
+            user_ids = Game.users.through.objects.filter(game_id=game.pk).values_list(
+                "user_id", flat=True
+            )
+            self._game_user_ids[game.pk] = frozenset(user_ids)
+        return self._game_user_ids[game.pk]
+
+    def question_selections(self, question: Question) -> list[Selection]:
+        if question.pk not in self._question_selections:
+            selections = list(Selection.objects.filter(question_id=question.pk))
+            for selection in selections:
+                selection.question = question
+            self._question_selections[question.pk] = selections
+        return self._question_selections[question.pk]
+
+    def user_selection(self, question: Question, user_id: int) -> Selection | None:
+        for selection in self.question_selections(question):
+            if selection.user_id == user_id:
+                return selection
+        return None
+
+    def has_selection(self, question: Question, user_id: int) -> bool:
+        # a cheap check when the selections themselves are not needed yet
+        if question.pk in self._question_selections:
+            return self.user_selection(question, user_id) is not None
+        return Selection.objects.filter(
+            question_id=question.pk, user_id=user_id
+        ).exists()
+
+    def forget_selections(self, question: Question) -> None:
+        # after a write the next read must see concurrent writes too
+        self._question_selections.pop(question.pk, None)
+
+
+def get_loader(request: HttpRequest) -> Loader:
+    loader = getattr(request, "loader", None)
+    if loader is None:
+        loader = Loader()
+        setattr(request, "loader", loader)
+    return typing.cast(Loader, loader)
@@ -0,0 +1,63 @@
+import json
+import typing
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+
+from forcedfun import analytics
+from forcedfun.models import AnalyticsReport
+from forcedfun.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute player accuracy, respondent majority rates, game difficulty "
+        "and pairwise agreement with NumPy and write them as JSON or CSV."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "slugs", nargs="*", metavar="slug", help="Defaults to every game"
+        )
+        parser.add_argument("--format", choices=["json", "csv"], default="json")
+        parser.add_argument(
+            "--output",
+            type=Path,
+            default=settings.REPO_DIR / "analytics",
+            help="Directory of the report files",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument(
+            "--save",
+            action="store_true",
+            help="Also store the report for the admin dashboard",
+        )
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError("numpy is required, run uv sync --group analytics")
+
+        games = Game.objects.all()
+        if options["slugs"]:
+            games = games.filter(slug__in=options["slugs"])
+        report = analytics.report(games, chunk_size=options["chunk_size"])
+
+        output = options["output"]
+        if options["format"] == "csv":
+            paths = analytics.write_csv(report, output)
+        else:
+            output.mkdir(parents=True, exist_ok=True)
+            path = output / "report.json"
+            path.write_text(json.dumps(report, indent=2))
+            paths = [path]
+        for path in paths:
+            self.stdout.write(f"Wrote {path}")
+
+        if options["save"]:
+            saved = AnalyticsReport.objects.create(report=report)
+            self.stdout.write(f"Saved analytics report {saved.pk}")
@@ -0,0 +1,60 @@
+import typing
+
+from django.core.management import BaseCommand
+from django.core.management.base import CommandParser
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+
+from forcedfun import backfills
+from forcedfun import sql
+
+TABLES = ["forcedfun_selection", "forcedfun_question"]
+# the last migration with option_text and answer_text
+STATE = ("forcedfun", "0009_backfill_option_idx_sharded")
+
+
+class Command(BaseCommand):
+    help = (
+        "Before the option_text and answer_text columns are dropped, check "
+        "in batches that option_idx and answer_idx point at the same option, "
+        "and with --fix store the index of the text where they do not. "
+        "Prints the size of the tables, run it before and after migrating. "
+        "Postgres reuses the space of dropped columns for new rows only, "
+        "VACUUM FULL or pg_repack gives it back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--fix", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        for table, sizes in sql.table_sizes(TABLES).items():
+            self.stdout.write(
+                f"{table}: "
+                + ", ".join(
+                    f"{name} {size / 1024:.0f} kB" for name, size in sizes.items()
+                )
+            )
+
+        with connection.cursor() as cursor:
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(
+                    cursor, "forcedfun_selection"
+                )
+            }
+        if "option_text" not in columns:
+            self.stdout.write("option_text and answer_text are dropped")
+            return
+
+        apps = MigrationLoader(connection).project_state(STATE).apps
+        results = backfills.option_idx(
+            apps, batch_size=options["batch_size"], fix=options["fix"]
+        )
+        for name, result in zip(["selections", "questions"], results):
+            self.stdout.write(
+                f"{name}: {result.checked} checked, "
+                f"{len(result.fixed)} {'fixed' if options['fix'] else 'to fix'}, "
+                f"{len(result.unresolved)} with a text that is none of the options "
+                f"{result.unresolved[:10]}"
+            )
@@ -0,0 +1,92 @@
+import dataclasses
+import json
+import typing
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+from django.utils import timezone
+
+from forcedfun import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time score_selections and option_percentages in memory and against "
+        "the database, store the results and compare them with a baseline."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--benchmark",
+            action="append",
+            choices=sorted(benchmarks.BENCHMARKS),
+            help="Defaults to every benchmark",
+        )
+        parser.add_argument(
+            "--sizes",
+            default="10,100,1000,10000,100000,1000000",
+            help="Comma separated numbers of selections",
+        )
+        parser.add_argument(
+            "--db-max-size",
+            type=int,
+            default=10000,
+            help="Skip database benchmarks above this many selections",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--output", type=Path, default=settings.REPO_DIR / "benchmarks.json"
+        )
+        parser.add_argument("--compare", type=Path, help="Baseline results file")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed slowdown against the baseline, 0.2 is 20%%",
+        )
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        results = benchmarks.run(
+            names=options["benchmark"] or list(benchmarks.BENCHMARKS),
+            sizes=[int(size) for size in options["sizes"].split(",")],
+            db_max_size=options["db_max_size"],
+            repeat=options["repeat"],
+        )
+        self.stdout.write(
+            f"{'benchmark':<25}{'size':>10}{'best ms':>12}"
+            f"{'mean ms':>12}{'peak KiB':>12}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result.name:<25}{result.size:>10}"
+                f"{result.seconds * 1000:>12.3f}{result.mean_seconds * 1000:>12.3f}"
+                f"{result.peak_bytes / 1024:>12.1f}"
+            )
+
+        data = {
+            "commit": settings.COMMIT,
+            "created_at": timezone.now().isoformat(),
+            "results": [dataclasses.asdict(result) for result in results],
+        }
+        options["output"].write_text(json.dumps(data, indent=2))
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options["compare"] is None:
+            return
+        baseline = [
+            benchmarks.Result(**result)
+            for result in json.loads(options["compare"].read_text())["results"]
+        ]
+        slower = benchmarks.regressions(
+            results, baseline, tolerance=options["tolerance"]
+        )
+        for result, before in slower:
+            self.stderr.write(
+                f"{result.name} size={result.size}: "
+                f"{before.seconds * 1000:.3f}ms -> {result.seconds * 1000:.3f}ms"
+            )
+        if slower:
+            raise CommandError(f"{len(slower)} benchmarks regressed")
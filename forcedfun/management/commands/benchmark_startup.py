@@ -0,0 +1,100 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import typing
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def get(url: str) -> float | None:
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            response.read()
+    except (urllib.error.URLError, OSError):
+        return None
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with forcedfun.gunicorn_conf and time how long it "
+        "takes to answer its first request, and the first and second "
+        "request once it is up."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--runs", type=int, default=3)
+        parser.add_argument("--path", default="/login/")
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument(
+            "--worker-class", choices=["sync", "gthread"], default="sync"
+        )
+        parser.add_argument("--no-preload", action="store_true")
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def run(self, options: dict[str, typing.Any]) -> tuple[float, float, float]:
+        port = free_port()
+        env = {
+            **os.environ,
+            "PORT": str(port),
+            "GUNICORN_CONCURRENCY": str(options["workers"]),
+            "GUNICORN_WORKER_CLASS": options["worker_class"],
+            "GUNICORN_PRELOAD": str(not options["no_preload"]),
+        }
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "python:forcedfun.gunicorn_conf",
+            "forcedfun.wsgi",
+        ]
+        url = f"http://127.0.0.1:{port}{options['path']}"
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            cwd=settings.REPO_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while (first := get(url)) is None:
+                if time.perf_counter() - start > options["timeout"]:
+                    raise CommandError(f"No response from {url}")
+                time.sleep(0.01)
+            up = time.perf_counter() - start
+            second = get(url) or 0.0
+        finally:
+            process.terminate()
+            process.wait()
+        return up, first, second
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        ups = []
+        for i in range(options["runs"]):
+            up, first, second = self.run(options)
+            ups.append(up)
+            self.stdout.write(
+                f"run {i + 1}: first response after {up * 1000:.0f} ms, "
+                f"first request {first * 1000:.1f} ms, "
+                f"second request {second * 1000:.1f} ms"
+            )
+        self.stdout.write(
+            f"median time to first response {statistics.median(ups) * 1000:.0f} ms"
+        )
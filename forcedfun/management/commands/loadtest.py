@@ -0,0 +1,257 @@
+import asyncio
+import collections
+import concurrent.futures
+import dataclasses
+import http.cookiejar
+import random
+import secrets
+import time
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+from django.urls import reverse
+
+from forcedfun import scoring
+from forcedfun.models import Game
+from forcedfun.models import Question
+from forcedfun.models import Selection
+
+
+@dataclasses.dataclass
+class Result:
+    endpoint: str
+    status: int
+    duration: float
+
+    @property
+    def is_error(self) -> bool:
+        return self.status == 0 or self.status >= 400
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # a redirect is a response of its own, not a second request to time
+    def redirect_request(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        return None
+
+
+def percentile(values: typing.Sequence[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = max(0, round(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Player:
+    def __init__(self, base_url: str, username: str, password: str) -> None:
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirectHandler
+        )
+
+    def csrf_token(self) -> str:
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value or ""
+        return ""
+
+    def request(
+        self, endpoint: str, path: str, data: dict[str, typing.Any] | None = None
+    ) -> Result:
+        body = None
+        if data is not None:
+            data = {"csrfmiddlewaretoken": self.csrf_token(), **data}
+            body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.base_url + path, data=body)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        return Result(
+            endpoint=endpoint, status=status, duration=time.perf_counter() - start
+        )
+
+    async def arequest(
+        self, endpoint: str, path: str, data: dict[str, typing.Any] | None = None
+    ) -> Result:
+        return await asyncio.to_thread(self.request, endpoint, path, data)
+
+    async def join(self, slug: str) -> list[Result]:
+        register = reverse("register")
+        data = {
+            "username": self.username,
+            "password1": self.password,
+            "password2": self.password,
+        }
+        return [
+            await self.arequest("register", register),
+            await self.arequest("register", register, data),
+            await self.arequest("index", reverse("index") + f"?slug={slug}"),
+        ]
+
+    async def play(
+        self, slug: str, questions: typing.Sequence[Question], polls: int
+    ) -> list[Result]:
+        results = []
+        for question in questions:
+            for _ in range(polls):
+                path = reverse("game-detail", kwargs={"slug": slug})
+                results.append(await self.arequest("game-detail", path))
+            data = {"option_idx": random.randrange(len(question.options))}
+            path = reverse("selection-create", kwargs={"question_pk": question.pk})
+            results.append(await self.arequest("selection-create", path, data))
+        return results
+
+
+def check_scoring(questions: typing.Sequence[Question]) -> int:
+    """
+    Number of questions whose stored points match a fresh score with the
+    scoring rule and the streaks before them.
+    """
+    rule = scoring.get_rule()
+    n_correct = 0
+    for question in questions:
+        question.refresh_from_db()
+        selections = list(question.selections.all())
+        respondent_selection = next(
+            (s for s in selections if s.user_id == question.respondent_id), None
+        )
+        others = [s for s in selections if s.user_id != question.respondent_id]
+        if question.scored_at is None or respondent_selection is None or not others:
+            continue
+        stored = {s.pk: s.points for s in selections}
+        expected = rule.score(
+            selections=[
+                Selection(pk=s.pk, user_id=s.user_id, option_idx=s.option_idx)
+                for s in others
+            ],
+            respondent_selection=Selection(
+                pk=respondent_selection.pk,
+                user_id=respondent_selection.user_id,
+                option_idx=respondent_selection.option_idx,
+            ),
+            points=question.points,
+            streaks=scoring.question_streaks(question, rule),
+        )
+        if all(stored[s.pk] == s.points for s in expected):
+            n_correct += 1
+    return n_correct
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate whole games against a running server: players register, "
+        "join, poll the game and answer every question at once. Every player "
+        "shares one address, so run the server with RATELIMIT_ENABLED=false."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--players", type=int, default=10)
+        parser.add_argument("--questions", type=int, default=3)
+        parser.add_argument("--polls", type=int, default=1)
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the generated game and users"
+        )
+
+    async def run(
+        self, players: list[Player], slug: str, n_questions: int, polls: int
+    ) -> tuple[list[Result], list[Question]]:
+        # a thread per player, to_thread runs in the default executor and
+        # that has min(32, cpus + 4) threads
+        asyncio.get_running_loop().set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(len(players), 1))
+        )
+        results = []
+        for player_results in await asyncio.gather(*(p.join(slug) for p in players)):
+            results.extend(player_results)
+
+        game = await Game.objects.aget(slug=slug)
+        respondents = [
+            user async for user in User.objects.filter(games=game).order_by("id")
+        ]
+        if not respondents:
+            return results, []
+        questions = [
+            await Question.objects.acreate(
+                game=game,
+                respondent=respondents[i % len(respondents)],
+                options=[f"option{i}a", f"option{i}b"],
+                points=1,
+            )
+            for i in range(n_questions)
+        ]
+        plays = await asyncio.gather(*(p.play(slug, questions, polls) for p in players))
+        for player_results in plays:
+            results.extend(player_results)
+        return results, questions
+
+    def report(self, results: typing.Sequence[Result], elapsed: float) -> None:
+        by_endpoint = collections.defaultdict(list)
+        for result in results:
+            by_endpoint[result.endpoint].append(result)
+        self.stdout.write(
+            f"{'endpoint':<20}{'requests':>10}{'errors':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        )
+        for endpoint, endpoint_results in by_endpoint.items():
+            durations = [result.duration * 1000 for result in endpoint_results]
+            errors = sum(result.is_error for result in endpoint_results)
+            self.stdout.write(
+                f"{endpoint:<20}{len(endpoint_results):>10}{errors:>8}"
+                f"{percentile(durations, 50):>10.1f}"
+                f"{percentile(durations, 95):>10.1f}"
+                f"{percentile(durations, 99):>10.1f}"
+            )
+        errors = sum(result.is_error for result in results)
+        self.stdout.write(
+            f"{len(results)} requests in {elapsed:.2f}s, "
+            f"{len(results) / elapsed:.1f} req/s, "
+            f"error rate {errors / len(results):.1%}"
+        )
+
+    def cleanup(self, slug: str, usernames: typing.Sequence[str]) -> None:
+        Selection.objects.filter(question__game__slug=slug).delete()
+        Question.objects.filter(game__slug=slug).delete()
+        Game.users.through.objects.filter(game__slug=slug).delete()
+        Game.objects.filter(slug=slug).delete()
+        User.objects.filter(username__in=usernames).delete()
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        token = secrets.token_hex(4)
+        slug = f"loadtest-{token}"
+        Game.objects.create(slug=slug)
+        base_url = options["base_url"].rstrip("/")
+        players = [
+            Player(base_url, f"loadtest-{token}-{i}", secrets.token_urlsafe(16))
+            for i in range(options["players"])
+        ]
+        try:
+            start = time.perf_counter()
+            results, questions = asyncio.run(
+                self.run(players, slug, options["questions"], options["polls"])
+            )
+            elapsed = time.perf_counter() - start
+            self.report(results, elapsed)
+            n_correct = check_scoring(questions)
+            self.stdout.write(
+                f"scoring: {n_correct}/{len(questions)} questions scored correctly"
+            )
+        finally:
+            if not options["keep"]:
+                self.cleanup(slug, [player.username for player in players])
+
+        if n_correct != len(questions) or not questions:
+            raise CommandError("Scoring check failed")
@@ -0,0 +1,122 @@
+import collections
+import time
+import typing
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+
+from forcedfun import leaderboard
+from forcedfun import purge
+from forcedfun import shards
+from forcedfun.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete games or users with everything that refers to them, a batch "
+        "of rows at a time with a pause between batches, printing the "
+        "progress. The leaderboard is marked stale for refresh_leaderboard "
+        "--if-stale once they are gone. With --queued, the games and users "
+        "deleted in the admin are purged instead and the leaderboard is "
+        "refreshed, with --loop every --interval seconds until stopped."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--game", action="append", default=[], dest="slugs", metavar="SLUG"
+        )
+        parser.add_argument(
+            "--user", action="append", default=[], dest="usernames", metavar="USERNAME"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, help="Defaults to PURGE_BATCH_SIZE"
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            help="Seconds to pause after each batch, defaults to "
+            "PURGE_BATCH_SLEEP_SECONDS",
+        )
+        parser.add_argument(
+            "--queued",
+            action="store_true",
+            help="Purge the games and users deleted in the admin",
+        )
+        parser.add_argument(
+            "--loop", action="store_true", help="With --queued, until stopped"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10.0,
+            help="Seconds to wait between --loop runs",
+        )
+
+    def report(self, label: str, n: int) -> None:
+        self.stdout.write(f"{label}: {n} deleted")
+
+    def write_deleted(self, deleted: collections.Counter[str]) -> None:
+        self.stdout.write(
+            "Deleted "
+            + ", ".join(f"{n} {label}" for label, n in sorted(deleted.items()))
+        )
+
+    def drain(self, *, loop: bool, interval: float, **batch: typing.Any) -> None:
+        try:
+            while True:
+                result = purge.drain(report=self.report, **batch)
+                if result.deleted:
+                    self.write_deleted(result.deleted)
+                    # the purged points leave the leaderboard now, not whenever
+                    # refresh_leaderboard runs next, which then has nothing to do
+                    leaderboard.mark_stale()
+                    leaderboard.refresh_if_stale()
+                if not loop:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        slugs = options["slugs"]
+        usernames = options["usernames"]
+        batch = {"batch_size": options["batch_size"], "sleep": options["sleep"]}
+        if options["queued"]:
+            self.drain(loop=options["loop"], interval=options["interval"], **batch)
+            return
+        if not slugs and not usernames:
+            raise CommandError("Pass --game, --user or --queued")
+        game_ids = {}
+        for slug in slugs:
+            alias = shards.locate_game(slug)
+            game_id = (
+                Game.objects.using(alias)
+                .filter(slug=slug)
+                .values_list("id", flat=True)
+                .first()
+            )
+            if game_id is None:
+                raise CommandError(f"Unknown game: {slug}")
+            game_ids[game_id] = alias
+        user_ids = dict(
+            User.objects.filter(username__in=usernames).values_list("username", "id")
+        )
+        unknown = set(usernames) - user_ids.keys()
+        if unknown:
+            raise CommandError(f"Unknown users: {', '.join(sorted(unknown))}")
+
+        deleted: collections.Counter[str] = collections.Counter()
+        for alias in sorted(set(game_ids.values())):
+            with shards.using(alias):
+                result = purge.games(
+                    [pk for pk, shard in game_ids.items() if shard == alias],
+                    report=self.report,
+                    **batch,
+                )
+            deleted += result.deleted
+        if user_ids:
+            result = purge.users(list(user_ids.values()), report=self.report, **batch)
+            deleted += result.deleted
+        self.write_deleted(deleted)
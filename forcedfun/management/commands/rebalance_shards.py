@@ -0,0 +1,38 @@
+import typing
+
+from django.core.management import BaseCommand
+from django.core.management.base import CommandParser
+
+from forcedfun import shards
+from forcedfun.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Move every game to the shard its slug hashes to, after a shard was "
+        "added to SHARDS. Games keep their ids, users are mirrored to the "
+        "shards their games moved to."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--dry-run", action="store_true", help="List the moves, move nothing"
+        )
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        dry_run = options["dry_run"]
+        if not dry_run:
+            for alias in shards.names():
+                shards.prepare(alias)
+        n = 0
+        for source in shards.names():
+            games = Game.objects.using(source).order_by("id").values_list("id", "slug")
+            for game_id, slug in list(games):
+                target = shards.for_slug(slug)
+                if target == source:
+                    continue
+                self.stdout.write(f"{slug}: {source} -> {target}")
+                if not dry_run:
+                    shards.move_game(game_id, source, target)
+                n += 1
+        self.stdout.write(f"{'Would move' if dry_run else 'Moved'} {n} games")
@@ -0,0 +1,44 @@
+import typing
+
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+
+from forcedfun import answers
+from forcedfun import shards
+from forcedfun.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the answer matrix of the given games from the Selection "
+        "table, after selections or questions changed outside the views."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("slugs", nargs="*", metavar="slug")
+        parser.add_argument("--all", action="store_true", help="Rebuild every game")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        slugs = options["slugs"]
+        if not slugs and not options["all"]:
+            raise CommandError("Pass game slugs or --all")
+        games = Game.objects.order_by("id")
+        if slugs:
+            games = games.filter(slug__in=slugs)
+            found = {
+                slug
+                for alias in shards.names()
+                for slug in games.using(alias).values_list("slug", flat=True)
+            }
+            unknown = set(slugs) - found
+            if unknown:
+                raise CommandError(f"Unknown games: {', '.join(sorted(unknown))}")
+
+        n = 0
+        for alias in shards.names():
+            with shards.using(alias):
+                for game_id in games.values_list("id", flat=True).iterator():
+                    answers.rebuild(game_id)
+                    n += 1
+        self.stdout.write(f"Rebuilt {n} answer matrices")
@@ -0,0 +1,47 @@
+import time
+import typing
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.management.base import CommandParser
+
+from forcedfun import leaderboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the global leaderboard materialized view, with --if-stale "
+        "only when scores were saved since the last refresh, with --loop "
+        "every LEADERBOARD_REFRESH_SECONDS until stopped."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--blocking",
+            action="store_true",
+            help="Lock the view while refreshing, faster but blocks readers",
+        )
+        parser.add_argument(
+            "--if-stale",
+            action="store_true",
+            help="Refresh only when scores were saved since the last refresh",
+        )
+        parser.add_argument(
+            "--loop", action="store_true", help="Refresh when stale until stopped"
+        )
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        concurrently = not options["blocking"]
+        if not options["if_stale"] and not options["loop"]:
+            leaderboard.refresh(concurrently=concurrently)
+            self.stdout.write("Refreshed the leaderboard")
+            return
+        try:
+            while True:
+                if leaderboard.refresh_if_stale(concurrently=concurrently):
+                    self.stdout.write("Refreshed the leaderboard")
+                if not options["loop"]:
+                    break
+                time.sleep(settings.LEADERBOARD_REFRESH_SECONDS)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,62 @@
+import time
+import typing
+
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+
+from forcedfun import outbox
+from forcedfun import shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the game events of the outbox to the OUTBOX_SINKS in "
+        "batches until none are left on any shard, or keep polling for new "
+        "ones with --loop. Events are delivered at least once."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--sinks", help="Comma separated sink names, defaults to OUTBOX_SINKS"
+        )
+        parser.add_argument(
+            "--loop", action="store_true", help="Poll for events until stopped"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the outbox is empty or a sink failed",
+        )
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        sinks = outbox.get_sinks(
+            options["sinks"].split(",") if options["sinks"] else None
+        )
+        delivered = 0
+        try:
+            while True:
+                full = False
+                for alias in shards.names():
+                    with shards.using(alias):
+                        batch = outbox.relay(
+                            batch_size=options["batch_size"], sinks=sinks
+                        )
+                    delivered += batch.delivered
+                    if batch.failed:
+                        message = f"{batch.failed} events not delivered: {batch.error}"
+                        if not options["loop"]:
+                            raise CommandError(message)
+                        self.stderr.write(message)
+                    elif batch.delivered == options["batch_size"]:
+                        full = True
+                if full:
+                    continue
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Delivered {delivered} events")
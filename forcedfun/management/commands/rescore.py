@@ -0,0 +1,94 @@
+import typing
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+from django.core.management.base import CommandParser
+from django.db.models import QuerySet
+
+from forcedfun import answers
+from forcedfun import leaderboard
+from forcedfun import outbox
+from forcedfun import scoring
+from forcedfun import shards
+from forcedfun import utils
+from forcedfun.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Score every scored question of the given games again with a scoring "
+        "rule, in one transaction per shard, and print the points that change."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("slugs", nargs="*", metavar="slug")
+        parser.add_argument("--all", action="store_true", help="Rescore every game")
+        parser.add_argument(
+            "--rule",
+            choices=sorted(scoring.RULES),
+            help="Defaults to the SCORING_RULE setting",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Print the changes only"
+        )
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        slugs = options["slugs"]
+        if not slugs and not options["all"]:
+            raise CommandError("Pass game slugs or --all")
+        games = Game.objects.all()
+        if slugs:
+            games = games.filter(slug__in=slugs)
+            found: set[str] = set()
+            for alias in shards.names():
+                with shards.using(alias):
+                    found |= set(games.values_list("slug", flat=True))
+            unknown = set(slugs) - found
+            if unknown:
+                raise CommandError(f"Unknown games: {', '.join(sorted(unknown))}")
+        rule = scoring.get_rule(options["rule"])
+
+        changes = []
+        for alias in shards.names():
+            with shards.using(alias), shards.atomic():
+                changes += self.rescore(games, rule, dry_run=options["dry_run"])
+        if changes and not options["dry_run"]:
+            leaderboard.refresh()
+
+        n_questions = len({change.selection.question_id for change in changes})
+        summary = f"{len(changes)} selections changed in {n_questions} questions"
+        if options["dry_run"]:
+            summary += " (dry run, nothing saved)"
+        self.stdout.write(summary)
+
+    def rescore(
+        self, games: QuerySet[Game], rule: scoring.Rule, *, dry_run: bool
+    ) -> list[scoring.Change]:
+        # the games of the current shard
+        changes = scoring.rescore(games, rule)
+        slugs = dict(games.values_list("pk", "slug"))
+        usernames = dict(
+            User.objects.filter(
+                pk__in={change.selection.user_id for change in changes}
+            ).values_list("pk", "username")
+        )
+        for change in changes:
+            selection = change.selection
+            self.stdout.write(
+                f"{slugs[selection.question.game_id]} question "
+                f"{selection.question_id} {usernames[selection.user_id]}: "
+                f"{change.before} -> {change.after}"
+            )
+        if not dry_run:
+            # in batches of 1000 rows
+            utils.save_points([change.selection for change in changes])
+            # the hooks of a question scored by a selection, with its own
+            # event kind, the question was scored before
+            rescored = sorted(
+                {change.selection.question for change in changes},
+                key=lambda question: question.pk,
+            )
+            answers.record([], scored=rescored)
+            outbox.emit([], rescored=rescored)
+        return changes
@@ -1,10 +1,32 @@
+import contextlib
+import json
+import logging
+import math
+import random
+import time
 import typing
+import warnings
 
+import sentry_sdk
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.http import HttpRequest
 from django.http import HttpResponse
 from django.http import HttpResponseRedirect
 
 from .errors import Http302
+from .errors import QueryInspectError
+from .errors import QueryInspectWarning
+from .models import RequestProfile
+from .models import SlowQuery
+from . import profiling
+from . import ratelimit
+from . import shards
+from . import sql
+from . import tracing
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("forcedfun.slowquery")
 
 
 class RedirectMiddleware:
@@ -22,3 +44,292 @@ class RedirectMiddleware:
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
         return self.get_response(request)
+
+
+class ShardMiddleware:
+    """
+    Runs each view with the sharded models routed to the shard of the game
+    slug or question pk in its URL, see forcedfun.shards. Views without
+    either pick their shards themselves.
+    """
+
+    def __init__(
+        self, get_response: typing.Callable[[typing.Any], HttpResponse]
+    ) -> None:
+        self.get_response = get_response
+
+    def process_view(
+        self,
+        request: HttpRequest,
+        view_func: typing.Callable[..., typing.Any],
+        view_args: typing.Any,
+        view_kwargs: typing.Any,
+    ) -> HttpResponse | None:
+        alias = shards.for_url_kwargs(view_kwargs)
+        if alias is not None:
+            # left in __call__, once the response is rendered
+            stack = contextlib.ExitStack()
+            stack.enter_context(shards.using(alias))
+            setattr(request, "shard_stack", stack)
+        return None
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        try:
+            return self.get_response(request)
+        finally:
+            stack = getattr(request, "shard_stack", None)
+            if stack is not None:
+                stack.close()
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests to views marked with forcedfun.ratelimit.ratelimit once
+    the client runs out of tokens, with a 429 and a Retry-After header.
+    A limit per IP rejects without a query, one per user reads the session.
+    """
+
+    def __init__(
+        self, get_response: typing.Callable[[typing.Any], HttpResponse]
+    ) -> None:
+        self.get_response = get_response
+
+    def process_view(
+        self,
+        request: HttpRequest,
+        view_func: typing.Callable[..., typing.Any],
+        view_args: typing.Any,
+        view_kwargs: typing.Any,
+    ) -> HttpResponse | None:
+        limit = getattr(view_func, "ratelimit", None)
+        if limit is None:
+            return None
+        wait = ratelimit.check(request, limit)
+        if not wait:
+            return None
+        response = HttpResponse("Too many requests", status=429)
+        response["Retry-After"] = str(math.ceil(wait))
+        return response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        return self.get_response(request)
+
+
+class QueryInspectMiddleware:
+    """
+    Fingerprints every statement of a request and flags statement shapes
+    repeated more than QUERY_INSPECT_THRESHOLD times (N+1 queries) and exact
+    duplicate queries. QUERY_INSPECT_MODE picks what happens to a flagged
+    request: "warn", "log" (append to QUERY_INSPECT_REPORT), "raise" or "off".
+    """
+
+    def __init__(
+        self, get_response: typing.Callable[[typing.Any], HttpResponse]
+    ) -> None:
+        self.get_response = get_response
+
+    def handle_report(self, request: HttpRequest, report: sql.QueryReport) -> None:
+        mode = settings.QUERY_INSPECT_MODE
+        if mode == "warn":
+            logger.warning(str(report))
+            warnings.warn(str(report), QueryInspectWarning, stacklevel=2)
+        elif mode == "log":
+            line = {
+                "url_name": report.url_name,
+                "path": request.path,
+                "n_queries": report.n_queries,
+                "repeated": report.repeated,
+                "duplicates": report.duplicates,
+            }
+            with open(settings.QUERY_INSPECT_REPORT, "a") as f:
+                f.write(json.dumps(line) + "\n")
+        elif mode == "raise":
+            raise QueryInspectError(str(report))
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if settings.QUERY_INSPECT_MODE == "off":
+            return self.get_response(request)
+
+        recorder = sql.QueryRecorder()
+        with sql.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        report = sql.inspect_queries(
+            recorder.queries,
+            url_name=match.view_name if match else request.path,
+            threshold=settings.QUERY_INSPECT_THRESHOLD,
+        )
+        sql.query_inspected.send(sender=self.__class__, report=report)
+        if report.has_problems:
+            self.handle_report(request, report)
+        return response
+
+
+class ProfileMiddleware:
+    """
+    Profiles a request when a superuser asks for it with the X-Profile header
+    or a ?profile query flag, or for a PROFILE_SAMPLE_RATE share of all
+    requests. The speedscope file is stored on a RequestProfile, downloadable
+    from the admin, and its id is returned in the X-Profile-Id header.
+    """
+
+    def __init__(
+        self, get_response: typing.Callable[[typing.Any], HttpResponse]
+    ) -> None:
+        self.get_response = get_response
+
+    def should_profile(self, request: HttpRequest) -> bool:
+        requested = "X-Profile" in request.headers or "profile" in request.GET
+        if requested and request.user.is_superuser:
+            return True
+        return random.random() < settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        recorder = sql.QueryRecorder()
+        profiler = profiling.SamplingProfiler(interval=settings.PROFILE_INTERVAL)
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            with sql.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            profiler.stop()
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        url_name = match.view_name if match else ""
+        speedscope = profiling.to_speedscope(
+            name=f"{request.method} {request.path}",
+            samples=profiler.samples,
+            queries=recorder.queries,
+        )
+        profile = RequestProfile(
+            user=request.user if request.user.is_authenticated else None,
+            path=request.get_full_path(),
+            url_name=url_name,
+            duration_ms=duration * 1000,
+            sql_ms=sum(query.duration for query in recorder.queries) * 1000,
+            n_queries=len(recorder.queries),
+        )
+        profile.file.save(
+            f"{url_name or 'request'}.speedscope.json",
+            ContentFile(json.dumps(speedscope)),
+        )
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Records statements slower than SLOW_QUERY_THRESHOLD_MS with their
+    fingerprint, url name and the line of this package that ran them. A
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE share of them is explained. Records go to
+    the "forcedfun.slowquery" logger (a rotating SLOW_QUERY_LOG file) and
+    to the SlowQuery table shown in the admin.
+    """
+
+    def __init__(
+        self, get_response: typing.Callable[[typing.Any], HttpResponse]
+    ) -> None:
+        self.get_response = get_response
+
+    def save(
+        self, request: HttpRequest, queries: typing.Sequence[sql.QueryRecord]
+    ) -> None:
+        match = request.resolver_match
+        url_name = match.view_name if match else ""
+        slow_queries = []
+        for query in queries:
+            explain = ""
+            # a failed statement is not run again
+            if (
+                not query.error
+                and random.random() < settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+            ):
+                explain = sql.explain(query.sql, query.params, using=query.alias)
+            slow_query = SlowQuery(
+                fingerprint=query.fingerprint,
+                sql=query.sql,
+                duration_ms=query.duration * 1000,
+                path=request.path,
+                url_name=url_name,
+                call_site=query.call_site,
+                explain=explain,
+            )
+            slow_query_logger.info(
+                json.dumps(
+                    {
+                        "fingerprint": slow_query.fingerprint,
+                        "duration_ms": slow_query.duration_ms,
+                        "path": slow_query.path,
+                        "url_name": slow_query.url_name,
+                        "call_site": slow_query.call_site,
+                        "database": query.alias,
+                        "error": query.error,
+                        "explain": slow_query.explain,
+                    }
+                )
+            )
+            slow_queries.append(slow_query)
+        SlowQuery.objects.bulk_create(slow_queries)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        recorder = sql.SlowQueryRecorder(
+            threshold=settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        )
+        with sql.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if recorder.queries:
+            self.save(request, recorder.queries)
+        return response
+
+
+class TracingMiddleware:
+    """
+    Root span for every request with a child span per ORM query, exported
+    when TRACING_EXPORTER is set. The trace id is tagged on Sentry events and
+    returned in the X-Trace-Id header.
+    """
+
+    def __init__(
+        self, get_response: typing.Callable[[typing.Any], HttpResponse]
+    ) -> None:
+        self.get_response = get_response
+
+    def query_span(
+        self,
+        execute: typing.Callable[..., typing.Any],
+        statement: str,
+        params: typing.Any,
+        many: bool,
+        context: dict[str, typing.Any],
+    ) -> typing.Any:
+        attributes = {
+            "db.system": context["connection"].vendor,
+            "db.name": context["connection"].alias,
+            "db.statement": sql.fingerprint(statement),
+        }
+        with tracing.span("db.query", **attributes):
+            return execute(statement, params, many, context)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if not settings.TRACING_EXPORTER:
+            return self.get_response(request)
+
+        attributes = {"http.method": request.method, "http.target": request.path}
+        with tracing.span(f"{request.method} {request.path}", **attributes) as root:
+            root = typing.cast(tracing.Span, root)
+            sentry_sdk.set_tag("trace_id", root.trace_id)
+            with sql.execute_wrapper(self.query_span):
+                response = self.get_response(request)
+            match = request.resolver_match
+            if match:
+                root.name = f"{request.method} {match.view_name}"
+                root.attributes["http.route"] = match.route
+            root.attributes["http.status_code"] = response.status_code
+        response["X-Trace-Id"] = root.trace_id
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-19 11:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["game", "points", "id"], name="question_game_points_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["game", "scored_at"], name="question_game_scored_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="selection",
+            index=models.Index(fields=["user", "id"], name="selection_user_id_idx"),
+        ),
+    ]
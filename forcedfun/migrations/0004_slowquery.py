@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-19 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0003_requestprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlowQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                ("fingerprint", models.TextField()),
+                ("sql", models.TextField()),
+                ("duration_ms", models.FloatField()),
+                ("path", models.TextField()),
+                ("url_name", models.TextField(blank=True, default="")),
+                ("call_site", models.TextField(blank=True, default="")),
+                ("explain", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "default_related_name": "slow_queries",
+            },
+        ),
+    ]
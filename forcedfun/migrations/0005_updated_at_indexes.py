@@ -0,0 +1,26 @@
+# Generated by Django 5.1.3 on 2026-10-19 12:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0004_slowquery"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["game", "updated_at"], name="question_game_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="selection",
+            index=models.Index(
+                fields=["question", "updated_at"], name="selection_question_updated_idx"
+            ),
+        ),
+    ]
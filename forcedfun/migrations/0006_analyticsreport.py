@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-19 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0005_updated_at_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalyticsReport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                ("report", models.JSONField()),
+            ],
+            options={
+                "default_related_name": "analytics_reports",
+            },
+        ),
+    ]
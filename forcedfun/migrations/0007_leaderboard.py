@@ -0,0 +1,59 @@
+# Generated by Django 5.1.3 on 2026-10-19 12:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+GUESS = "q.scored_at IS NOT NULL AND s.user_id <> q.respondent_id"
+
+CREATE_VIEW = f"""
+CREATE MATERIALIZED VIEW forcedfun_leaderboard AS
+SELECT
+    s.user_id,
+    COALESCE(SUM(s.points), 0) AS points,
+    COUNT(DISTINCT q.game_id) AS games,
+    COUNT(*) FILTER (WHERE {GUESS}) AS guesses,
+    COUNT(*) FILTER (WHERE {GUESS} AND s.points > 0)::float
+        / NULLIF(COUNT(*) FILTER (WHERE {GUESS}), 0) AS accuracy
+FROM forcedfun_selection s
+JOIN forcedfun_question q ON q.id = s.question_id
+GROUP BY s.user_id;
+-- REFRESH ... CONCURRENTLY needs a unique index
+CREATE UNIQUE INDEX forcedfun_leaderboard_user_id ON forcedfun_leaderboard (user_id);
+CREATE INDEX forcedfun_leaderboard_points_user_id
+    ON forcedfun_leaderboard (points, user_id);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("forcedfun", "0006_analyticsreport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Leaderboard",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("points", models.PositiveIntegerField()),
+                ("games", models.PositiveIntegerField()),
+                ("guesses", models.PositiveIntegerField()),
+                ("accuracy", models.FloatField(null=True)),
+            ],
+            options={
+                "db_table": "forcedfun_leaderboard",
+                "managed": False,
+            },
+        ),
+        migrations.RunSQL(CREATE_VIEW, "DROP MATERIALIZED VIEW forcedfun_leaderboard"),
+    ]
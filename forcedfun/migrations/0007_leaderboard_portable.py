@@ -0,0 +1,94 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+GUESS = "q.scored_at IS NOT NULL AND s.user_id <> q.respondent_id"
+
+CREATE_VIEW = f"""
+CREATE MATERIALIZED VIEW forcedfun_leaderboard AS
+SELECT
+    s.user_id,
+    COALESCE(SUM(s.points), 0) AS points,
+    COUNT(DISTINCT q.game_id) AS games,
+    COUNT(*) FILTER (WHERE {GUESS}) AS guesses,
+    COUNT(*) FILTER (WHERE {GUESS} AND s.points > 0)::float
+        / NULLIF(COUNT(*) FILTER (WHERE {GUESS}), 0) AS accuracy
+FROM forcedfun_selection s
+JOIN forcedfun_question q ON q.id = s.question_id
+GROUP BY s.user_id;
+-- REFRESH ... CONCURRENTLY needs a unique index
+CREATE UNIQUE INDEX forcedfun_leaderboard_user_id ON forcedfun_leaderboard (user_id);
+CREATE INDEX forcedfun_leaderboard_points_user_id
+    ON forcedfun_leaderboard (points, user_id);
+"""
+
+# other databases, see OptionsField, get a table leaderboard.refresh fills
+CREATE_TABLE = [
+    """
+    CREATE TABLE forcedfun_leaderboard (
+        user_id integer NOT NULL PRIMARY KEY,
+        points integer NOT NULL,
+        games integer NOT NULL,
+        guesses integer NOT NULL,
+        accuracy real NULL
+    )
+    """,
+    """
+    CREATE INDEX forcedfun_leaderboard_points_user_id
+        ON forcedfun_leaderboard (points, user_id)
+    """,
+]
+
+
+def create_view(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_VIEW)
+    else:
+        for sql in CREATE_TABLE:
+            schema_editor.execute(sql)
+
+
+def drop_view(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP MATERIALIZED VIEW forcedfun_leaderboard")
+    else:
+        schema_editor.execute("DROP TABLE forcedfun_leaderboard")
+
+
+# 0007_leaderboard with the table other databases get instead of the view.
+# Databases that applied 0007_leaderboard record this one as applied too.
+class Migration(migrations.Migration):
+    replaces = [("forcedfun", "0007_leaderboard")]
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("forcedfun", "0006_analyticsreport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Leaderboard",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("points", models.PositiveIntegerField()),
+                ("games", models.PositiveIntegerField()),
+                ("guesses", models.PositiveIntegerField()),
+                ("accuracy", models.FloatField(null=True)),
+            ],
+            options={
+                "db_table": "forcedfun_leaderboard",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_view, drop_view),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-19 12:27
+
+import forcedfun.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0007_leaderboard"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="question",
+            name="options",
+            field=forcedfun.models.OptionsField(
+                base_field=models.TextField(), max_length=2, size=None
+            ),
+        ),
+    ]
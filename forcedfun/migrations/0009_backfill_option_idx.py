@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+from forcedfun import backfills
+
+
+def backfill(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    # the next migration drops option_text and answer_text, the indexes
+    # stay the only stored choice
+    backfills.option_idx(apps, fix=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0008_options_field"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+import typing
+
+from django.db import migrations
+from django.db import models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill_idx(
+    queryset: models.QuerySet[typing.Any],
+    *,
+    idx_field: str,
+    text_field: str,
+    options_field: str,
+) -> None:
+    # backfills.backfill_idx as it was, in keyset batches of the database
+    # the queryset reads
+    model = queryset.model
+    last_id = 0
+    while rows := list(
+        queryset.filter(id__gt=last_id)
+        .order_by("id")
+        .values_list("id", idx_field, text_field, options_field)[:BATCH_SIZE]
+    ):
+        last_id = rows[-1][0]
+        to_update = [
+            model(pk=pk, **{idx_field: options.index(text)}, updated_at=timezone.now())
+            for pk, idx, text, options in rows
+            if not (idx is not None and idx < len(options) and options[idx] == text)
+            and text in options
+        ]
+        model._default_manager.db_manager(queryset.db).bulk_update(
+            to_update, [idx_field, "updated_at"]
+        )
+
+
+def backfill(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    # the next migration drops option_text and answer_text, the indexes
+    # stay the only stored choice, on the shard being migrated
+    alias = schema_editor.connection.alias
+    Selection = apps.get_model("forcedfun", "Selection")
+    Question = apps.get_model("forcedfun", "Question")
+    backfill_idx(
+        Selection._default_manager.using(alias),
+        idx_field="option_idx",
+        text_field="option_text",
+        options_field="question__options",
+    )
+    backfill_idx(
+        Question._default_manager.using(alias).exclude(answer_text=""),
+        idx_field="answer_idx",
+        text_field="answer_text",
+        options_field="options",
+    )
+
+
+# 0009_backfill_option_idx for every shard, which read the default database
+# whatever the database migrated. Databases that applied
+# 0009_backfill_option_idx record this one as applied too.
+class Migration(migrations.Migration):
+    replaces = [("forcedfun", "0009_backfill_option_idx")]
+
+    dependencies = [
+        ("forcedfun", "0008_options_field"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
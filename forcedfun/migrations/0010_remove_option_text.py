@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-19 12:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0009_backfill_option_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="question",
+            name="answer_text",
+        ),
+        migrations.RemoveField(
+            model_name="selection",
+            name="option_text",
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-19 13:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0010_remove_option_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnswerMatrix",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                (
+                    "game",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="forcedfun.game",
+                    ),
+                ),
+                ("question_ids", models.JSONField(default=list)),
+                ("respondent_ids", models.JSONField(default=list)),
+                ("user_ids", models.JSONField(default=list)),
+                ("picks", models.BinaryField(default=b"")),
+                ("answers", models.BinaryField(default=b"")),
+            ],
+            options={
+                "default_related_name": "answer_matrix",
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:07
+
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+from django.utils import timezone
+
+
+def create_state(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    # stale, so the first refresh_leaderboard --if-stale refreshes
+    LeaderboardState = apps.get_model("forcedfun", "LeaderboardState")
+    LeaderboardState.objects.using(schema_editor.connection.alias).create(
+        stale_since=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0012_outboxevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stale_since", models.DateTimeField(blank=True, null=True)),
+                ("refreshed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:30
+
+import collections
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+
+def build_rows(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    # a row per question from the Selection table, the picks as in
+    # forcedfun.answers.build, a thousand questions at a time
+    db = schema_editor.connection.alias
+    Question = apps.get_model("forcedfun", "Question")
+    Selection = apps.get_model("forcedfun", "Selection")
+    AnswerRow = apps.get_model("forcedfun", "AnswerRow")
+    last_id = 0
+    while True:
+        questions = list(
+            Question.objects.using(db)
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "game_id", "respondent_id", "answer_idx", "scored_at")[
+                :1000
+            ]
+        )
+        if not questions:
+            return
+        last_id = questions[-1][0]
+        picks: dict[int, dict[int, int]] = collections.defaultdict(dict)
+        for question_id, user_id, option_idx in (
+            Selection.objects.using(db)
+            .filter(question_id__in=[question_id for question_id, *_ in questions])
+            .order_by("id")
+            .values_list("question_id", "user_id", "option_idx")
+        ):
+            picks[question_id][user_id] = option_idx + 1
+        AnswerRow.objects.using(db).bulk_create(
+            AnswerRow(
+                question_id=question_id,
+                game_id=game_id,
+                respondent_id=respondent_id,
+                user_ids=list(picks[question_id]),
+                picks=bytes(picks[question_id].values()),
+                answer=0 if scored_at is None or answer_idx is None else answer_idx + 1,
+            )
+            for question_id, game_id, respondent_id, answer_idx, scored_at in questions
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0013_leaderboardstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnswerRow",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                (
+                    "question",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="forcedfun.question",
+                    ),
+                ),
+                ("respondent_id", models.IntegerField()),
+                ("user_ids", models.JSONField(default=list)),
+                ("picks", models.BinaryField(default=b"")),
+                ("answer", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="forcedfun.game"
+                    ),
+                ),
+            ],
+            options={
+                "default_related_name": "answer_rows",
+            },
+        ),
+        migrations.RunPython(build_rows, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name="AnswerMatrix",
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forcedfun", "0014_answerrow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingPurge",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                (
+                    "kind",
+                    models.TextField(choices=[("game", "Game"), ("user", "User")]),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("shard", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
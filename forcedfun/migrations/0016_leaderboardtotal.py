@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("forcedfun", "0015_pendingpurge"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardTotal",
+            fields=[
+                ("points", models.PositiveIntegerField()),
+                ("games", models.PositiveIntegerField()),
+                ("guesses", models.PositiveIntegerField()),
+                ("accuracy", models.FloatField(null=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["points", "user"], name="leaderboardtotal_points_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,6 +1,12 @@
+import json
+import typing
+
 from django.contrib.postgres.fields import ArrayField
 from django import forms
+from django.db.backends.base.base import BaseDatabaseWrapper
 from django.db import models
+from django.db.models import Index
+from django.db.models import Q
 from django.db.models import UniqueConstraint
 
 
@@ -12,6 +18,43 @@ class TextInputTextField(models.TextField):  # type: ignore
         )
 
 
+class OptionsField(ArrayField):  # type: ignore
+    """
+    A text[] column on Postgres and a JSON encoded list in a text column on
+    other databases, so the tests and benchmarks can run on SQLite. Either
+    way the attribute is a list of str and forms edit it the same.
+    """
+
+    def db_type(self, connection: BaseDatabaseWrapper) -> str | None:
+        if connection.vendor == "postgresql":
+            return super().db_type(connection)
+        return "text"
+
+    def get_placeholder(
+        self, value: typing.Any, compiler: typing.Any, connection: BaseDatabaseWrapper
+    ) -> str:
+        if connection.vendor == "postgresql":
+            return super().get_placeholder(value, compiler, connection)
+        return "%s"
+
+    def get_db_prep_value(
+        self, value: typing.Any, connection: BaseDatabaseWrapper, prepared: bool = False
+    ) -> typing.Any:
+        if connection.vendor == "postgresql":
+            return super().get_db_prep_value(value, connection, prepared)
+        return None if value is None else json.dumps(list(value))
+
+    def from_db_value(
+        self,
+        value: typing.Any,
+        expression: typing.Any,
+        connection: BaseDatabaseWrapper,
+    ) -> typing.Any:
+        if value is None or connection.vendor == "postgresql":
+            return value
+        return json.loads(value)
+
+
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
@@ -23,12 +66,16 @@ class BaseModel(models.Model):
 class Selection(BaseModel):
     user = models.ForeignKey("auth.User", on_delete=models.DO_NOTHING)
     question = models.ForeignKey("forcedfun.Question", on_delete=models.DO_NOTHING)
-    option_text = TextInputTextField()
     option_idx = models.PositiveSmallIntegerField()
     points = models.PositiveSmallIntegerField(null=True, blank=True)
 
+    @property
+    def option_text(self) -> str:
+        # only the index is stored, select_related("question") to read many
+        return str(self.question.options[self.option_idx])
+
     def __str__(self) -> str:
-        return f"{self.option_text=}, {self.user_id=}, {self.question_id=}"
+        return f"{self.option_idx=}, {self.user_id=}, {self.question_id=}"
 
     class Meta:
         constraints = [
@@ -36,15 +83,23 @@ class Selection(BaseModel):
                 fields=["user", "question"], name="selection_user_question_unique"
             )
         ]
+        indexes = [
+            # keyset pagination of a user's history, see selection_history_view
+            Index(fields=["user", "id"], name="selection_user_id_idx"),
+            # deltas of the game state API, see game_state_view
+            Index(
+                fields=["question", "updated_at"],
+                name="selection_question_updated_idx",
+            ),
+        ]
         default_related_name = "selections"
 
 
 class Question(BaseModel):
     respondent = models.ForeignKey("auth.User", on_delete=models.DO_NOTHING)
     game = models.ForeignKey("forcedfun.Game", on_delete=models.DO_NOTHING)
-    options = ArrayField(models.TextField(), max_length=2)
+    options = OptionsField(models.TextField(), max_length=2)
     answer_idx = models.PositiveSmallIntegerField(null=True, blank=True)
-    answer_text = TextInputTextField(default="", blank=True)
     points = models.PositiveSmallIntegerField()
     scored_at = models.DateTimeField(default=None, null=True, blank=True)
 
@@ -53,25 +108,210 @@ class Question(BaseModel):
         ordering = [
             "id",
         ]
+        indexes = [
+            # keyset pagination of a game's questions, see game_detail_view
+            Index(fields=["game", "points", "id"], name="question_game_points_id_idx"),
+            Index(fields=["game", "scored_at"], name="question_game_scored_at_idx"),
+            Index(fields=["game", "updated_at"], name="question_game_updated_idx"),
+        ]
+
+    @property
+    def answer_text(self) -> str:
+        if self.answer_idx is None:
+            return ""
+        return str(self.options[self.answer_idx])
 
-    def save_answer_fields(
-        self, answer_idx: int, answer_text: str, is_respondent: bool
-    ) -> None:
+    def save_answer_fields(self, answer_idx: int, is_respondent: bool) -> None:
         if not is_respondent:
             return
 
         self.answer_idx = answer_idx
-        self.answer_text = answer_text
-        self.save(update_fields=["answer_idx", "answer_text"])
+        self.save(update_fields=["answer_idx", "updated_at"])
 
 
 class Game(BaseModel):
     slug = models.SlugField()
     users = models.ManyToManyField("auth.User", blank=True)
 
+    # the slug in the database, see forcedfun.invites.forget_slug
+    loaded_slug: str | None = None
+
     def __str__(self) -> str:
         return self.slug
 
+    @classmethod
+    def from_db(
+        cls,
+        db: str | None,
+        field_names: typing.Collection[str],
+        values: typing.Collection[typing.Any],
+    ) -> "Game":
+        game = super().from_db(db, field_names, values)
+        game.loaded_slug = game.__dict__.get("slug")
+        return game
+
+    def save(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        super().save(*args, **kwargs)
+        # post_save has forgotten the slug this one replaced
+        self.loaded_slug = self.slug
+
     class Meta:
         constraints = [UniqueConstraint(fields=["slug"], name="game_slug_unique")]
         default_related_name = "games"
+
+
+class AnswerRow(BaseModel):
+    """
+    Every pick of a question in one row, see forcedfun.answers. ``picks``
+    holds a byte per player of ``user_ids`` and ``answer`` is the scored
+    answer, each the option index plus one and 0 for none.
+    """
+
+    # derived from the selections, so it goes with its question
+    question = models.OneToOneField(
+        "forcedfun.Question", on_delete=models.CASCADE, primary_key=True
+    )
+    game = models.ForeignKey("forcedfun.Game", on_delete=models.CASCADE)
+    respondent_id = models.IntegerField()
+    user_ids = models.JSONField(default=list)
+    picks = models.BinaryField(default=b"")
+    answer = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.question_id=}"
+
+    class Meta:
+        default_related_name = "answer_rows"
+
+
+class RequestProfile(BaseModel):
+    user = models.ForeignKey(
+        "auth.User", on_delete=models.DO_NOTHING, null=True, blank=True
+    )
+    path = models.TextField()
+    url_name = models.TextField(default="", blank=True)
+    duration_ms = models.FloatField()
+    sql_ms = models.FloatField()
+    n_queries = models.PositiveIntegerField()
+    # speedscope json, see forcedfun.profiling.to_speedscope
+    file = models.FileField(upload_to="profiles/")
+
+    def __str__(self) -> str:
+        return f"{self.path} {self.duration_ms:.0f}ms"
+
+    class Meta:
+        default_related_name = "request_profiles"
+
+
+class SlowQuery(BaseModel):
+    fingerprint = models.TextField()
+    sql = models.TextField()
+    duration_ms = models.FloatField()
+    path = models.TextField()
+    url_name = models.TextField(default="", blank=True)
+    call_site = models.TextField(default="", blank=True)
+    # EXPLAIN (ANALYZE, BUFFERS) output for sampled statements
+    explain = models.TextField(default="", blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.duration_ms:.0f}ms {self.fingerprint[:80]}"
+
+    class Meta:
+        default_related_name = "slow_queries"
+
+
+class AnalyticsReport(BaseModel):
+    # see forcedfun.analytics.report
+    report = models.JSONField()
+
+    def __str__(self) -> str:
+        return f"Analytics {self.created_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        default_related_name = "analytics_reports"
+
+
+class OutboxEvent(BaseModel):
+    # written with the change it describes, see forcedfun.outbox
+    kind = models.TextField()
+    payload = models.JSONField()
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(default="", blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.pk}"
+
+    class Meta:
+        indexes = [
+            # the relay's next batch
+            Index(
+                fields=["id"],
+                condition=Q(delivered_at__isnull=True),
+                name="outboxevent_pending_idx",
+            ),
+        ]
+
+
+class LeaderboardRow(models.Model):
+    # and a user as the primary key
+    points = models.PositiveIntegerField()
+    games = models.PositiveIntegerField()
+    guesses = models.PositiveIntegerField()
+    accuracy = models.FloatField(null=True)
+
+    class Meta:
+        abstract = True
+
+
+class Leaderboard(LeaderboardRow):
+    """
+    A row per player over the games of a shard, read from its
+    forcedfun_leaderboard materialized view, see
+    forcedfun.leaderboard.refresh.
+    """
+
+    user = models.OneToOneField(
+        "auth.User", on_delete=models.DO_NOTHING, primary_key=True
+    )
+
+    class Meta:
+        managed = False
+        db_table = "forcedfun_leaderboard"
+
+
+class LeaderboardTotal(LeaderboardRow):
+    """
+    The Leaderboard rows of every shard summed per player, which
+    forcedfun.leaderboard.refresh writes when there are several shards.
+    """
+
+    # the purge deletes users without this table's rows, until the refresh
+    user = models.OneToOneField(
+        "auth.User",
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_constraint=False,
+    )
+
+    class Meta:
+        indexes = [
+            # the leaderboard view's pages
+            Index(fields=["points", "user"], name="leaderboardtotal_points_idx"),
+        ]
+
+
+class LeaderboardState(models.Model):
+    # a single row, stale_since is set by the first score saved after a
+    # refresh, see forcedfun.leaderboard.schedule_refresh
+    stale_since = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+
+class PendingPurge(BaseModel):
+    # a game or user the admin deleted, for the purge --queued job to delete
+    # with everything that refers to it, see forcedfun.purge.drain
+    kind = models.TextField(choices=[("game", "Game"), ("user", "User")])
+    object_id = models.BigIntegerField()
+    # the game's shard when it was queued
+    shard = models.TextField(default="", blank=True)
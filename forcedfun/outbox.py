@@ -0,0 +1,210 @@
+import abc
+import collections
+import dataclasses
+import json
+import typing
+import urllib.request
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+
+from . import shards
+from . import tracing
+from .models import OutboxEvent
+from .models import Question
+from .models import Selection
+
+Handler = typing.Callable[[OutboxEvent], None]
+
+
+def emit(
+    selections: typing.Sequence[Selection],
+    scored: typing.Sequence[Question] = (),
+    *,
+    rescored: typing.Sequence[Question] = (),
+) -> None:
+    """
+    Writes a "selection.created" event per selection, a "question.scored"
+    event per scored question and a "question.rescored" event per question
+    whose points the rescore command changed, in one insert. Call it in the
+    transaction that saves them, so the events commit or roll back with the
+    change. The relay delivers them later, off the request.
+    """
+    events = [
+        OutboxEvent(
+            kind="selection.created",
+            payload={
+                "selection": selection.pk,
+                "question": selection.question_id,
+                "game": selection.question.game_id,
+                "user": selection.user_id,
+                "option_idx": selection.option_idx,
+            },
+        )
+        for selection in selections
+    ]
+    events += [
+        OutboxEvent(
+            kind=kind,
+            payload={
+                "question": question.pk,
+                "game": question.game_id,
+                "answer_idx": question.answer_idx,
+            },
+        )
+        for kind, questions in [
+            ("question.scored", scored),
+            ("question.rescored", rescored),
+        ]
+        for question in questions
+    ]
+    if events:
+        OutboxEvent.objects.bulk_create(events)
+
+
+def to_dict(event: OutboxEvent) -> dict[str, typing.Any]:
+    return {
+        "id": event.pk,
+        "kind": event.kind,
+        "created_at": event.created_at,
+        "payload": event.payload,
+    }
+
+
+class Sink(abc.ABC):
+    """
+    Delivers a batch of events, raising if any of them was not. A batch that
+    failed is delivered again, so sinks may see an event more than once and
+    should ignore the ids they have seen.
+    """
+
+    @abc.abstractmethod
+    def deliver(self, events: typing.Sequence[OutboxEvent]) -> None: ...
+
+
+class HttpSink(Sink):
+    # one POST of {"events": [...]} to OUTBOX_HTTP_URL per batch
+    def deliver(self, events: typing.Sequence[OutboxEvent]) -> None:
+        body = json.dumps(
+            {"events": [to_dict(event) for event in events]}, cls=DjangoJSONEncoder
+        )
+        request = urllib.request.Request(
+            settings.OUTBOX_HTTP_URL,
+            data=body.encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        # urlopen raises HTTPError for responses other than 2xx
+        with urllib.request.urlopen(
+            request, timeout=settings.OUTBOX_HTTP_TIMEOUT_SECONDS
+        ):
+            pass
+
+
+class FileSink(Sink):
+    # a JSON line per event appended to OUTBOX_FILE
+    def deliver(self, events: typing.Sequence[OutboxEvent]) -> None:
+        with open(settings.OUTBOX_FILE, "a") as f:
+            for event in events:
+                f.write(json.dumps(to_dict(event), cls=DjangoJSONEncoder) + "\n")
+
+
+class HandlerSink(Sink):
+    # calls the functions registered for each event's kind with @handler
+    def __init__(self) -> None:
+        self.handlers: dict[str, list[Handler]] = collections.defaultdict(list)
+
+    def deliver(self, events: typing.Sequence[OutboxEvent]) -> None:
+        for event in events:
+            for handler in self.handlers[event.kind]:
+                handler(event)
+
+
+SINKS: dict[str, Sink] = {}
+
+
+def register(name: str, sink: Sink) -> Sink:
+    SINKS[name] = sink
+    return sink
+
+
+handlers = HandlerSink()
+register("handlers", handlers)
+register("file", FileSink())
+register("http", HttpSink())
+
+
+def handler(kind: str) -> typing.Callable[[Handler], Handler]:
+    """
+    Registers the decorated function to be called by the relay with every
+    event of ``kind``, when OUTBOX_SINKS has "handlers".
+    """
+
+    def decorator(function: Handler) -> Handler:
+        handlers.handlers[kind].append(function)
+        return function
+
+    return decorator
+
+
+def get_sinks(names: typing.Sequence[str] | None = None) -> list[Sink]:
+    names = settings.OUTBOX_SINKS if names is None else names
+    try:
+        return [SINKS[name] for name in names]
+    except KeyError as e:
+        raise ImproperlyConfigured(f"Unknown outbox sink {e.args[0]!r}")
+
+
+@dataclasses.dataclass
+class Batch:
+    delivered: int = 0
+    failed: int = 0
+    error: str = ""
+
+
+@tracing.traced
+def relay(
+    *, batch_size: int = 100, sinks: typing.Sequence[Sink] | None = None
+) -> Batch:
+    """
+    Delivers the oldest undelivered events of the current shard to every
+    sink and marks them delivered. The batch stays locked while it is
+    delivered and relays running at once skip each other's batches. When a
+    sink raises, the events of the batch count an attempt and are delivered
+    again by a later call, until OUTBOX_MAX_ATTEMPTS is reached and they are
+    left for an admin to look at.
+    """
+    sinks = get_sinks() if sinks is None else sinks
+    batch = Batch()
+    with shards.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(
+                delivered_at__isnull=True,
+                attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+            )
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return batch
+        pending = OutboxEvent.objects.filter(pk__in=[event.pk for event in events])
+        try:
+            with tracing.span("outbox.deliver", events=len(events)):
+                for sink in sinks:
+                    sink.deliver(events)
+        except Exception as e:
+            batch.failed = len(events)
+            batch.error = f"{type(e).__name__}: {e}"
+            pending.update(
+                attempts=F("attempts") + 1,
+                last_error=batch.error,
+                updated_at=timezone.now(),
+            )
+        else:
+            batch.delivered = len(events)
+            now = timezone.now()
+            pending.update(delivered_at=now, updated_at=now)
+    return batch
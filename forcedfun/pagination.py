@@ -0,0 +1,84 @@
+import dataclasses
+import typing
+
+from django.db.models import Q
+from django.db.models import QuerySet
+
+# a model instance, or a row of values_list(named=True)
+R = typing.TypeVar("R")
+
+
+@dataclasses.dataclass
+class KeysetPage(typing.Generic[R]):
+    object_list: list[R]
+    next_cursor: str | None
+
+
+def encode_cursor(values: typing.Sequence[int]) -> str:
+    return ".".join(str(value) for value in values)
+
+
+def decode_cursor(cursor: str, *, n_keys: int) -> tuple[int, ...] | None:
+    try:
+        values = tuple(int(value) for value in cursor.split("."))
+    except ValueError:
+        return None
+    if len(values) != n_keys:
+        return None
+    return values
+
+
+def seek_filter(keys: typing.Sequence[str], values: typing.Sequence[int]) -> Q:
+    # (k1, k2, ...) < (v1, v2, ...) written out so it works on every backend.
+    # The leading k1 <= v1 lets the planner turn it into an index range scan.
+    condition = Q()
+    for i, (key, value) in enumerate(zip(keys, values)):
+        equal_prefix = Q(**{k: v for k, v in zip(keys[:i], values[:i])})
+        condition |= equal_prefix & Q(**{f"{key}__lt": value})
+    return Q(**{f"{keys[0]}__lte": values[0]}) & condition
+
+
+def keyset_page(
+    queryset: QuerySet[typing.Any, R],
+    *,
+    keys: typing.Sequence[str],
+    cursor: str | None,
+    per_page: int,
+) -> KeysetPage[R]:
+    """
+    Seek-method pagination in descending ``keys`` order. Every page is a
+    ``WHERE (keys) < (cursor) ORDER BY keys DESC LIMIT per_page`` so page N
+    costs the same as page 1 when ``keys`` is covered by an index.
+    """
+    values = decode_cursor(cursor, n_keys=len(keys)) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(seek_filter(keys, values))
+    queryset = queryset.order_by(*(f"-{key}" for key in keys))
+    object_list = list(queryset[: per_page + 1])
+    next_cursor = None
+    if len(object_list) > per_page:
+        object_list = object_list[:per_page]
+        next_cursor = encode_cursor([getattr(object_list[-1], key) for key in keys])
+    return KeysetPage(object_list=object_list, next_cursor=next_cursor)
+
+
+def merge_pages(
+    pages: typing.Sequence[KeysetPage[R]],
+    *,
+    keys: typing.Sequence[str],
+    per_page: int,
+) -> KeysetPage[R]:
+    """
+    One page out of keyset pages of the same ``keys`` and cursor read from
+    several databases, as if they had been read from one.
+    """
+    object_list = sorted(
+        (obj for page in pages for obj in page.object_list),
+        key=lambda obj: [getattr(obj, key) for key in keys],
+        reverse=True,
+    )
+    next_cursor = None
+    if len(object_list) > per_page or any(page.next_cursor for page in pages):
+        object_list = object_list[:per_page]
+        next_cursor = encode_cursor([getattr(object_list[-1], key) for key in keys])
+    return KeysetPage(object_list=object_list, next_cursor=next_cursor)
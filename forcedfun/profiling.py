@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+import typing
+
+from . import sql
+
+Frame = tuple[str, str, int]
+Stack = tuple[Frame, ...]
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread from a background thread every
+    ``interval`` seconds. Cheap enough to leave running for a whole request,
+    unlike cProfile which instruments every call.
+    """
+
+    def __init__(self, *, interval: float, thread_id: int | None = None) -> None:
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples: list[tuple[Stack, float]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> Stack | None:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        return tuple(reversed(stack)) or None
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            stack = self._sample()
+            now = time.perf_counter()
+            if stack is not None:
+                self.samples.append((stack, now - last))
+            last = now
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def to_speedscope(
+    *,
+    name: str,
+    samples: typing.Sequence[tuple[Stack, float]],
+    queries: typing.Sequence[sql.QueryRecord],
+) -> dict[str, typing.Any]:
+    """
+    https://www.speedscope.app/file-format-schema.json with one sampled
+    profile for the python stacks and one for the time spent per SQL
+    statement fingerprint.
+    """
+    frames: list[dict[str, typing.Any]] = []
+    frame_index: dict[Frame, int] = {}
+
+    def index(frame: Frame) -> int:
+        if frame not in frame_index:
+            frame_index[frame] = len(frames)
+            function, file, line = frame
+            frames.append({"name": function, "file": file, "line": line})
+        return frame_index[frame]
+
+    def profile(
+        profile_name: str, stacks: typing.Sequence[tuple[Stack, float]]
+    ) -> dict[str, typing.Any]:
+        weights = [weight for _, weight in stacks]
+        return {
+            "type": "sampled",
+            "name": profile_name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": [[index(frame) for frame in stack] for stack, _ in stacks],
+            "weights": weights,
+        }
+
+    sql_stacks = [
+        (((f"SQL: {query.fingerprint}", "", 0),), query.duration) for query in queries
+    ]
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "forcedfun",
+        "activeProfileIndex": 0,
+        "profiles": [profile(name, samples), profile(f"{name} SQL", sql_stacks)],
+        "shared": {"frames": frames},
+    }
@@ -0,0 +1,189 @@
+import collections
+import dataclasses
+import time
+import typing
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models
+
+from . import answers
+from . import backfills
+from . import leaderboard
+from . import shards
+from . import tracing
+from .models import Game
+from .models import PendingPurge
+from .models import Question
+from .models import RequestProfile
+from .models import Selection
+
+# called after every batch with the model label and its rows deleted so far
+Report = typing.Callable[[str, int], None]
+
+
+@dataclasses.dataclass
+class Result:
+    # rows deleted by model label
+    deleted: collections.Counter[str] = dataclasses.field(
+        default_factory=collections.Counter
+    )
+
+
+@dataclasses.dataclass
+class Purge:
+    batch_size: int
+    sleep: float
+    report: Report | None
+    result: Result = dataclasses.field(default_factory=Result)
+    n_batches: int = 0
+
+    def delete(self, queryset: models.QuerySet[typing.Any]) -> None:
+        """
+        Deletes the rows of ``queryset`` by id in keyset batches, each its own
+        short statement, pausing ``sleep`` seconds between batches so the
+        locks and the write load are spread out.
+        """
+        model = queryset.model
+        label = model._meta.label
+        for rows in backfills.iter_batches(queryset, [], batch_size=self.batch_size):
+            # not after the last batch, nothing is left to spread out
+            if self.n_batches and self.sleep:
+                time.sleep(self.sleep)
+            self.n_batches += 1
+            pks = [pk for (pk,) in rows]
+            # with whatever cascades from them
+            self.result.deleted.update(
+                model._default_manager.filter(pk__in=pks).delete()[1]
+            )
+            if self.report:
+                self.report(label, self.result.deleted[label])
+
+    def delete_all(self, queryset: models.QuerySet[typing.Any]) -> None:
+        # the rows left, with whatever cascades from them
+        for label, n in queryset.delete()[1].items():
+            self.result.deleted[label] += n
+
+
+def make_purge(
+    batch_size: int | None, sleep: float | None, report: Report | None
+) -> Purge:
+    return Purge(
+        batch_size=settings.PURGE_BATCH_SIZE if batch_size is None else batch_size,
+        sleep=settings.PURGE_BATCH_SLEEP_SECONDS if sleep is None else sleep,
+        report=report,
+    )
+
+
+@tracing.traced
+def games(
+    game_ids: typing.Collection[int],
+    *,
+    batch_size: int | None = None,
+    sleep: float | None = None,
+    report: Report | None = None,
+) -> Result:
+    """
+    Deletes the games of the current shard with their selections, questions
+    and memberships, which do not cascade, in batches of PURGE_BATCH_SIZE
+    rows, then marks the leaderboard stale for the refresh job.
+    """
+    purge = make_purge(batch_size, sleep, report)
+    purge.delete(Selection.objects.filter(question__game__in=game_ids))
+    purge.delete(Question.objects.filter(game__in=game_ids))
+    purge.delete(Game.users.through.objects.filter(game__in=game_ids))
+    purge.delete_all(Game.objects.filter(pk__in=game_ids))
+    leaderboard.schedule_refresh()
+    return purge.result
+
+
+@tracing.traced
+def users(
+    user_ids: typing.Collection[int],
+    *,
+    batch_size: int | None = None,
+    sleep: float | None = None,
+    report: Report | None = None,
+) -> Result:
+    """
+    Deletes the users from every shard with their selections, the questions
+    they answered with everyone's selections of them, and their memberships,
+    in batches of PURGE_BATCH_SIZE rows. Their request profiles are kept
+    without the user. The answer rows of their games are rebuilt and
+    the leaderboard marked stale for the refresh job.
+    """
+    purge = make_purge(batch_size, sleep, report)
+    Membership = Game.users.through
+    for alias in shards.names():
+        with shards.using(alias):
+            selections = Selection.objects.filter(user__in=user_ids)
+            questions = Question.objects.filter(respondent__in=user_ids)
+            memberships = Membership.objects.filter(user__in=user_ids)
+            game_ids = {
+                *selections.values_list("question__game_id", flat=True),
+                *questions.values_list("game_id", flat=True),
+                *memberships.values_list("game_id", flat=True),
+            }
+            purge.delete(Selection.objects.filter(question__respondent__in=user_ids))
+            purge.delete(selections)
+            purge.delete(questions)
+            purge.delete(memberships)
+            for game_id in sorted(game_ids):
+                answers.rebuild(game_id)
+    for rows in backfills.iter_batches(
+        RequestProfile.objects.filter(user__in=user_ids),
+        [],
+        batch_size=purge.batch_size,
+    ):
+        RequestProfile.objects.filter(pk__in=[pk for (pk,) in rows]).update(user=None)
+    # the copies on the other shards first, see shards.mirror_users
+    for alias in shards.names()[1:]:
+        User.objects.using(alias).filter(pk__in=user_ids).delete()
+    purge.delete_all(User.objects.filter(pk__in=user_ids))
+    leaderboard.schedule_refresh()
+    return purge.result
+
+
+def enqueue(kind: str, ids: typing.Iterable[int], *, shard: str = "") -> None:
+    """
+    Queues the games or users for drain, with the current transaction, so a
+    request never waits for a purge.
+    """
+    PendingPurge.objects.bulk_create(
+        [PendingPurge(kind=kind, object_id=pk, shard=shard) for pk in ids]
+    )
+
+
+@tracing.traced
+def drain(
+    *,
+    batch_size: int | None = None,
+    sleep: float | None = None,
+    report: Report | None = None,
+) -> Result:
+    """
+    Purges the games and users queued so far, each game on the shard it is
+    on now, and then takes them off the queue. A drain that stops halfway is
+    repeated by the next one, purging what is gone already deletes nothing.
+    """
+    pending = list(PendingPurge.objects.order_by("id"))
+    game_ids = collections.defaultdict(list)
+    user_ids = []
+    for row in pending:
+        if row.kind == "game":
+            alias = shards.locate(
+                Game, row.shard or shards.names()[0], pk=row.object_id
+            )
+            game_ids[alias].append(row.object_id)
+        else:
+            user_ids.append(row.object_id)
+    result = Result()
+    for alias, ids in sorted(game_ids.items()):
+        with shards.using(alias):
+            purged = games(ids, batch_size=batch_size, sleep=sleep, report=report)
+        result.deleted += purged.deleted
+    if user_ids:
+        purged = users(user_ids, batch_size=batch_size, sleep=sleep, report=report)
+        result.deleted += purged.deleted
+    PendingPurge.objects.filter(pk__in=[row.pk for row in pending]).delete()
+    return result
@@ -0,0 +1,165 @@
+import dataclasses
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import typing
+
+from django.conf import settings
+from django.http import HttpRequest
+
+V = typing.TypeVar("V", bound=typing.Callable[..., typing.Any])
+
+# key hash, tokens left, last refill as unix time
+SLOT = struct.Struct("<Qdd")
+# a key lives in one of this many neighbouring slots
+PROBES = 4
+
+
+@dataclasses.dataclass(frozen=True)
+class Rate:
+    capacity: float
+    per_second: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        """
+        "10/m" is a burst of 10 refilled at 10 a minute, also "/s", "/h".
+        """
+        n, period = value.split("/")
+        seconds = {"s": 1, "m": 60, "h": 3600}[period]
+        return cls(capacity=float(n), per_second=float(n) / seconds)
+
+
+class BucketStore:
+    """
+    Token buckets in a memory mapped file, so every worker process on the
+    host shares them without a separate service. The file is a fixed table
+    of slots and a key hashes to a few neighbouring ones; when they are all
+    taken the least recently used bucket is evicted, so the file never
+    grows and needs no compaction. Updates hold an flock on the file.
+    """
+
+    def __init__(self, path: str, *, n_slots: int = 4096) -> None:
+        self.n_slots = n_slots
+        size = SLOT.size * n_slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # flock does not exclude threads sharing the descriptor
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: Rate, *, now: float | None = None) -> float:
+        """
+        Takes a token from the bucket of ``key``. Returns 0 when one was
+        left, otherwise the seconds until the next one.
+        """
+        now = time.time() if now is None else now
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        # 0 marks an empty slot
+        key_hash = int.from_bytes(digest, "little") or 1
+        start = key_hash % self.n_slots
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset = self._find_slot(start, key_hash)
+                slot_hash, tokens, updated = SLOT.unpack_from(self._map, offset)
+                if slot_hash != key_hash:
+                    tokens, updated = rate.capacity, now
+                tokens = min(rate.capacity, tokens + (now - updated) * rate.per_second)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate.per_second
+                SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+                return wait
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _find_slot(self, start: int, key_hash: int) -> int:
+        # the key's own slot, else an empty one, else the least recently used
+        oldest_offset, oldest_updated = 0, float("inf")
+        for i in range(PROBES):
+            offset = (start + i) % self.n_slots * SLOT.size
+            slot_hash, _, updated = SLOT.unpack_from(self._map, offset)
+            if slot_hash in (key_hash, 0):
+                return offset
+            if updated < oldest_updated:
+                oldest_offset, oldest_updated = offset, updated
+        return oldest_offset
+
+
+_stores: dict[tuple[str, int], BucketStore] = {}
+
+
+def get_store() -> BucketStore:
+    # an flock is shared by every process holding the same open file, so a
+    # worker forked from a process that opened the store opens its own
+    key = (settings.RATELIMIT_FILE, os.getpid())
+    if key not in _stores:
+        _stores[key] = BucketStore(settings.RATELIMIT_FILE)
+    return _stores[key]
+
+
+@dataclasses.dataclass(frozen=True)
+class Limit:
+    name: str
+    key: typing.Literal["ip", "user"]
+    methods: tuple[str, ...]
+
+
+def ratelimit(
+    name: str,
+    *,
+    key: typing.Literal["ip", "user"],
+    methods: typing.Sequence[str] = ("POST",),
+) -> typing.Callable[[V], V]:
+    """
+    Marks a view as rate limited by the RATELIMITS[name] rate per client IP
+    or per user. RateLimitMiddleware enforces it before the view; a limit
+    per IP before anything touches the database.
+    """
+
+    def decorator(view: V) -> V:
+        setattr(view, "ratelimit", Limit(name=name, key=key, methods=tuple(methods)))
+        return view
+
+    return decorator
+
+
+def client_ip(request: HttpRequest) -> str:
+    value = request.META.get(settings.RATELIMIT_IP_META, "")
+    # a proxy header holds "client, proxy1, proxy2" and the client can send
+    # any start of it, the addresses our proxies appended are at the end
+    hops = [hop.strip() for hop in str(value).split(",") if hop.strip()]
+    if not hops:
+        # a request that reached us without the proxy, e.g. a health check,
+        # is keyed by its own address instead of sharing an empty one
+        return str(request.META.get("REMOTE_ADDR", ""))
+    return hops[max(len(hops) - settings.RATELIMIT_TRUSTED_PROXIES, 0)]
+
+
+def client_key(request: HttpRequest, limit: Limit) -> str:
+    if limit.key == "user":
+        # loads the session and the user the view reads anyway, a client
+        # can drop its cookies but not its account
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"{limit.name}:user:{user.pk}"
+    return f"{limit.name}:ip:{client_ip(request)}"
+
+
+def check(request: HttpRequest, limit: Limit) -> float:
+    """
+    Seconds the client has to wait before ``limit`` lets it through, 0 when
+    it may go ahead now.
+    """
+    if not settings.RATELIMIT_ENABLED or request.method not in limit.methods:
+        return 0
+    rate = Rate.parse(settings.RATELIMITS[limit.name])
+    return get_store().take(client_key(request, limit), rate)
@@ -0,0 +1,168 @@
+import dataclasses
+import typing
+from datetime import datetime
+
+from django.db.models import Exists
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import QuerySet
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import pagination
+from . import shards
+from . import utils
+from .models import Game
+from .models import Question
+from .models import Selection
+
+# what the game and question pages render, read with values_list() into
+# slotted dataclasses rather than model instances, so a page fetches only the
+# columns it shows and builds small objects without a __dict__
+QUESTION_FIELDS = ["id", "options", "points", "scored_at", "respondent__username"]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class PlayerScore:
+    id: int
+    username: str
+    points: int
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class QuestionRow:
+    id: int
+    options: list[str]
+    points: int
+    scored_at: datetime | None
+    respondent_username: str
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class PlayerSelection:
+    id: int
+    username: str
+    option_idx: int | None
+    option_text: str | None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class PendingQuestion:
+    id: int
+    game_slug: str
+    options: list[str]
+    points: int
+    respondent_username: str
+
+
+def player_scores(game: Game) -> list[PlayerScore]:
+    """
+    The members of ``game`` by username with their points in it.
+    """
+    rows = (
+        game.users.order_by("username")
+        .annotate(
+            points=Coalesce(
+                Sum("selections__points", filter=Q(selections__question__game=game)),
+                0,
+            )
+        )
+        .values_list("id", "username", "points")
+    )
+    return [PlayerScore(*row) for row in rows]
+
+
+def question_page(
+    questions: QuerySet[Question], *, cursor: str | None, per_page: int
+) -> pagination.KeysetPage[QuestionRow]:
+    """
+    A keyset page of ``questions`` by points and id, see keyset_page.
+    """
+    page = pagination.keyset_page(
+        questions.values_list(*QUESTION_FIELDS, named=True),
+        keys=("points", "id"),
+        cursor=cursor,
+        per_page=per_page,
+    )
+    return pagination.KeysetPage(
+        object_list=[QuestionRow(*row) for row in page.object_list],
+        next_cursor=page.next_cursor,
+    )
+
+
+def question_row(question: Question) -> QuestionRow:
+    return QuestionRow(
+        id=question.pk,
+        options=list(question.options),
+        points=question.points,
+        scored_at=question.scored_at,
+        respondent_username=question.respondent.username,
+    )
+
+
+def player_selections(
+    question: Question, selections: typing.Iterable[Selection]
+) -> list[PlayerSelection]:
+    """
+    The members of the question's game but its respondent by username, with
+    the option they picked among ``selections``, the question's.
+    """
+    option_idx_by_user = {s.user_id: s.option_idx for s in selections}
+    rows = (
+        question.game.users.exclude(id=question.respondent_id)
+        .order_by("username")
+        .values_list("id", "username")
+    )
+    players = []
+    for user_id, username in rows:
+        idx = option_idx_by_user.get(user_id)
+        players.append(
+            PlayerSelection(
+                id=user_id,
+                username=username,
+                option_idx=idx,
+                option_text=None if idx is None else question.options[idx],
+            )
+        )
+    return players
+
+
+def pending_questions(user_id: int) -> list[PendingQuestion]:
+    """
+    The released questions of the user's games that the user has no
+    selection for, in one query per shard however many games the user is
+    in. A question is released as in utils.released_question: it is the
+    first unscored question of its game by points and id, and no question
+    of the game was scored in the last RELEASE_DELAY. The user's selection
+    is looked up through the selection_user_question_unique index.
+    """
+    game_questions = Question.objects.filter(game=OuterRef("game")).order_by()
+    next_question = game_questions.filter(scored_at__isnull=True).order_by(
+        "points", "id"
+    )
+    latest_scored_at = (
+        game_questions.values("game").annotate(latest=Max("scored_at")).values("latest")
+    )
+    queryset = (
+        Question.objects.filter(
+            game__users=user_id,
+            id=Subquery(next_question.values("id")[:1]),
+        )
+        .annotate(latest_scored_at=Subquery(latest_scored_at))
+        .filter(
+            Q(latest_scored_at__isnull=True)
+            | Q(latest_scored_at__lt=timezone.now() - utils.RELEASE_DELAY),
+            ~Exists(Selection.objects.filter(user=user_id, question=OuterRef("pk"))),
+        )
+        .order_by("game__slug", "id")
+        .values_list("id", "game__slug", "options", "points", "respondent__username")
+    )
+    # one query per shard
+    rows = sorted(
+        (row for alias in shards.names() for row in queryset.using(alias)),
+        key=lambda row: (row[1], row[0]),
+    )
+    return [PendingQuestion(*row) for row in rows]
@@ -0,0 +1,229 @@
+import collections
+import dataclasses
+import itertools
+import typing
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import QuerySet
+from django.db.models import Subquery
+
+from .models import Game
+from .models import Question
+from .models import Selection
+
+
+@dataclasses.dataclass(frozen=True)
+class Rule:
+    """
+    Guessers who pick the respondent's option win the question's points. The
+    respondent wins them when at least ``majority`` of the guessers were
+    right, or with ``partial_credit`` the share of the points that were
+    guessed right. A right guess earns ``streak_bonus`` more points for each
+    right guess in a row before it in the game, up to ``max_streak_bonus``.
+
+    Subclass and override ``score`` for other rules.
+    """
+
+    majority: float = 0.5
+    partial_credit: bool = False
+    streak_bonus: int = 0
+    max_streak_bonus: int = 0
+
+    @property
+    def uses_streaks(self) -> bool:
+        return self.streak_bonus > 0
+
+    def score(
+        self,
+        *,
+        selections: typing.Sequence[Selection],
+        respondent_selection: Selection,
+        points: int,
+        streaks: typing.Mapping[int, int],
+    ) -> list[Selection]:
+        n_correct = 0
+        to_update = []
+        for selection in selections:
+            if selection.option_idx == respondent_selection.option_idx:
+                bonus = self.streak_bonus * streaks.get(selection.user_id, 0)
+                selection.points = points + min(bonus, self.max_streak_bonus)
+                n_correct += 1
+            else:
+                selection.points = 0
+            to_update.append(selection)
+
+        share = n_correct / len(selections)
+        if share >= self.majority:
+            respondent_selection.points = points
+        elif self.partial_credit:
+            respondent_selection.points = round(points * share)
+        else:
+            respondent_selection.points = 0
+
+        to_update.append(respondent_selection)
+        return to_update
+
+
+RULES: dict[str, Rule] = {}
+
+
+def register(name: str, rule: Rule) -> Rule:
+    RULES[name] = rule
+    return rule
+
+
+register("classic", Rule())
+register("supermajority", Rule(majority=2 / 3))
+register("partial", Rule(partial_credit=True))
+register("streak", Rule(streak_bonus=1, max_streak_bonus=3))
+
+
+def get_rule(name: str | None = None) -> Rule:
+    name = name or settings.SCORING_RULE
+    try:
+        return RULES[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown scoring rule {name!r}")
+
+
+def update_streaks(
+    streaks: dict[int, int],
+    selections: typing.Iterable[Selection],
+    respondent_option_idx: int | None,
+) -> None:
+    for selection in selections:
+        if selection.option_idx == respondent_option_idx:
+            streaks[selection.user_id] = streaks.get(selection.user_id, 0) + 1
+        else:
+            streaks[selection.user_id] = 0
+
+
+def question_streaks(question: Question, rule: Rule | None = None) -> dict[int, int]:
+    """
+    Right guesses in a row of every player over the scored questions that
+    come before ``question`` in its game. Empty, without a query, unless the
+    rule uses streaks.
+    """
+    return streaks_before([question], rule)[question.pk]
+
+
+def streaks_before(
+    questions: typing.Sequence[Question], rule: Rule | None = None
+) -> dict[int, dict[int, int]]:
+    """
+    question_streaks of every question of ``questions`` by question id, from
+    one query of the scored selections of their games walked in game order.
+    """
+    rule = rule or get_rule()
+    streaks_by_question: dict[int, dict[int, int]] = {q.pk: {} for q in questions}
+    if not rule.uses_streaks or not questions:
+        return streaks_by_question
+
+    respondent_option_idx = Selection.objects.filter(
+        question=OuterRef("question"), user=OuterRef("question__respondent")
+    ).values("option_idx")[:1]
+    selections = (
+        Selection.objects.filter(
+            question__game__in={question.game_id for question in questions},
+            question__scored_at__isnull=False,
+        )
+        .exclude(user_id=F("question__respondent_id"))
+        .annotate(respondent_option_idx=Subquery(respondent_option_idx))
+        .order_by("question__game_id", "question__points", "question_id")
+        .values_list(
+            "question__game_id",
+            "question__points",
+            "question_id",
+            "user_id",
+            "option_idx",
+            "respondent_option_idx",
+        )
+    )
+
+    def position(question: Question) -> tuple[int, int, int]:
+        return question.game_id, question.points, question.pk
+
+    # the questions in the same order, each takes its game's streaks over
+    # the selections sorted before it
+    pending = sorted(questions, key=position, reverse=True)
+    streaks_by_game: dict[int, dict[int, int]] = collections.defaultdict(dict)
+    for row in selections.iterator(chunk_size=2000):
+        game_id, points, question_id, user_id, option_idx, answer = row
+        while pending and position(pending[-1]) <= (game_id, points, question_id):
+            question = pending.pop()
+            streaks_by_question[question.pk] = dict(streaks_by_game[question.game_id])
+        streaks = streaks_by_game[game_id]
+        streaks[user_id] = streaks.get(user_id, 0) + 1 if option_idx == answer else 0
+    for question in pending:
+        streaks_by_question[question.pk] = dict(streaks_by_game[question.game_id])
+    return streaks_by_question
+
+
+@dataclasses.dataclass
+class Change:
+    selection: Selection
+    before: int | None
+    after: int | None
+
+
+def rescore(games: QuerySet[Game], rule: Rule) -> list[Change]:
+    """
+    Scores every scored question of ``games`` again with ``rule`` from one
+    query of their questions and one streamed query of their selections, in
+    game order so streaks carry over, loading only the fields scoring reads. Returns the
+    selections whose points changed, with the new points set but not saved.
+    """
+    questions = Question.objects.filter(game__in=games, scored_at__isnull=False).only(
+        "game_id", "respondent_id", "points", "answer_idx"
+    )
+    questions_by_id = {question.pk: question for question in questions}
+    # one question's selections at a time, from a subquery rather than a
+    # list of every question id
+    selections = (
+        Selection.objects.filter(question__in=questions.values("pk"))
+        .only("question_id", "user_id", "option_idx", "points")
+        .order_by("question__game_id", "question__points", "question_id", "id")
+        .iterator(chunk_size=2000)
+    )
+    by_question = (
+        (questions_by_id[question_id], list(question_selections))
+        for question_id, question_selections in itertools.groupby(
+            selections, key=lambda selection: selection.question_id
+        )
+    )
+
+    changes = []
+    streaks_by_game: dict[int, dict[int, int]] = collections.defaultdict(dict)
+    for question, question_selections in by_question:
+        respondent_selection = None
+        others = []
+        for selection in question_selections:
+            selection.question = question
+            if selection.user_id == question.respondent_id:
+                respondent_selection = selection
+            else:
+                others.append(selection)
+        if respondent_selection is None or not others:
+            continue
+
+        streaks = streaks_by_game[question.game_id]
+        before = {selection.pk: selection.points for selection in question_selections}
+        for selection in rule.score(
+            selections=others,
+            respondent_selection=respondent_selection,
+            points=question.points,
+            streaks=streaks,
+        ):
+            if selection.points != before[selection.pk]:
+                changes.append(
+                    Change(
+                        selection=selection,
+                        before=before[selection.pk],
+                        after=selection.points,
+                    )
+                )
+        update_streaks(streaks, others, respondent_selection.option_idx)
+    return changes
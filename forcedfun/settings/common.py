@@ -1,4 +1,6 @@
 import os
+import tempfile
+import typing
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -15,13 +17,33 @@ DATABASE_URL = os.getenv(
     "DATABASE_URL", "postgres://forcedfun:@localhost:5432/forcedfun"
 )
 
-test_options = {"NAME": f"test_{DATABASE_URL.split("/")[-1]}"}
+# DATABASE_URL=sqlite://:memory: runs the tests on SQLite, see OptionsField
+test_options = (
+    {"NAME": f"test_{DATABASE_URL.split("/")[-1]}"}
+    if DATABASE_URL.startswith("postgres")
+    else {}
+)
 DATABASES = {
     "default": dj_database_url.parse(
         DATABASE_URL, conn_max_age=500, test_options=test_options
     )
 }
 
+# optional sharding of games, see forcedfun.shards. Every URL of
+# SHARD_DATABASE_URLS adds a shard next to "default", the first one, which
+# also holds the users and everything else.
+SHARD_DATABASE_URLS = [
+    url for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url
+]
+DATABASES.update(
+    (f"shard{i}", dj_database_url.parse(url, conn_max_age=500))
+    for i, url in enumerate(SHARD_DATABASE_URLS, 1)
+)
+SHARDS = ["default", *(f"shard{i}" for i in range(1, len(SHARD_DATABASE_URLS) + 1))]
+# ids of rows created on shard i start at i * SHARD_ID_SPAN + 1
+SHARD_ID_SPAN = 2**40
+DATABASE_ROUTERS = ["forcedfun.shards.ShardRouter"]
+
 DEBUG = getbool("DEBUG", False)
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -39,7 +61,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "forcedfun.middleware.TracingMiddleware",
+    "forcedfun.middleware.SlowQueryMiddleware",
+    "forcedfun.middleware.QueryInspectMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "forcedfun.middleware.RateLimitMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -48,6 +74,8 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.contrib.auth.middleware.LoginRequiredMiddleware",
     "forcedfun.middleware.RedirectMiddleware",
+    "forcedfun.middleware.ShardMiddleware",
+    "forcedfun.middleware.ProfileMiddleware",
 ]
 
 ROOT_URLCONF = "forcedfun.urls"
@@ -83,6 +111,98 @@ LOGIN_URL = reverse_lazy("login")
 LOGIN_REDIRECT_URL = reverse_lazy("index")
 LOGOUT_REDIRECT_URL = reverse_lazy("login")
 
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+
+# how often refresh_leaderboard --loop refreshes the leaderboard view when
+# scores were saved since the last refresh
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "60"))
+
+# slug to game id lookups of the join form, slugs of no game only briefly
+# as other processes do not hear of a game created with one
+GAME_ID_CACHE_SECONDS = 3600
+GAME_ID_MISSING_CACHE_SECONDS = 5
+
+# name of a rule registered in forcedfun.scoring.RULES
+SCORING_RULE = os.getenv("SCORING_RULE", "classic")
+
+# rows saved up to this long before a game state cursor are sent again, so
+# writes that commit after the poll that produced the cursor are not missed
+GAME_STATE_OVERLAP_SECONDS = float(os.getenv("GAME_STATE_OVERLAP_SECONDS", "5"))
+
+# token buckets per client, see forcedfun.ratelimit and RateLimitMiddleware.
+# Every worker on a host shares RATELIMIT_FILE.
+RATELIMIT_ENABLED = getbool("RATELIMIT_ENABLED", True)
+RATELIMIT_FILE = os.getenv(
+    "RATELIMIT_FILE", str(Path(tempfile.gettempdir(), "forcedfun-ratelimit"))
+)
+# e.g. HTTP_X_FORWARDED_FOR behind a proxy, with the number of proxies in
+# front of the app that append the address they got the request from to it
+RATELIMIT_IP_META = os.getenv("RATELIMIT_IP_META", "REMOTE_ADDR")
+RATELIMIT_TRUSTED_PROXIES = int(os.getenv("RATELIMIT_TRUSTED_PROXIES", "1"))
+RATELIMITS = {
+    "register": "5/m",
+    "login": "10/m",
+    "selection-create": "30/m",
+    "selection-batch-create": "10/m",
+}
+
+# N+1 and duplicate query detection, see forcedfun.middleware.QueryInspectMiddleware
+QUERY_INSPECT_MODE = os.getenv("QUERY_INSPECT_MODE", "off")
+QUERY_INSPECT_THRESHOLD = int(os.getenv("QUERY_INSPECT_THRESHOLD", "3"))
+QUERY_INSPECT_REPORT = os.getenv(
+    "QUERY_INSPECT_REPORT", str(REPO_DIR / "query_inspect.jsonl")
+)
+
+# request profiling, see forcedfun.middleware.ProfileMiddleware
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+# slow query log, see forcedfun.middleware.SlowQueryMiddleware
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", str(REPO_DIR / "slow_queries.log"))
+
+# tracing, see forcedfun.tracing. "console", "file" or "" to disable
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+TRACING_FILE = os.getenv("TRACING_FILE", str(REPO_DIR / "traces.jsonl"))
+
+# sinks the relay_outbox command delivers game events to, names registered
+# in forcedfun.outbox.SINKS: "handlers", "file" and "http"
+OUTBOX_SINKS = [
+    name for name in os.getenv("OUTBOX_SINKS", "handlers").split(",") if name
+]
+OUTBOX_FILE = os.getenv("OUTBOX_FILE", str(REPO_DIR / "outbox.jsonl"))
+OUTBOX_HTTP_URL = os.getenv("OUTBOX_HTTP_URL", "http://127.0.0.1:8001/events/")
+OUTBOX_HTTP_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_HTTP_TIMEOUT_SECONDS", "5"))
+# events that failed this often are no longer delivered
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+# games and users are deleted this many rows at a time, with a pause after
+# each batch, see forcedfun.purge
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+PURGE_BATCH_SLEEP_SECONDS = float(os.getenv("PURGE_BATCH_SLEEP_SECONDS", "0.1"))
+
+LOGGING: dict[str, typing.Any] = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "slowquery": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SLOW_QUERY_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "delay": True,
+        },
+    },
+    "loggers": {
+        "forcedfun.slowquery": {
+            "handlers": ["slowquery"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
 import django_stubs_ext  # noqa: E402
 
 django_stubs_ext.monkeypatch()
@@ -1,5 +1,9 @@
+import os
+
 from .common import *  # noqa: F403
 
 DEBUG = True
 
 MEDIA_URL = "/media/"
+
+QUERY_INSPECT_MODE = os.getenv("QUERY_INSPECT_MODE", "warn")
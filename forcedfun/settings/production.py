@@ -16,3 +16,6 @@ DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
 
 AWS_STORAGE_BUCKET_NAME = os.environ.get("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_REGION_NAME = os.environ.get("AWS_S3_REGION_NAME", "us-east-1")
+
+# the app runs behind the platform's load balancer, REMOTE_ADDR is its own
+RATELIMIT_IP_META = os.getenv("RATELIMIT_IP_META", "HTTP_X_FORWARDED_FOR")
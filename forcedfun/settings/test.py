@@ -1 +1,23 @@
+import os
+import tempfile
+from pathlib import Path
+
 from .common import *  # noqa: F403
+
+QUERY_INSPECT_MODE = os.getenv("QUERY_INSPECT_MODE", "raise")
+
+# the tests that need it turn it on
+RATELIMIT_ENABLED = False
+PURGE_BATCH_SLEEP_SECONDS = 0.0
+
+# the slow query tests log every query, outside the repository
+SLOW_QUERY_LOG = str(Path(tempfile.gettempdir()) / "forcedfun_slow_queries.log")
+LOGGING["handlers"]["slowquery"]["filename"] = SLOW_QUERY_LOG  # noqa: F405
+
+# the sharding tests spread games over these too, see forcedfun.shards
+for alias in ["shard1", "shard2"]:
+    test_name = DATABASES["default"].get("TEST", {}).get("NAME")  # noqa: F405
+    DATABASES[alias] = {  # noqa: F405
+        **DATABASES["default"],  # noqa: F405
+        "TEST": {"NAME": f"{test_name}_{alias}"} if test_name else {},
+    }
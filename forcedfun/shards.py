@@ -0,0 +1,260 @@
+import contextlib
+import contextvars
+import typing
+import zlib
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db import transaction
+from django.db.models import Model
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .models import AnswerRow
+from .models import Game
+from .models import Question
+from .models import Selection
+
+# tables of the models that live with their game, see ShardRouter
+SHARDED_TABLES = {
+    "forcedfun_game",
+    "forcedfun_game_users",
+    "forcedfun_question",
+    "forcedfun_selection",
+    "forcedfun_answerrow",
+    "forcedfun_outboxevent",
+}
+# tables with an id sequence, started at the shard's first id
+SEQUENCE_TABLES = sorted(SHARDED_TABLES - {"forcedfun_answerrow"})
+
+_current_shard: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "current_shard", default=None
+)
+
+
+def names() -> list[str]:
+    return list(settings.SHARDS)
+
+
+def current() -> str:
+    return _current_shard.get() or names()[0]
+
+
+@contextlib.contextmanager
+def using(alias: str) -> typing.Iterator[str]:
+    """
+    Routes the sharded models to ``alias`` inside the block.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def atomic(**kwargs: typing.Any) -> transaction.Atomic:
+    return transaction.atomic(using=current(), **kwargs)
+
+
+def for_slug(slug: str) -> str:
+    """
+    The shard a game with ``slug`` is placed on, the same in every process.
+    """
+    shards = names()
+    return shards[zlib.crc32(slug.encode()) % len(shards)]
+
+
+def first_id(alias: str) -> int:
+    # every shard hands out ids from its own SHARD_ID_SPAN, so rows keep
+    # their ids when they move to another shard
+    return names().index(alias) * settings.SHARD_ID_SPAN + 1
+
+
+def for_id(pk: int) -> str:
+    """
+    The shard a row with ``pk`` was created on.
+    """
+    shards = names()
+    return shards[min(pk // settings.SHARD_ID_SPAN, len(shards) - 1)]
+
+
+def locate(model: type[Model], guess: str, **lookup: typing.Any) -> str:
+    """
+    The shard holding the ``model`` row matching ``lookup``, trying
+    ``guess`` first. Rows are only elsewhere while rebalance_shards moves
+    them, or after it moved them for questions. With one shard, or when no
+    shard has the row, it is ``guess`` without a query.
+    """
+    shards = names()
+    if len(shards) == 1:
+        return guess
+    for alias in [guess, *(alias for alias in shards if alias != guess)]:
+        if model._default_manager.using(alias).filter(**lookup).exists():
+            return alias
+    return guess
+
+
+def locate_game(slug: str) -> str:
+    return locate(Game, for_slug(slug), slug=slug)
+
+
+def locate_question(pk: int) -> str:
+    return locate(Question, for_id(pk), pk=pk)
+
+
+def for_url_kwargs(kwargs: typing.Mapping[str, typing.Any]) -> str | None:
+    # the game slug or question pk the URL names, see ShardMiddleware
+    if "slug" in kwargs:
+        return locate_game(kwargs["slug"])
+    for key in ["pk", "question_pk"]:
+        if key in kwargs:
+            return locate_question(int(kwargs[key]))
+    return None
+
+
+def mirror_users(user_ids: typing.Iterable[int]) -> None:
+    """
+    Copies the users to the current shard, where its games refer to them
+    and join their usernames. Users log in on the first shard, the copies
+    have no usable password.
+    """
+    alias = current()
+    if alias == names()[0]:
+        return
+    users = [
+        User(pk=pk, username=username, password="!")
+        for pk, username in User.objects.using(names()[0])
+        .filter(pk__in=list(user_ids))
+        .values_list("pk", "username")
+    ]
+    User.objects.using(alias).bulk_create(
+        users, update_conflicts=True, unique_fields=["id"], update_fields=["username"]
+    )
+
+
+class ShardRouter:
+    """
+    Sends the models of SHARDED_TABLES to the shard of the current block,
+    see using(), or to the shard of the instance they are reached from.
+    Everything else stays on the first shard. Every shard has every table.
+    """
+
+    def db_for_model(self, model: type[Model], **hints: typing.Any) -> str | None:
+        if model._meta.db_table not in SHARDED_TABLES:
+            return None
+        instance = hints.get("instance")
+        if (
+            instance is not None
+            and instance._meta.db_table in SHARDED_TABLES
+            and instance._state.db
+        ):
+            return typing.cast(str, instance._state.db)
+        return current()
+
+    db_for_read = db_for_model
+    db_for_write = db_for_model
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints: typing.Any) -> bool:
+        # users are mirrored to every shard
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, **hints: typing.Any) -> bool:
+        return True
+
+
+@receiver(post_migrate)
+def prepare_after_migrate(sender: AppConfig, using: str, **kwargs: typing.Any) -> None:
+    if sender.label == "forcedfun" and using in names()[1:]:
+        prepare(using)
+
+
+def prepare(alias: str) -> None:
+    """
+    Moves the id sequences of the sharded tables on ``alias`` to its
+    first_id, unless they are past it. Runs after migrating a shard and
+    before rebalance_shards moves games.
+    """
+    connection = connections[alias]
+    last_id = first_id(alias) - 1
+    if last_id == 0:
+        return
+    with connection.cursor() as cursor:
+        for table in SEQUENCE_TABLES:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {table})))",
+                    [table, last_id],
+                )
+            else:
+                # SQLite keeps AUTOINCREMENT counters in sqlite_sequence
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = %s", [table])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) "
+                    f"SELECT %s, MAX(%s, COALESCE(MAX(id), 0)) FROM {table}",
+                    [table, last_id],
+                )
+
+
+def delete_game(alias: str, game_id: int) -> None:
+    # children first, their foreign keys are DO_NOTHING
+    Selection.objects.using(alias).filter(question__game_id=game_id).delete()
+    Question.objects.using(alias).filter(game_id=game_id).delete()
+    Game.objects.using(alias).filter(pk=game_id).delete()
+
+
+def copy(alias: str, objs: typing.Sequence[Model]) -> None:
+    if not objs:
+        return
+    model = type(objs[0])
+    manager = model._default_manager.using(alias)
+    fields = [
+        field.attname
+        for field in model._meta.fields
+        if field.name in ["created_at", "updated_at"]
+    ]
+    stamps = [[getattr(obj, field) for field in fields] for obj in objs]
+    manager.bulk_create(objs, batch_size=1000)
+    if fields:
+        # bulk_create stamps the copies with the current time
+        for obj, values in zip(objs, stamps):
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+        manager.bulk_update(objs, fields, batch_size=1000)
+
+
+def move_game(game_id: int, source: str, target: str) -> None:
+    """
+    Moves the game with its members, questions, selections and answer rows
+    from ``source`` to ``target``, keeping their ids. It is copied in a
+    transaction on ``target`` and then deleted in one on ``source``. A move
+    that failed in between runs again from the start, the copy replacing
+    what the failed one left.
+    """
+    Membership = Game.users.through
+    game = Game.objects.using(source).get(pk=game_id)
+    memberships = list(Membership.objects.using(source).filter(game_id=game_id))
+    questions = list(Question.objects.using(source).filter(game_id=game_id))
+    selections = list(Selection.objects.using(source).filter(question__game_id=game_id))
+    answer_rows = list(AnswerRow.objects.using(source).filter(game_id=game_id))
+    with using(target):
+        mirror_users(
+            {membership.user_id for membership in memberships}
+            | {question.respondent_id for question in questions}
+            | {selection.user_id for selection in selections}
+        )
+    with transaction.atomic(using=target):
+        delete_game(target, game_id)
+        tables: list[typing.Sequence[Model]] = [
+            [game],
+            memberships,
+            questions,
+            selections,
+            answer_rows,
+        ]
+        for objs in tables:
+            copy(target, objs)
+    with transaction.atomic(using=source):
+        delete_game(source, game_id)
@@ -0,0 +1,228 @@
+import collections
+import contextlib
+import dataclasses
+import os
+import re
+import time
+import traceback
+import typing
+
+from django.db import connection
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.dispatch import Signal
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST_RE = re.compile(r"\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# sent with a QueryReport for every request QueryInspectMiddleware inspects
+query_inspected = Signal()
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+# frames from these files are instrumentation, never the origin of a query
+INSTRUMENTATION_FILES = {
+    os.path.join(PACKAGE_DIR, "sql.py"),
+    os.path.join(PACKAGE_DIR, "middleware.py"),
+}
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Normalize a statement to its shape: literals become ``?`` and
+    ``IN (%s, %s, ...)`` lists of any length collapse to ``(...)`` so the
+    same ORM construct always maps to the same fingerprint.
+    """
+    sql = STRING_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = PLACEHOLDER_LIST_RE.sub("(...)", sql)
+    sql = sql.replace("%s", "?")
+    return WHITESPACE_RE.sub(" ", sql).strip()
+
+
+def call_site() -> str:
+    """
+    The innermost frame of this package that is not instrumentation, e.g.
+    ``forcedfun/views.py:112 in game_detail_view``.
+    """
+    for frame in reversed(traceback.extract_stack()):
+        if (
+            frame.filename.startswith(PACKAGE_DIR)
+            and frame.filename not in INSTRUMENTATION_FILES
+        ):
+            filename = os.path.relpath(frame.filename, os.path.dirname(PACKAGE_DIR))
+            return f"{filename}:{frame.lineno} in {frame.name}"
+    return ""
+
+
+def explain(sql: str, params: typing.Any, *, using: str = "default") -> str:
+    """
+    EXPLAIN (ANALYZE, BUFFERS) runs the statement again, so only SELECTs are
+    explained and only on Postgres.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql" or not sql.lstrip().upper().startswith(
+        "SELECT"
+    ):
+        return ""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def table_sizes(tables: typing.Sequence[str]) -> dict[str, dict[str, int]]:
+    """
+    Bytes on disk of each table's heap, its TOAST table and its indexes, on
+    Postgres, empty elsewhere.
+    """
+    if connection.vendor != "postgresql":
+        return {}
+    sizes = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(
+                "SELECT pg_relation_size(%s::regclass), "
+                "pg_table_size(%s::regclass) - pg_relation_size(%s::regclass), "
+                "pg_indexes_size(%s::regclass)",
+                [table] * 4,
+            )
+            heap, toast, indexes = cursor.fetchone()
+            sizes[table] = {"heap": heap, "toast": toast, "indexes": indexes}
+    return sizes
+
+
+@dataclasses.dataclass
+class QueryRecord:
+    sql: str
+    params: typing.Any
+    duration: float
+    call_site: str = ""
+    # the database alias it ran on
+    alias: str = "default"
+    # the exception it raised, such as a statement timeout
+    error: str = ""
+
+    @property
+    def fingerprint(self) -> str:
+        return fingerprint(self.sql)
+
+
+@contextlib.contextmanager
+def execute_wrapper(wrapper: typing.Callable[..., typing.Any]) -> typing.Iterator[None]:
+    """
+    ``connection.execute_wrapper`` on every database, the shards too.
+    """
+    with contextlib.ExitStack() as stack:
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(wrapper))
+        yield
+
+
+class QueryRecorder:
+    """
+    ``execute_wrapper`` that keeps every statement run inside it.
+    """
+
+    def __init__(self) -> None:
+        self.queries: list[QueryRecord] = []
+
+    def __call__(
+        self,
+        execute: typing.Callable[..., typing.Any],
+        sql: str,
+        params: typing.Any,
+        many: bool,
+        context: dict[str, CursorWrapper],
+    ) -> typing.Any:
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries.append(
+                QueryRecord(
+                    sql=sql,
+                    params=params,
+                    duration=duration,
+                    alias=context["connection"].alias,
+                )
+            )
+
+
+class SlowQueryRecorder:
+    """
+    ``execute_wrapper`` that keeps statements slower than ``threshold``
+    seconds along with the code that ran them, the ones that raised too.
+    """
+
+    def __init__(self, *, threshold: float) -> None:
+        self.threshold = threshold
+        self.queries: list[QueryRecord] = []
+
+    def __call__(
+        self,
+        execute: typing.Callable[..., typing.Any],
+        sql: str,
+        params: typing.Any,
+        many: bool,
+        context: dict[str, CursorWrapper],
+    ) -> typing.Any:
+        start = time.perf_counter()
+        error = ""
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                self.queries.append(
+                    QueryRecord(
+                        sql=sql,
+                        params=params,
+                        duration=duration,
+                        call_site=call_site(),
+                        alias=context["connection"].alias,
+                        error=error,
+                    )
+                )
+
+
+@dataclasses.dataclass
+class QueryReport:
+    url_name: str
+    n_queries: int
+    # fingerprint -> number of times the statement shape ran
+    repeated: dict[str, int]
+    # sql -> number of times the exact statement and params ran
+    duplicates: dict[str, int]
+
+    @property
+    def has_problems(self) -> bool:
+        return bool(self.repeated or self.duplicates)
+
+    def __str__(self) -> str:
+        lines = [f"{self.url_name}: {self.n_queries} queries"]
+        for sql, count in self.repeated.items():
+            lines.append(f"  repeated {count}x: {sql}")
+        for sql, count in self.duplicates.items():
+            lines.append(f"  duplicate {count}x: {sql}")
+        return "\n".join(lines)
+
+
+def inspect_queries(
+    queries: typing.Sequence[QueryRecord], *, url_name: str, threshold: int
+) -> QueryReport:
+    shapes = collections.Counter(query.fingerprint for query in queries)
+    # the same statement on each shard is not a duplicate
+    exact = collections.Counter(
+        (query.sql, repr(query.params), query.alias) for query in queries
+    )
+    return QueryReport(
+        url_name=url_name,
+        n_queries=len(queries),
+        repeated={sql: n for sql, n in shapes.items() if n > threshold},
+        duplicates={sql: n for (sql, *_), n in exact.items() if n > 1},
+    )
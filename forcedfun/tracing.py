@@ -0,0 +1,134 @@
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import json
+import secrets
+import sys
+import time
+import typing
+
+from django.conf import settings
+
+P = typing.ParamSpec("P")
+R = typing.TypeVar("R")
+
+
+@dataclasses.dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    start_time_unix_nano: int
+    end_time_unix_nano: int = 0
+    attributes: dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+    # finished spans of the whole trace, shared by every span in it
+    finished: list["Span"] = dataclasses.field(default_factory=list, repr=False)
+
+    def to_otlp(self) -> dict[str, typing.Any]:
+        attributes = []
+        for key, value in self.attributes.items():
+            if isinstance(value, bool):
+                attributes.append({"key": key, "value": {"boolValue": value}})
+            elif isinstance(value, int):
+                attributes.append({"key": key, "value": {"intValue": str(value)}})
+            else:
+                attributes.append({"key": key, "value": {"stringValue": str(value)}})
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano),
+            "attributes": attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def current_trace_id() -> str:
+    current = _current_span.get()
+    return current.trace_id if current else ""
+
+
+def export(spans: typing.Sequence[Span]) -> None:
+    """
+    One OTLP/JSON ExportTraceServiceRequest per trace, written to stderr
+    ("console") or appended to TRACING_FILE ("file").
+    """
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": "forcedfun"}},
+                        {
+                            "key": "service.version",
+                            "value": {"stringValue": settings.COMMIT},
+                        },
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "forcedfun"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+    line = json.dumps(request) + "\n"
+    if settings.TRACING_EXPORTER == "console":
+        sys.stderr.write(line)
+    elif settings.TRACING_EXPORTER == "file":
+        with open(settings.TRACING_FILE, "a") as f:
+            f.write(line)
+
+
+@contextlib.contextmanager
+def span(name: str, /, **attributes: typing.Any) -> typing.Iterator[Span | None]:
+    """
+    Child of the current span, or the root of a new trace. A no-op unless
+    TRACING_EXPORTER is set. The trace is exported when its root ends.
+    """
+    if not settings.TRACING_EXPORTER:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_span_id=parent.span_id if parent else "",
+        start_time_unix_nano=time.time_ns(),
+        attributes=attributes,
+        finished=parent.finished if parent else [],
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["exception.type"] = type(e).__name__
+        raise
+    finally:
+        current.end_time_unix_nano = time.time_ns()
+        _current_span.reset(token)
+        current.finished.append(current)
+        if parent is None:
+            export(current.finished)
+
+
+def traced(func: typing.Callable[P, R]) -> typing.Callable[P, R]:
+    @functools.wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -6,22 +6,37 @@ from django.urls import path
 from django.conf import settings
 
 from . import views
+from .ratelimit import ratelimit
 
 urlpatterns = [
     path("", views.index_view, name="index"),
     path(
-        "login/", LoginView.as_view(template_name="forcedfun/login.html"), name="login"
+        "login/",
+        ratelimit("login", key="ip")(
+            LoginView.as_view(template_name="forcedfun/login.html")
+        ),
+        name="login",
     ),
     path("register/", views.register_view, name="register"),
     path("logout/", LogoutView.as_view(), name="logout"),
     path("health/", views.health_view, name="health"),
     path("admin/", admin.site.urls),
+    path("join/<str:code>/", views.join_view, name="join"),
     path("game/<slug:slug>/", views.game_detail_view, name="game-detail"),
+    path("game/<slug:slug>/grid/", views.game_grid_view, name="game-grid"),
+    path("api/game/<slug:slug>/", views.game_state_view, name="game-state"),
+    path("leaderboard/", views.leaderboard_view, name="leaderboard"),
+    path("history/", views.selection_history_view, name="selection-history"),
     path(
         "question/<int:question_pk>/selection/create/",
-        views.SelectionCreateView.as_view(),
+        ratelimit("selection-create", key="user")(views.SelectionCreateView.as_view()),
         name="selection-create",
     ),
+    path(
+        "api/selections/",
+        views.selection_batch_create_view,
+        name="selection-batch-create",
+    ),
     path("question/<int:pk>/", views.question_detail_view, name="question-detail"),
     path(
         "question/<int:pk>/score/",
@@ -1,37 +1,219 @@
+import collections
 import typing
+from datetime import timedelta
 
 from django.contrib.auth.models import User
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
 from django.http import HttpRequest
 from django.contrib import messages
+from django.utils import timezone
 
+from . import leaderboard
+from . import shards
+from . import scoring
+from . import tracing
 from .errors import Http302
-from .models import Selection, Game
+from .loaders import get_loader
+from .models import Selection, Game, Question
 
+# how long after a question is scored the game's next question is released
+RELEASE_DELAY = timedelta(hours=1)
 
+
+@tracing.traced
 def score_selections(
     *,
     selections: typing.Sequence[Selection],
     respondent_selection: Selection,
     points: int,
+    streaks: typing.Mapping[int, int] | None = None,
 ) -> typing.Sequence[Selection]:
-    n_correct = 0
-    to_update = []
-    n_selections = len(selections)
+    # SCORING_RULE picks the rule, see forcedfun.scoring
+    return scoring.get_rule().score(
+        selections=selections,
+        respondent_selection=respondent_selection,
+        points=points,
+        streaks=streaks or {},
+    )
+
+
+def save_points(selections: typing.Sequence[Selection]) -> None:
+    # bulk_update skips auto_now fields, and the game state API polls by
+    # updated_at, so it is set here
+    now = timezone.now()
     for selection in selections:
-        if selection.option_idx == respondent_selection.option_idx:
-            selection.points = points
-            n_correct += 1
-        else:
-            selection.points = 0
-        to_update.append(selection)
+        selection.updated_at = now
+    Selection.objects.bulk_update(
+        selections, fields=["points", "updated_at"], batch_size=1000
+    )
+
+
+@tracing.traced
+def score_ready_questions(question_ids: typing.Iterable[int]) -> list[int]:
+    """
+    Scores every question of ``question_ids`` that all members of its game
+    have answered, the same rule SelectionCreateView applies to one question,
+    with a fixed number of queries however many questions are ready. Pass the
+    ids lock_unscored returned, in the same transaction. Returns the ids of
+    the scored questions.
+    """
+    n_selections = (
+        Selection.objects.filter(question=OuterRef("pk"))
+        .values("question")
+        .annotate(n=Count("*"))
+        .values("n")
+    )
+    questions = list(
+        Question.objects.filter(pk__in=question_ids)
+        .annotate(
+            n_selections=Coalesce(Subquery(n_selections), 0),
+            n_users=Count("game__users"),
+        )
+        .filter(n_selections=F("n_users"))
+    )
+    return score_questions(questions)
+
+
+def lock_unscored(question_ids: typing.Iterable[int]) -> list[int]:
+    """
+    Locks the questions of ``question_ids`` that are not scored yet until
+    the transaction ends and returns their ids. Every path that scores
+    questions takes the lock first, so a question is scored once. Locked in
+    id order, so two of them cannot wait on each other.
+    """
+    return list(
+        Question.objects.select_for_update(of=("self",))
+        .filter(pk__in=question_ids, scored_at__isnull=True)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def score_questions(questions: typing.Sequence[Question]) -> list[int]:
+    """
+    Scores every question of ``questions`` that has the respondent's and at
+    least one other selection, from one query of their selections, one of
+    their streaks when the rule uses them, one bulk update of the points and
+    one update of the questions. Returns the ids of the scored questions.
+    """
+    streaks = scoring.streaks_before(questions)
+    selections_by_question = collections.defaultdict(list)
+    for selection in Selection.objects.filter(question__in=questions):
+        selections_by_question[selection.question_id].append(selection)
+
+    scored_selections: list[Selection] = []
+    scored_question_ids = []
+    for question in questions:
+        selections = selections_by_question[question.pk]
+        respondent_selection = None
+        others = []
+        for selection in selections:
+            if selection.user_id == question.respondent_id:
+                respondent_selection = selection
+            else:
+                others.append(selection)
+        if respondent_selection is None or not others:
+            continue
+        scored_selections.extend(
+            score_selections(
+                selections=others,
+                respondent_selection=respondent_selection,
+                points=question.points,
+                streaks=streaks[question.pk],
+            )
+        )
+        scored_question_ids.append(question.pk)
+
+    if scored_question_ids:
+        save_points(scored_selections)
+        now = timezone.now()
+        Question.objects.filter(pk__in=scored_question_ids).update(
+            scored_at=now, updated_at=now
+        )
+        leaderboard.schedule_refresh()
+    return scored_question_ids
+
+
+def released_question(game: Game) -> Question | None:
+    """
+    The next unscored question of ``game`` if it has been released. The first
+    question is released straight away, the others an hour after the latest
+    question was scored.
+    """
+    questions = game.questions.order_by("points", "id")
+    latest_scored_at = questions.aggregate(latest_scored_at=Max("scored_at"))[
+        "latest_scored_at"
+    ]
+    next_question = (
+        questions.filter(scored_at__isnull=True).select_related("respondent").first()
+    )
+    if latest_scored_at is None:
+        return next_question
+    if timezone.now() - latest_scored_at > RELEASE_DELAY:
+        return next_question
+    return None
+
+
+def add_members(game: Game, user_ids: typing.Iterable[int]) -> int:
+    """
+    Adds the users to ``game`` with batched inserts into the membership
+    table, without loading the users or the current members. Returns how
+    many were not members yet.
+    """
+    Membership = Game.users.through
+    user_ids = set(user_ids)
+    shards.mirror_users(user_ids)
+    members = set(
+        Membership.objects.filter(game=game, user_id__in=user_ids).values_list(
+            "user_id", flat=True
+        )
+    )
+    new_members = [
+        Membership(game_id=game.pk, user_id=user_id)
+        for user_id in sorted(user_ids - members)
+    ]
+    # a concurrent join of the same user is not an error
+    Membership.objects.bulk_create(new_members, batch_size=1000, ignore_conflicts=True)
+    return len(new_members)
+
+
+def remove_members(game: Game, user_ids: typing.Iterable[int]) -> int:
+    """
+    Removes the users from ``game`` with one delete. Returns how many were
+    members.
+    """
+    n_deleted, _ = Game.users.through.objects.filter(
+        game=game, user_id__in=set(user_ids)
+    ).delete()
+    return n_deleted
+
+
+def option_percentages(
+    option_idx_list: typing.Sequence[int], *, n_options: int
+) -> list[int]:
+    option_pcts = []
+    n_option_idx_list = len(option_idx_list)
+    counter = collections.Counter(option_idx_list)
+    for i in range(n_options):
+        value = counter.get(i, 0)
+        try:
+            pct = (value / n_option_idx_list) * 100
+        except ZeroDivisionError:
+            pct = 0
+        option_pcts.append(round(pct))
+    return option_pcts
 
-    if (n_correct / n_selections) >= 0.5:
-        respondent_selection.points = points
-    else:
-        respondent_selection.points = 0
 
-    to_update.append(respondent_selection)
-    return to_update
+def getint(value: str | None) -> int | None:
+    try:
+        return int(value or "")
+    except ValueError:
+        return None
 
 
 def check_or_302(condition: bool, *, redirect_to: str, message: str = "") -> None:
@@ -43,10 +225,10 @@ class AuthenticatedHttpRequest(HttpRequest):
     user: User
 
 
+@tracing.traced
 def user_in_game_check_or_302(
     request: AuthenticatedHttpRequest, game: Game, *, redirect_to: str
 ) -> None:
-    exists = game.users.filter(id=request.user.id).exists()
-    if not exists:
+    if request.user.id not in get_loader(request).game_user_ids(game):
         messages.warning(request, f"Please join {game.slug} to continue.")
         raise Http302(redirect_to)
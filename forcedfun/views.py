@@ -1,22 +1,24 @@
 import collections
+import json
 import typing
+from datetime import UTC
+from datetime import datetime
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_not_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.models import User
-from django.db.models import Max
-from django.db.models import OuterRef
 from django.db.models import Q
-from django.db.models import Subquery
 from django.db.models import Sum
 from django.db.models.functions import Coalesce
 from django.http import HttpRequest
 from django.http import HttpResponse
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from django.urls import reverse
@@ -24,14 +26,26 @@ from django.utils import timezone
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.views import View
 from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_POST
 
 from .errors import Http302
 from .forms import GameForm
 from .forms import SelectionForm
+from .loaders import get_loader
 
 from .models import Game
 from .models import Question
 from .models import Selection
+from .ratelimit import ratelimit
+from . import answers
+from . import invites
+from . import leaderboard
+from . import outbox
+from . import pagination
+from . import readmodels
+from . import scoring
+from . import shards
+from . import tracing
 from . import utils
 from .utils import AuthenticatedHttpRequest
 
@@ -41,16 +55,51 @@ def health_view(request: HttpRequest) -> HttpResponse:
     return HttpResponse("ok")
 
 
+def join_and_redirect(
+    request: AuthenticatedHttpRequest, game_id: int, slug: str
+) -> HttpResponse:
+    """
+    Joins the game and redirects to it. A join that adds nobody is a member
+    joining again, who goes to the game all the same, or a game deleted
+    since its id was cached or its invite was made.
+    """
+    if (
+        not invites.join(game_id, request.user.id)
+        and not Game.objects.filter(pk=game_id).exists()
+    ):
+        invites.forget_slug_id(slug)
+        messages.warning(request, "This game no longer exists.")
+        return HttpResponseRedirect(reverse("index"))
+    return HttpResponseRedirect(reverse("game-detail", kwargs={"slug": slug}))
+
+
 @require_GET
 def index_view(request: AuthenticatedHttpRequest) -> HttpResponse:
     form = GameForm(request.GET or None)
-    if form.is_valid():
-        game = Game.objects.filter(slug=form.cleaned_data["slug"]).get()
-        game.users.add(request.user)
-        return HttpResponseRedirect(reverse("game-detail", kwargs={"slug": game.slug}))
-    return render(request, "forcedfun/index.html", {"form": form})
+    slug = request.GET.get("slug")
+    with shards.using(shards.locate_game(slug) if slug else shards.current()):
+        if form.is_valid():
+            return join_and_redirect(
+                request, form.cleaned_data["game_id"], form.cleaned_data["slug"]
+            )
+    context = {
+        "form": form,
+        "pending_questions": readmodels.pending_questions(request.user.id),
+    }
+    return render(request, "forcedfun/index.html", context)
+
+
+@require_GET
+def join_view(request: AuthenticatedHttpRequest, code: str) -> HttpResponse:
+    invite = invites.read_code(code)
+    if invite is None:
+        messages.warning(request, "This invite link is not valid.")
+        return HttpResponseRedirect(reverse("index"))
+    with shards.using(shards.locate_game(invite.slug)):
+        return join_and_redirect(request, invite.game_id, invite.slug)
 
 
+@ratelimit("register", key="ip")
 @login_not_required
 def register_view(request: HttpRequest) -> HttpResponse:
     form = UserCreationForm[User](request.POST or None)
@@ -72,90 +121,138 @@ def register_view(request: HttpRequest) -> HttpResponse:
 def game_detail_view(request: AuthenticatedHttpRequest, slug: str) -> HttpResponse:
     game = get_object_or_404(Game, slug=slug)
     utils.user_in_game_check_or_302(request, game, redirect_to=reverse("index"))
-    sum_filter = Q(selections__question__game=game)
-    users = game.users.order_by("username").annotate(
-        points=Coalesce(Sum("selections__points", filter=sum_filter), 0)
+    scored_questions = game.questions.filter(scored_at__isnull=False)
+    cursor = request.GET.get("after")
+    page = readmodels.question_page(
+        scored_questions, cursor=cursor, per_page=settings.PAGE_SIZE
     )
-    ordered_questions = game.questions.order_by("points", "id")
-    questions = list(
-        ordered_questions.exclude(scored_at__isnull=True).select_related("respondent")
+    questions = page.object_list
+    # questions are numbered oldest first, so a page needs to know how many
+    # scored questions sit above it. The first page counts, later pages are
+    # handed the number through the "older" link.
+    start = utils.getint(request.GET.get("start"))
+    if start is None:
+        start = scored_questions.count()
+
+    if not cursor:
+        next_question = utils.released_question(game)
+        if next_question is not None:
+            questions.insert(0, readmodels.question_row(next_question))
+            start += 1
+
+    numbered_questions = [(start - i, question) for i, question in enumerate(questions)]
+    context = {
+        "game": game,
+        "invite_url": request.build_absolute_uri(
+            reverse("join", kwargs={"code": invites.make_code(game)})
+        ),
+        "numbered_questions": numbered_questions,
+        "players": readmodels.player_scores(game),
+        "next_cursor": page.next_cursor,
+        "next_start": start - len(questions),
+    }
+    with tracing.span("render", template="forcedfun/game_detail.html"):
+        return render(request, "forcedfun/game_detail.html", context)
+
+
+@require_GET
+def game_grid_view(request: AuthenticatedHttpRequest, slug: str) -> HttpResponse:
+    game = get_object_or_404(Game, slug=slug)
+    utils.user_in_game_check_or_302(request, game, redirect_to=reverse("index"))
+    grid = answers.read(
+        answers.game_rows(game.pk),
+        get_loader(request).game_user_ids(game),
+        request.user.id,
     )
-    latest_scored_at = ordered_questions.filter(scored_at__isnull=False).aggregate(
-        latest_scored_at=Max("scored_at")
-    )["latest_scored_at"]
-    delta = timezone.now() - (latest_scored_at or timezone.now())
-    next_question = (
-        ordered_questions.filter(scored_at__isnull=True)
-        .select_related("respondent")
-        .first()
+    usernames = dict(
+        User.objects.filter(pk__in=grid.user_ids).values_list("id", "username")
     )
-    if latest_scored_at is None and next_question is not None:  # pragma: no cover
-        # if it's the first question, always show it
-        questions.append(next_question)
-    elif delta > timedelta(seconds=3600) and next_question:  # pragma: no cover
-        # if it's the second question, make sure it's been 12 hours since the last question was complete
-        questions.append(next_question)
-
     context = {
         "game": game,
-        "questions": questions,
-        "users": users,
+        "players": [
+            (usernames.get(player.user_id, ""), player) for player in grid.accuracy
+        ],
+        "rows": grid.rows,
+    }
+    with tracing.span("render", template="forcedfun/game_grid.html"):
+        return render(request, "forcedfun/game_grid.html", context)
+
+
+@require_GET
+def selection_history_view(request: AuthenticatedHttpRequest) -> HttpResponse:
+    # a page from every shard, ids are unique across them
+    pages = [
+        pagination.keyset_page(
+            request.user.selections.using(alias).select_related("question__game"),
+            keys=("id",),
+            cursor=request.GET.get("after"),
+            per_page=settings.PAGE_SIZE,
+        )
+        for alias in shards.names()
+    ]
+    page = pagination.merge_pages(pages, keys=("id",), per_page=settings.PAGE_SIZE)
+    context = {
+        "selections": page.object_list,
+        "next_cursor": page.next_cursor,
     }
-    return render(request, "forcedfun/game_detail.html", context)
+    return render(request, "forcedfun/selection_history.html", context)
+
+
+@require_GET
+def leaderboard_view(request: AuthenticatedHttpRequest) -> HttpResponse:
+    page = pagination.keyset_page(
+        leaderboard.rows().select_related("user"),
+        keys=("points", "user_id"),
+        cursor=request.GET.get("after"),
+        per_page=settings.PAGE_SIZE,
+    )
+    # ranks continue from the previous page through the "next" link
+    start = utils.getint(request.GET.get("start")) or 0
+    context = {
+        "ranked_rows": [(start + i + 1, row) for i, row in enumerate(page.object_list)],
+        "next_cursor": page.next_cursor,
+        "next_start": start + len(page.object_list),
+    }
+    return render(request, "forcedfun/leaderboard.html", context)
 
 
 @require_GET
 def question_detail_view(request: AuthenticatedHttpRequest, pk: int) -> HttpResponse:
-    question = get_object_or_404(Question, pk=pk)
+    loader = get_loader(request)
+    question = loader.question_or_404(pk)
     utils.user_in_game_check_or_302(
         request, question.game, redirect_to=reverse("index")
     )
     # if selection does not exists for this player then redirect to selection create
     check = (
         question.scored_at is None
-        and not Selection.objects.filter(question=question, user=request.user).exists()
+        and loader.user_selection(question, request.user.id) is None
     )
     utils.check_or_302(
         check,
         redirect_to=reverse("selection-create", kwargs={"question_pk": question.pk}),
     )
 
-    respondent_selection = Selection.objects.filter(
-        question=question, user=question.respondent
-    ).first()
-
-    question_selections = (
-        Selection.objects.filter(question=question)
-        .exclude(user=question.respondent)
-        .filter(user=OuterRef("pk"))
+    respondent_selection = loader.user_selection(question, question.respondent_id)
+    players = readmodels.player_selections(
+        question, loader.question_selections(question)
     )
-    game = question.game
-    users = game.users.exclude(id=question.respondent_id).annotate(
-        option_text=Subquery(question_selections[:1].values("option_text")),
-        option_idx=Subquery(question_selections[:1].values("option_idx")),
+    option_idx_list = [p.option_idx for p in players if p.option_idx is not None]
+    question_selections_exist = bool(option_idx_list)
+    option_pcts = utils.option_percentages(
+        option_idx_list, n_options=len(question.options)
     )
-    option_pcts = []
-    option_idx_list = [user.option_idx for user in users if user.option_idx is not None]
-    n_option_idx_list = len(option_idx_list)
-    question_selections_exist = bool(n_option_idx_list)
-    counter = collections.Counter(option_idx_list)
-    for i, _ in enumerate(question.options):
-        value = counter.get(i, 0)
-        try:
-            pct = (value / n_option_idx_list) * 100
-        except ZeroDivisionError:
-            pct = 0
-        option_pcts.append(round(pct))
 
     context = {
         "respondent_selection": respondent_selection,
-        "users": users,
-        "game": game,
+        "players": players,
+        "game": question.game,
         "question": question,
         "option_pcts": option_pcts,
         "question_selections_exist": question_selections_exist,
     }
-    return render(request, "forcedfun/question_detail.html", context)
+    with tracing.span("render", template="forcedfun/question_detail.html"):
+        return render(request, "forcedfun/question_detail.html", context)
 
 
 class QuestionScoreView(UserPassesTestMixin, View):
@@ -165,9 +262,10 @@ class QuestionScoreView(UserPassesTestMixin, View):
     def get_respodent_selection_or_302(
         self, request: AuthenticatedHttpRequest, question: Question
     ) -> Selection:
-        try:
-            respondent_selection = question.selections.get(user=question.respondent)
-        except Selection.DoesNotExist:
+        respondent_selection = get_loader(request).user_selection(
+            question, question.respondent_id
+        )
+        if respondent_selection is None:
             messages.warning(
                 request, "Unable to score. Respondent selection not found."
             )
@@ -178,7 +276,11 @@ class QuestionScoreView(UserPassesTestMixin, View):
     def get_selections_or_302(
         self, request: AuthenticatedHttpRequest, question: Question
     ) -> typing.Sequence[Selection]:
-        selections = list(question.selections.exclude(user=question.respondent))
+        selections = [
+            selection
+            for selection in get_loader(request).question_selections(question)
+            if selection.user_id != question.respondent_id
+        ]
         if len(selections) == 0:
             messages.warning(
                 request, "Unable to score. No non-respondent selections found"
@@ -188,17 +290,23 @@ class QuestionScoreView(UserPassesTestMixin, View):
         return selections
 
     def post(self, request: AuthenticatedHttpRequest, pk: int) -> HttpResponse:
-        question = get_object_or_404(Question, pk=pk)
+        question = get_loader(request).question_or_404(pk)
         respondent_selection = self.get_respodent_selection_or_302(request, question)
         selections = self.get_selections_or_302(request, question)
         scored_selections = utils.score_selections(
             selections=selections,
             respondent_selection=respondent_selection,
             points=question.points,
+            streaks=scoring.question_streaks(question),
         )
-        Selection.objects.bulk_update(scored_selections, fields=["points"])
-        question.scored_at = timezone.now()
-        question.save(update_fields=["scored_at"])
+        with shards.atomic():
+            with tracing.span("bulk_update", rows=len(scored_selections)):
+                utils.save_points(scored_selections)
+            question.scored_at = timezone.now()
+            question.save(update_fields=["scored_at", "updated_at"])
+            answers.record([], scored=[question])
+            outbox.emit([], scored=[question])
+        leaderboard.schedule_refresh()
         return HttpResponseRedirect(
             reverse("question-detail", kwargs={"pk": question.pk})
         )
@@ -210,7 +318,7 @@ class SelectionCreateView(View):
     def get_context_data(self, question: Question) -> dict[str, typing.Any]:
         options_forms = []
         for i, option in enumerate(question.options):
-            form = SelectionForm(initial={"option_idx": i, "option_text": option})
+            form = SelectionForm(initial={"option_idx": i}, options=question.options)
             options_forms.append((option, form))
 
         context = {
@@ -221,17 +329,19 @@ class SelectionCreateView(View):
         return context
 
     def get(self, request: AuthenticatedHttpRequest, question_pk: int) -> HttpResponse:
-        question = get_object_or_404(Question, pk=question_pk)
+        loader = get_loader(request)
+        question = loader.question_or_404(question_pk)
         utils.user_in_game_check_or_302(
             request, question.game, redirect_to=reverse("index")
         )
         # if selection already exists for this player for this question then redirect to question detail
         utils.check_or_302(
-            Selection.objects.filter(question=question, user=request.user).exists(),
+            loader.user_selection(question, request.user.id) is not None,
             redirect_to=reverse("question-detail", kwargs={"pk": question.pk}),
         )
         context = self.get_context_data(question)
-        return render(request, self.template_name, context)
+        with tracing.span("render", template=self.template_name):
+            return render(request, self.template_name, context)
 
     def get_scored_selections(
         self,
@@ -247,6 +357,7 @@ class SelectionCreateView(View):
             selections=selections,
             respondent_selection=respondent_selection,
             points=question.points,
+            streaks=scoring.question_streaks(question),
         )
         return selections
 
@@ -254,56 +365,257 @@ class SelectionCreateView(View):
         self, scored_selections: typing.Sequence[Selection], question: Question
     ) -> Question:
         if scored_selections:  # pragma: no branch
-            Selection.objects.bulk_update(scored_selections, fields=["points"])
+            with tracing.span("bulk_update", rows=len(scored_selections)):
+                utils.save_points(scored_selections)
             question.scored_at = timezone.now()
-            question.save(update_fields=["scored_at"])
+            question.save(update_fields=["scored_at", "updated_at"])
+            leaderboard.schedule_refresh()
 
         return question
 
     def post(self, request: AuthenticatedHttpRequest, question_pk: int) -> HttpResponse:
-        question = get_object_or_404(Question, pk=question_pk)
+        loader = get_loader(request)
+        question = loader.question_or_404(question_pk)
         utils.user_in_game_check_or_302(
             request, question.game, redirect_to=reverse("index")
         )
         utils.check_or_302(
-            Selection.objects.filter(question=question, user=request.user).exists(),
+            loader.has_selection(question, request.user.id),
             redirect_to=reverse("question-detail", kwargs={"pk": question.pk}),
         )
-        form = SelectionForm(request.POST or None)
+        form = SelectionForm(request.POST or None, options=question.options)
         if form.is_valid():
-            Selection.objects.create(
-                user=request.user,
-                question=question,
-                option_idx=form.cleaned_data["option_idx"],
-                option_text=form.cleaned_data["option_text"],
-            )
-            question.save_answer_fields(
-                answer_idx=form.cleaned_data["option_idx"],
-                answer_text=form.cleaned_data["option_text"],
-                is_respondent=question.respondent == request.user,
+            # the selection, its scoring, its answer row and their events
+            # commit together. The question stays locked until then, so of
+            # two last answers at once the second counts the first.
+            with shards.atomic():
+                unscored = utils.lock_unscored([question.pk])
+                selection = Selection.objects.create(
+                    user=request.user,
+                    question=question,
+                    option_idx=form.cleaned_data["option_idx"],
+                )
+                question.save_answer_fields(
+                    answer_idx=form.cleaned_data["option_idx"],
+                    is_respondent=question.respondent_id == request.user.id,
+                )
+                outbox.emit([selection])
+                loader.forget_selections(question)
+
+                question_selections = loader.question_selections(question)
+                respondent_selection = loader.user_selection(
+                    question, question.respondent_id
+                )
+                selections = [
+                    selection
+                    for selection in question_selections
+                    if selection.user_id != question.respondent_id
+                ]
+                # another player's answer or the admin may have scored it
+                score_question = bool(
+                    unscored
+                    and respondent_selection
+                    and len(question_selections)
+                    == len(loader.game_user_ids(question.game))
+                    and len(selections) > 0
+                )
+                scored_selections = self.get_scored_selections(
+                    score_question=score_question,
+                    selections=selections,
+                    respondent_selection=typing.cast(Selection, respondent_selection),
+                    question=question,
+                )
+                question = self.perform_score_question(scored_selections, question)
+                scored = [question] if scored_selections else []
+                answers.record([selection], scored=scored)
+                outbox.emit([], scored=scored)
+            return HttpResponseRedirect(
+                reverse("question-detail", kwargs={"pk": question.pk})
             )
 
-            respondent_selection = question.selections.filter(
-                user=question.respondent,
-            ).first()
-            selections = question.selections.exclude(
-                user=question.respondent,
+        context = self.get_context_data(question)
+        with tracing.span("render", template=self.template_name):
+            return render(request, self.template_name, context)
+
+
+def save_selections(
+    user: User, selections: list[Selection], questions: dict[int, Question]
+) -> list[int]:
+    # the selections of the batch on the current shard
+    respondent_questions = []
+    for selection in selections:
+        if selection.question.respondent_id == user.id:
+            selection.question.answer_idx = selection.option_idx
+            selection.question.updated_at = timezone.now()
+            respondent_questions.append(selection.question)
+
+    question_ids = [selection.question_id for selection in selections]
+    # as in SelectionCreateView, one transaction with the questions locked
+    # from the start, so a concurrent batch's last answers are counted
+    with shards.atomic():
+        unscored = utils.lock_unscored(question_ids)
+        with tracing.span("bulk_create", rows=len(selections)):
+            Selection.objects.bulk_create(selections)
+        if respondent_questions:
+            Question.objects.bulk_update(
+                respondent_questions, fields=["answer_idx", "updated_at"]
             )
-            score_question = bool(
-                respondent_selection
-                and question.selections.count() == question.game.users.count()
-                and selections.count() > 0
+        outbox.emit(selections)
+        scored = utils.score_ready_questions(unscored)
+        scored_questions = [questions[pk] for pk in scored]
+        answers.record(selections, scored=scored_questions)
+        outbox.emit([], scored=scored_questions)
+    return scored
+
+
+@ratelimit("selection-batch-create", key="user")
+@require_POST
+def selection_batch_create_view(request: AuthenticatedHttpRequest) -> JsonResponse:
+    """
+    Answers many questions in one request. The body is
+    ``{"selections": [{"question": <pk>, "option_idx": <int>}, ...]}``.
+    Valid answers are saved even when others are rejected, every question
+    that got its last answer is scored, and the response lists the created
+    selections, the errors by position in the payload and the scored
+    question ids.
+    """
+    try:
+        items = json.loads(request.body)["selections"]
+        items = [(int(item["question"]), int(item["option_idx"])) for item in items]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    question_pks = {question_pk for question_pk, _ in items}
+    questions: dict[int, Question] = {}
+    answered: set[int] = set()
+    # the questions may be on any shard
+    for alias in shards.names():
+        with shards.using(alias):
+            questions |= Question.objects.filter(
+                pk__in=question_pks, game__users=request.user
+            ).in_bulk()
+            answered |= set(
+                Selection.objects.filter(
+                    question__in=question_pks, user=request.user
+                ).values_list("question_id", flat=True)
             )
-            scored_selections = self.get_scored_selections(
-                score_question=score_question,
-                selections=list(selections),
-                respondent_selection=typing.cast(Selection, respondent_selection),
-                question=question,
+
+    selections = []
+    errors = []
+    for i, (question_pk, option_idx) in enumerate(items):
+        question = questions.get(question_pk)
+        if question is None:
+            error = "Question not found"
+        elif question_pk in answered:
+            error = "Question already answered"
+        elif not 0 <= option_idx < len(question.options):
+            error = "Invalid option"
+        else:
+            answered.add(question_pk)
+            selections.append(
+                Selection(user=request.user, question=question, option_idx=option_idx)
             )
-            question = self.perform_score_question(scored_selections, question)
-            return HttpResponseRedirect(
-                reverse("question-detail", kwargs={"pk": question.pk})
+            continue
+        errors.append({"index": i, "question": question_pk, "error": error})
+
+    selections_by_shard = collections.defaultdict(list)
+    for selection in selections:
+        alias = selection.question._state.db or shards.current()
+        selections_by_shard[alias].append(selection)
+    scored = []
+    for alias, shard_selections in selections_by_shard.items():
+        with shards.using(alias):
+            scored += save_selections(request.user, shard_selections, questions)
+
+    data = {
+        "created": [
+            {
+                "id": selection.pk,
+                "question": selection.question_id,
+                "option_idx": selection.option_idx,
+            }
+            for selection in selections
+        ],
+        "errors": errors,
+        "scored": scored,
+    }
+    return JsonResponse(data, status=201 if selections else 400)
+
+
+@require_GET
+def game_state_view(request: AuthenticatedHttpRequest, slug: str) -> JsonResponse:
+    """
+    The state of a game for polling clients: the leaderboard, the released
+    questions and the caller's selections. Passing the ``cursor`` of a
+    previous response as ``since`` returns only the questions and selections
+    updated after it and the points of the players whose selections changed.
+    Rows may be sent twice around a cursor, clients merge them by id.
+    """
+    game = get_object_or_404(Game, slug=slug)
+    if request.user.id not in get_loader(request).game_user_ids(game):
+        return JsonResponse({"error": "Not a member of this game"}, status=403)
+    since = None
+    if "since" in request.GET:
+        cursor = utils.getint(request.GET["since"])
+        if cursor is None:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        try:
+            since = datetime.fromtimestamp(cursor / 1_000_000, tz=UTC) - timedelta(
+                seconds=settings.GAME_STATE_OVERLAP_SECONDS
             )
+        # out of the range of datetime or of the platform's time_t
+        except (ValueError, OverflowError, OSError):
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+    now = timezone.now()
+
+    questions = game.questions.filter(scored_at__isnull=False)
+    selections = request.user.selections.filter(question__game=game)
+    users = game.users.all()
+    if since is not None:
+        questions = questions.filter(updated_at__gt=since)
+        selections = selections.filter(updated_at__gt=since)
+        changed_user_ids = Selection.objects.filter(
+            question__game=game, updated_at__gt=since, points__isnull=False
+        ).values("user_id")
+        users = users.filter(pk__in=changed_user_ids)
+    questions_list = list(
+        questions.order_by("points", "id").select_related("respondent")
+    )
+    # time releases the next question without touching its row
+    released_question = utils.released_question(game)
+    if released_question is not None:
+        questions_list.append(released_question)
+    sum_filter = Q(selections__question__game=game)
+    leaderboard = (
+        users.order_by("username")
+        .annotate(points=Coalesce(Sum("selections__points", filter=sum_filter), 0))
+        .values_list("username", "points")
+    )
 
-        context = self.get_context_data(question)
-        return render(request, self.template_name, context)
+    data = {
+        "cursor": int(now.timestamp() * 1_000_000),
+        "leaderboard": [
+            {"user": username, "points": points} for username, points in leaderboard
+        ],
+        "questions": [
+            {
+                "id": question.pk,
+                "respondent": question.respondent.username,
+                "options": question.options,
+                "points": question.points,
+                # the respondent's answer is only revealed once scored
+                "answer_idx": question.answer_idx if question.scored_at else None,
+                "scored_at": question.scored_at,
+            }
+            for question in questions_list
+        ],
+        "selections": [
+            {
+                "question": selection.question_id,
+                "option_idx": selection.option_idx,
+                "points": selection.points,
+            }
+            for selection in selections.order_by("id")
+        ],
+    }
+    return JsonResponse(data)
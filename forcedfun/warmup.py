@@ -0,0 +1,57 @@
+import time
+import typing
+from pathlib import Path
+
+from django.db import connection
+from django.template import engines
+from django.urls import Resolver404
+from django.urls import get_resolver
+from django.urls import resolve
+
+
+def load_templates() -> int:
+    # the cached template loader keeps every compiled template, so a worker
+    # forked after this never parses them again
+    engine = engines["django"].engine  # type: ignore[attr-defined]
+    names = set()
+    for directory in map(Path, engine.dirs):
+        for path in directory.rglob("*.html"):
+            names.add(str(path.relative_to(directory)))
+    for name in sorted(names):
+        engine.get_template(name)
+    return len(names)
+
+
+def resolve_urls() -> None:
+    resolver = get_resolver()
+    # builds the reverse lookup tables
+    resolver.reverse_dict
+    # a path that matches nothing compiles the regex of every pattern
+    try:
+        resolve("/__warmup__/")
+    except Resolver404:
+        pass
+
+
+def ping_database() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def warm_up(*, templates: bool, database: bool) -> dict[str, float]:
+    """
+    Does the work a process would otherwise do on its first requests and
+    returns the milliseconds each step took.
+    """
+    steps: dict[str, typing.Callable[[], object]] = {}
+    if templates:
+        steps["templates"] = load_templates
+        steps["urls"] = resolve_urls
+    if database:
+        steps["database"] = ping_database
+    timings = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        step()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
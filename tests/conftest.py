@@ -1,9 +1,47 @@
+import collections
+
 import pytest
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
 
+from forcedfun import shards
+from forcedfun import sql
 from forcedfun.utils import AuthenticatedHttpRequest
 
+QUERY_REPORTS = collections.defaultdict(list)
+
+
+def collect_query_report(sender, report, **kwargs):
+    QUERY_REPORTS[report.url_name].append(report)
+
+
+def pytest_configure(config):
+    sql.query_inspected.connect(collect_query_report)
+
+
+def pytest_collection_modifyitems(config, items):
+    from django.db import connection
+
+    if connection.vendor == "postgresql":
+        return
+    skip = pytest.mark.skip(reason=f"needs Postgres, running on {connection.vendor}")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not QUERY_REPORTS:
+        return
+    terminalreporter.section("queries per url name")
+    for url_name, reports in sorted(QUERY_REPORTS.items()):
+        max_queries = max(report.n_queries for report in reports)
+        flagged = sum(report.has_problems for report in reports)
+        terminalreporter.write_line(
+            f"{url_name:<45} requests={len(reports):<4} "
+            f"max_queries={max_queries:<4} flagged={flagged}"
+        )
+
 
 @pytest.fixture()
 def anonymous_client(client):
@@ -32,3 +70,13 @@ def authenticated_request():
     middleware = MessageMiddleware(get_response=lambda request: None)
     middleware(request)
     return request
+
+
+@pytest.fixture()
+def sharded(settings):
+    # with django_db(databases="__all__"), games with the slugs game4, game1
+    # and game2 are placed on the shards in this order
+    settings.SHARDS = ["default", "shard1", "shard2"]
+    for alias in settings.SHARDS:
+        shards.prepare(alias)
+    return settings.SHARDS
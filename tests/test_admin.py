@@ -1,6 +1,16 @@
+import io
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.urls import reverse
 
 from forcedfun import models, factories
+from forcedfun import outbox
+from forcedfun import shards
+from forcedfun.models import AnalyticsReport
+from forcedfun.models import Selection
+from forcedfun.models import SlowQuery
 import pytest
 
 MODEL_LIST = [
@@ -56,3 +66,261 @@ def test_admin_add_view_returns_200(Model, Factory, admin_client):
     url = reverse(f"admin:{app_label}_{model_name}_add")
     response = admin_client.get(url)
     assert response.status_code == 200
+
+
+@pytest.fixture()
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+@pytest.mark.django_db
+def test_request_profile_admin(admin_client, media_root):
+    profile = factories.request_profile_factory(content=b'{"profiles": []}')
+    url = reverse("admin:forcedfun_requestprofile_changelist")
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert b"download" in response.content
+    url = reverse("admin:forcedfun_requestprofile_change", args=[profile.pk])
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    url = reverse("admin:forcedfun_requestprofile_download", args=[profile.pk])
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b'{"profiles": []}'
+    url = reverse("admin:forcedfun_requestprofile_add")
+    assert admin_client.get(url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_slow_query_admin(admin_client):
+    slow_query = SlowQuery.objects.create(
+        fingerprint="SELECT ?", sql="SELECT %s", duration_ms=1, path="/"
+    )
+    url = reverse("admin:forcedfun_slowquery_changelist")
+    assert admin_client.get(url).status_code == 200
+    url = reverse("admin:forcedfun_slowquery_change", args=[slow_query.pk])
+    assert admin_client.get(url).status_code == 200
+    url = reverse("admin:forcedfun_slowquery_add")
+    assert admin_client.get(url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_analytics_report_admin(admin_client):
+    report = AnalyticsReport.objects.create(
+        report={
+            "users": [
+                {
+                    "user": "user",
+                    "guesses": 1,
+                    "accuracy": 1.0,
+                    "asked": 0,
+                    "majority_rate": None,
+                }
+            ],
+            "games": [
+                {
+                    "game": "game",
+                    "questions": 1,
+                    "guesses": 1,
+                    "difficulty": 0.0,
+                    "agreement": {"users": ["user"], "matrix": [[1.0]]},
+                }
+            ],
+        }
+    )
+    url = reverse("admin:forcedfun_analyticsreport_changelist")
+    assert admin_client.get(url).status_code == 200
+    url = reverse("admin:forcedfun_analyticsreport_change", args=[report.pk])
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert (
+        b"<td>user</td><td>1</td><td>1.0</td><td>0</td><td>-</td>" in response.content
+    )
+    url = reverse("admin:forcedfun_analyticsreport_add")
+    assert admin_client.get(url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_score_questions_action(admin_client, admin_user):
+    other = factories.user_factory(username="other")
+    game = factories.game_factory(users=(admin_user, other))
+    ready = []
+    for option_idx in (0, 1):
+        question = factories.question_factory(game=game, respondent=admin_user)
+        factories.selection_factory(user=admin_user, question=question)
+        factories.selection_factory(
+            user=other, question=question, option_idx=option_idx
+        )
+        ready.append(question)
+    unanswered = factories.question_factory(game=game, respondent=admin_user)
+
+    url = reverse("admin:forcedfun_question_changelist")
+    data = {"action": "score_questions", "_selected_action": [q.pk for q in ready]}
+    response = admin_client.post(url, data, follow=True)
+    assert response.status_code == 200
+    assert b"Scored 2 questions" in response.content
+    assert b"Skipped" not in response.content
+    assert [Selection.objects.get(question=q, user=other).points for q in ready] == [
+        1,
+        0,
+    ]
+    assert not models.Question.objects.filter(pk__in=[q.pk for q in ready]).filter(
+        scored_at__isnull=True
+    )
+
+    # scored and unanswered questions are skipped
+    data["_selected_action"].append(unanswered.pk)
+    response = admin_client.post(url, data, follow=True)
+    assert b"Scored 0 questions" in response.content
+    assert b"Skipped 3 questions" in response.content
+    assert models.OutboxEvent.objects.filter(kind="question.scored").count() == 2
+
+
+@pytest.mark.django_db
+def test_outbox_retry_action(admin_client):
+    failed = models.OutboxEvent.objects.create(
+        kind="question.scored", payload={}, attempts=10, last_error="URLError"
+    )
+    url = reverse("admin:forcedfun_outboxevent_changelist")
+    assert admin_client.get(url).status_code == 200
+    assert (
+        admin_client.get(reverse("admin:forcedfun_outboxevent_add")).status_code == 403
+    )
+    data = {"action": "retry", "_selected_action": [failed.pk]}
+    response = admin_client.post(url, data, follow=True)
+    assert b"1 events will be delivered again" in response.content
+    failed.refresh_from_db()
+    assert (failed.attempts, failed.last_error) == (0, "")
+
+
+@pytest.mark.django_db
+def test_game_members(admin_client, client):
+    game = factories.game_factory()
+    users = [factories.user_factory(username=f"user{i}") for i in range(3)]
+    url = reverse("admin:forcedfun_game_change", args=[game.pk])
+    response = admin_client.get(url)
+    members_url = reverse("admin:forcedfun_game_members", args=[game.pk])
+    assert members_url.encode() in response.content
+
+    response = admin_client.get(members_url)
+    assert response.status_code == 200
+    assert b"autocomplete.js" in response.content
+
+    data = {
+        "action": "add",
+        "users": [users[0].pk],
+        "usernames": "user1,\nuser2 user1",
+    }
+    response = admin_client.post(members_url, data, follow=True)
+    assert b"Added 3 players to gamedefault" in response.content
+    response = admin_client.post(members_url, data, follow=True)
+    assert b"Added 0 players to gamedefault" in response.content
+    assert set(game.users.all()) == set(users)
+
+    data = {"action": "remove", "usernames": "user0 user1"}
+    response = admin_client.post(members_url, data, follow=True)
+    assert b"Removed 2 players from gamedefault" in response.content
+    assert list(game.users.all()) == [users[2]]
+
+    data = {"action": "add", "usernames": "user0 nobody"}
+    response = admin_client.post(members_url, data)
+    assert b"Unknown users: nobody" in response.content
+    assert list(game.users.all()) == [users[2]]
+
+    staff = factories.user_factory(username="staff", is_staff=True)
+    client.force_login(staff)
+    assert client.get(members_url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_delete_game_and_user(admin_client, authenticated_request):
+    other = factories.user_factory(username="other")
+    game = factories.game_factory(users=(other,))
+    factories.selection_factory(
+        user=other, question=factories.question_factory(game=game, respondent=other)
+    )
+    url = reverse("admin:forcedfun_game_changelist")
+    data = {"action": "delete_selected", "_selected_action": [game.pk], "post": "yes"}
+    response = admin_client.post(url, data, follow=True)
+    assert b"Queued 1 games for purge --queued" in response.content
+    # the purge job deletes them
+    assert models.Question.objects.exists()
+    call_command("purge", queued=True, stdout=io.StringIO())
+    assert not models.Question.objects.exists()
+    assert not Selection.objects.exists()
+    assert not models.PendingPurge.objects.exists()
+
+    game = factories.game_factory(slug="other", users=(other,))
+    url = reverse("admin:forcedfun_game_delete", args=[game.pk])
+    assert admin_client.post(url, {"post": "yes"}).status_code == 302
+    assert models.Game.objects.exists()
+
+    factories.question_factory(respondent=other)
+    url = reverse("admin:auth_user_delete", args=[other.pk])
+    assert admin_client.get(url).status_code == 200
+    assert admin_client.post(url, {"post": "yes"}).status_code == 302
+    assert list(
+        models.PendingPurge.objects.values_list("kind", "object_id", "shard")
+    ) == [("game", game.pk, "default"), ("user", other.pk, "")]
+    call_command("purge", queued=True, stdout=io.StringIO())
+    assert not models.Game.objects.filter(pk=game.pk).exists()
+    assert not models.Question.objects.exists()
+
+    # the changelist's groups filter queries twice on every action, so the
+    # delete action's method is called without it
+    users = [factories.user_factory(username=f"user{i}") for i in range(2)]
+    admin.site._registry[User].delete_queryset(
+        authenticated_request,
+        User.objects.filter(pk__in=[user.pk for user in users]),
+    )
+    call_command("purge", queued=True, stdout=io.StringIO())
+    assert list(User.objects.values_list("username", flat=True)) == ["admin"]
+
+
+@pytest.mark.django_db(databases="__all__")
+def test_sharded_admin(sharded, admin_client, admin_user):
+    with shards.using("shard1"):
+        game = factories.game_factory(slug="game1")
+        question = factories.question_factory(game=game, respondent=admin_user)
+        selection = factories.selection_factory(user=admin_user, question=question)
+        outbox.emit([selection])
+    for name, obj in [
+        ("game", game),
+        ("question", question),
+        ("selection", selection),
+        ("outboxevent", models.OutboxEvent.objects.using("shard1").get()),
+    ]:
+        url = reverse(f"admin:forcedfun_{name}_changelist")
+        # the first shard's rows without a pick
+        response = admin_client.get(url)
+        assert list(response.context["cl"].result_list) == []
+        assert b"?shard=shard1" in response.content
+        response = admin_client.get(url + "?shard=shard1")
+        assert list(response.context["cl"].result_list) == [obj]
+        # an object is read from the shard it is on
+        url = reverse(f"admin:forcedfun_{name}_change", args=[obj.pk])
+        assert admin_client.get(url).context["original"] == obj
+    url = reverse("admin:forcedfun_game_change", args=["nope"])
+    assert admin_client.get(url).status_code == 302
+
+    url = reverse("admin:forcedfun_game_members", args=[game.pk])
+    response = admin_client.post(url, {"action": "add", "usernames": "admin"})
+    assert list(game.users.all()) == [admin_user]
+
+    url = reverse("admin:forcedfun_question_changelist") + "?shard=shard1"
+    data = {"action": "score_questions", "_selected_action": [question.pk]}
+    response = admin_client.post(url, data, follow=True)
+    assert b"Scored 0 questions" in response.content
+
+    url = reverse("admin:forcedfun_game_delete", args=[game.pk])
+    assert admin_client.post(url, {"post": "yes"}).status_code == 302
+    url = reverse("admin:forcedfun_game_changelist") + "?shard=shard1"
+    data = {"action": "delete_selected", "_selected_action": [game.pk], "post": "yes"}
+    admin_client.post(url, data)
+    assert list(models.PendingPurge.objects.values_list("shard", flat=True)) == [
+        "shard1",
+        "shard1",
+    ]
+    call_command("purge", queued=True, stdout=io.StringIO())
+    assert not models.Game.objects.using("shard1").exists()
@@ -1,17 +1,71 @@
+import collections
+import dataclasses
+import http.cookiejar
+import io
+import json
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
 import pytest
+from django import forms
+from django.apps import apps
 from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
 from django.core.exceptions import ValidationError
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import CommandError
 from django.core.management import call_command
+from django.db import DatabaseError
+from django.db import connection
+from django.db import transaction
+from django.db.migrations.loader import MigrationLoader
 from django.http import Http404
 from django.http import HttpResponse
+from django.utils import timezone
 
+from forcedfun import analytics
+from forcedfun import answers
+from forcedfun import benchmarks
 from forcedfun import factories
+from forcedfun import gunicorn_conf
+from forcedfun import invites
+from forcedfun import leaderboard
+from forcedfun import outbox
 from forcedfun.errors import Http302
+from forcedfun.errors import QueryInspectError
+from forcedfun.errors import QueryInspectWarning
+from forcedfun.middleware import QueryInspectMiddleware
 from forcedfun.middleware import RedirectMiddleware
+from forcedfun.models import AnalyticsReport
+from forcedfun.models import AnswerRow
+from forcedfun.models import OutboxEvent
+from forcedfun.models import PendingPurge
+from forcedfun.models import Game
+from forcedfun.models import Leaderboard
+from forcedfun.models import LeaderboardState
 from forcedfun.models import Question
+from forcedfun.models import RequestProfile
 from forcedfun.models import Selection
+from forcedfun.models import TextInputTextField
+from forcedfun import pagination
+from forcedfun import purge
+from forcedfun import profiling
+from forcedfun import ratelimit
+from forcedfun import readmodels
+from forcedfun import scoring
+from forcedfun import shards
+from forcedfun import sql
+from forcedfun import tracing
 from forcedfun import utils
+from forcedfun import warmup
 from forcedfun.forms import GameForm
+from forcedfun.loaders import Loader
+from forcedfun.management.commands.loadtest import Player
+from forcedfun.management.commands.loadtest import check_scoring
+from forcedfun.management.commands.loadtest import percentile
 from forcedfun.settings.utils import getbool
 
 
@@ -21,6 +75,11 @@ def test_for_cov():
     import forcedfun.wsgi  # noqa: F401
 
 
+def test_text_input_text_field():
+    # only referenced by the initial migration
+    assert isinstance(TextInputTextField().formfield().widget, forms.TextInput)
+
+
 @pytest.mark.django_db
 def test_seeds():
     call_command("seeds")
@@ -39,23 +98,94 @@ class TestGameForm:
 
 class TestQuestion:
     def test_save_answer_fields_for_non_respondent(self):
-        question = Question(answer_idx=None, answer_text="")
-        question.save_answer_fields(
-            answer_idx=1, answer_text="text", is_respondent=False
-        )
+        question = Question(answer_idx=None, options=["a", "b"])
+        question.save_answer_fields(answer_idx=1, is_respondent=False)
         assert question.answer_text == ""
         assert question.answer_idx is None
 
     @pytest.mark.django_db
     def test_save_answer_fields_on_respondent_request(self):
-        question = factories.question_factory(answer_idx=None, answer_text="")
-        question.save_answer_fields(
-            answer_idx=1, answer_text="text", is_respondent=True
-        )
+        question = factories.question_factory(answer_idx=None)
+        question.save_answer_fields(answer_idx=1, is_respondent=True)
         question.refresh_from_db()
-        assert question.answer_text == "text"
+        assert question.answer_text == "option2"
         assert question.answer_idx == 1
 
+    def test_option_text(self):
+        question = Question(options=["a", "b"])
+        assert Selection(question=question, option_idx=1).option_text == "b"
+
+
+class TestBackfillOptionIdx:
+    @pytest.mark.django_db(transaction=True)
+    def test_backfill_before_the_text_columns_are_dropped(self):
+        call_command("migrate", "forcedfun", "0008", verbosity=0)
+        try:
+            apps = (
+                MigrationLoader(connection)
+                .project_state(("forcedfun", "0008_options_field"))
+                .apps
+            )
+            OldSelection = apps.get_model("forcedfun", "Selection")
+            OldQuestion = apps.get_model("forcedfun", "Question")
+            user = User.objects.create(username="user")
+            game = apps.get_model("forcedfun", "Game").objects.create(slug="game")
+            question = OldQuestion.objects.create(
+                game=game,
+                respondent_id=user.pk,
+                options=["a", "b"],
+                points=1,
+                answer_idx=0,
+                answer_text="b",
+            )
+            wrong = OldSelection.objects.create(
+                user_id=user.pk, question=question, option_idx=0, option_text="b"
+            )
+            # the migration fixes the index
+            call_command(
+                "migrate", "forcedfun", "0009_backfill_option_idx_sharded", verbosity=0
+            )
+            wrong.refresh_from_db()
+            question.refresh_from_db()
+            assert (wrong.option_idx, question.answer_idx) == (1, 1)
+
+            other = User.objects.create(username="other")
+            unknown = OldSelection.objects.create(
+                user_id=other.pk, question=question, option_idx=0, option_text="c"
+            )
+            OldQuestion.objects.filter(pk=question.pk).update(answer_idx=0)
+            out = io.StringIO()
+            call_command("backfill_option_idx", stdout=out)
+            assert (
+                f"selections: 2 checked, 0 to fix, 1 with a text that is none of "
+                f"the options [{unknown.pk}]"
+            ) in out.getvalue()
+            assert "questions: 1 checked, 1 to fix" in out.getvalue()
+            question.refresh_from_db()
+            assert question.answer_idx == 0
+
+            call_command("backfill_option_idx", fix=True, batch_size=1, stdout=out)
+            assert "questions: 1 checked, 1 fixed" in out.getvalue()
+            question.refresh_from_db()
+            assert question.answer_idx == 1
+        finally:
+            call_command("migrate", "forcedfun", verbosity=0)
+
+        out = io.StringIO()
+        call_command("backfill_option_idx", stdout=out)
+        assert "option_text and answer_text are dropped" in out.getvalue()
+
+    @pytest.mark.postgres
+    @pytest.mark.django_db
+    def test_table_sizes(self):
+        sizes = sql.table_sizes(["forcedfun_selection"])
+        assert set(sizes["forcedfun_selection"]) == {"heap", "toast", "indexes"}
+        out = io.StringIO()
+        call_command("backfill_option_idx", stdout=out)
+        assert "forcedfun_selection: heap" in out.getvalue()
+        with patch.object(sql.connection, "vendor", "sqlite"):
+            assert sql.table_sizes(["forcedfun_selection"]) == {}
+
 
 def test_redirect_middleware():
     def get_response(request):
@@ -121,6 +251,878 @@ class TestScoreSelections:
         assert respondent_selection.points == 1
 
 
+class TestScoring:
+    def score(self, rule, respondent_option_idx, option_idx_list, streaks=None):
+        selections = [
+            Selection(user_id=i, option_idx=option_idx)
+            for i, option_idx in enumerate(option_idx_list)
+        ]
+        respondent_selection = Selection(option_idx=respondent_option_idx)
+        rule.score(
+            selections=selections,
+            respondent_selection=respondent_selection,
+            points=3,
+            streaks=streaks or {},
+        )
+        return [s.points for s in selections], respondent_selection.points
+
+    def test_supermajority(self):
+        rule = scoring.get_rule("supermajority")
+        assert self.score(rule, 0, [0, 1]) == ([3, 0], 0)
+        assert self.score(rule, 0, [0, 0, 1]) == ([3, 3, 0], 3)
+
+    def test_partial_credit(self):
+        rule = scoring.get_rule("partial")
+        assert self.score(rule, 0, [0, 1, 1]) == ([3, 0, 0], 1)
+        assert self.score(rule, 0, [1, 1]) == ([0, 0], 0)
+
+    def test_streak_bonus(self):
+        rule = scoring.get_rule("streak")
+        streaks = {0: 1, 1: 5, 2: 5}
+        assert self.score(rule, 0, [0, 0, 1], streaks) == ([4, 6, 0], 3)
+
+    def test_setting_and_unknown_rule(self, settings):
+        settings.SCORING_RULE = "partial"
+        assert scoring.get_rule() == scoring.Rule(partial_credit=True)
+        with pytest.raises(ImproperlyConfigured):
+            scoring.get_rule("unknown")
+
+    @pytest.fixture
+    def game(self, user):
+        """
+        Two scored questions answered by the respondent and two guessers,
+        ``other`` guessing right both times, ``user`` only the second time.
+        """
+        respondent = factories.user_factory(username="respondent")
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(respondent, other, user))
+        for option_idx in (0, 1):
+            question = factories.question_factory(
+                game=game, respondent=respondent, scored_at=timezone.now()
+            )
+            factories.selection_factory(
+                user=respondent, question=question, option_idx=option_idx, points=1
+            )
+            factories.selection_factory(
+                user=other, question=question, option_idx=option_idx, points=1
+            )
+            factories.selection_factory(
+                user=user, question=question, option_idx=1, points=option_idx
+            )
+        return game
+
+    def test_question_streaks(self, game, user, settings):
+        question = factories.question_factory(game=game, respondent=user)
+        assert scoring.question_streaks(question) == {}
+        settings.SCORING_RULE = "streak"
+        other = User.objects.get(username="other")
+        assert scoring.question_streaks(question) == {other.pk: 2, user.pk: 1}
+
+    def test_streaks_before(self, game, user, settings, django_assert_num_queries):
+        settings.SCORING_RULE = "streak"
+        questions = [
+            factories.question_factory(game=game, respondent=user),
+            factories.question_factory(
+                game=factories.game_factory(slug="other-game"), respondent=user
+            ),
+            *game.questions.order_by("-pk"),
+        ]
+        with django_assert_num_queries(1):
+            streaks = scoring.streaks_before(questions)
+        assert streaks == {
+            question.pk: scoring.question_streaks(question) for question in questions
+        }
+        assert [len(streaks[question.pk]) for question in questions] == [2, 0, 2, 2, 0]
+
+    def test_rescore_command(self, game, user):
+        out = io.StringIO()
+        call_command("rescore", game.slug, rule="streak", dry_run=True, stdout=out)
+        lines = out.getvalue().splitlines()
+        assert lines == [
+            f"{game.slug} question {game.questions.last().pk} other: 1 -> 2",
+            "1 selections changed in 1 questions (dry run, nothing saved)",
+        ]
+        assert not Selection.objects.filter(points=2).exists()
+
+        call_command("rescore", all=True, rule="streak", stdout=out)
+        assert Selection.objects.get(points=2).user.username == "other"
+        [event] = OutboxEvent.objects.all()
+        assert (event.kind, event.payload["question"]) == (
+            "question.rescored",
+            game.questions.last().pk,
+        )
+        out = io.StringIO()
+        call_command("rescore", game.slug, rule="streak", stdout=out)
+        assert out.getvalue() == "0 selections changed in 0 questions\n"
+
+    @pytest.mark.django_db(databases="__all__")
+    def test_rescore_command_on_every_shard(self, sharded, game):
+        shards.move_game(game.pk, "default", "shard1")
+        out = io.StringIO()
+        call_command("rescore", game.slug, rule="streak", stdout=out)
+        assert out.getvalue().splitlines()[-1] == "1 selections changed in 1 questions"
+        assert Selection.objects.using("shard1").filter(points=2).count() == 1
+
+    def test_rescore_skips_questions_without_guesses(self, user):
+        question = factories.question_factory(respondent=user, scored_at=timezone.now())
+        factories.selection_factory(user=user, question=question)
+        assert scoring.rescore(Game.objects.all(), scoring.get_rule()) == []
+
+    @pytest.mark.django_db
+    def test_rescore_command_errors(self):
+        with pytest.raises(CommandError, match="Pass game slugs"):
+            call_command("rescore")
+        with pytest.raises(CommandError, match="Unknown games: missing"):
+            call_command("rescore", "missing")
+
+
+@pytest.mark.django_db
+def test_refresh_leaderboard_command(settings):
+    out = io.StringIO()
+    call_command("refresh_leaderboard", stdout=out)
+    call_command("refresh_leaderboard", blocking=True, stdout=out)
+    assert out.getvalue() == "Refreshed the leaderboard\n" * 2
+
+    # stale since the migration, then nothing was scored
+    call_command("refresh_leaderboard", if_stale=True, stdout=out)
+    call_command("refresh_leaderboard", if_stale=True, stdout=out)
+    assert out.getvalue() == "Refreshed the leaderboard\n" * 3
+
+    # a refresh fails, the next one is tried again
+    leaderboard.mark_stale()
+    with patch("forcedfun.leaderboard.refresh", side_effect=DatabaseError):
+        with pytest.raises(DatabaseError):
+            call_command("refresh_leaderboard", if_stale=True, stdout=out)
+    assert LeaderboardState.objects.get().stale_since is not None
+
+    out = io.StringIO()
+    settings.LEADERBOARD_REFRESH_SECONDS = 0
+    with patch(
+        "forcedfun.leaderboard.refresh_if_stale",
+        side_effect=[True, False, KeyboardInterrupt],
+    ):
+        call_command("refresh_leaderboard", loop=True, stdout=out)
+    assert out.getvalue() == "Refreshed the leaderboard\n"
+
+
+@pytest.mark.django_db
+def test_leaderboard_state_without_the_migration_row():
+    LeaderboardState.objects.all().delete()
+    leaderboard.mark_stale()
+    assert LeaderboardState.objects.get().stale_since is not None
+    leaderboard.mark_stale()
+    assert LeaderboardState.objects.count() == 1
+
+    LeaderboardState.objects.all().delete()
+    assert leaderboard.refresh_if_stale()
+    state = LeaderboardState.objects.get()
+    assert (state.stale_since, state.refreshed_at is not None) == (None, True)
+    assert not leaderboard.refresh_if_stale()
+
+
+@pytest.mark.django_db(databases="__all__")
+def test_schedule_refresh_on_the_current_shard(
+    sharded, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks() as callbacks:
+        with django_capture_on_commit_callbacks(using="shard1") as shard_callbacks:
+            with shards.using("shard1"):
+                leaderboard.schedule_refresh()
+    # waits for the shard's transaction, not the first shard's
+    assert (callbacks, shard_callbacks) == ([], [leaderboard.mark_stale])
+
+
+class TestPortableSchema:
+    @pytest.mark.django_db
+    def test_options_round_trip(self):
+        question = factories.question_factory(options=["yes", 'no, "never"'])
+        question.refresh_from_db()
+        assert question.options == ["yes", 'no, "never"']
+        Question.objects.filter(pk=question.pk).update(options=["a", "b"])
+        assert Question.objects.values_list("options", flat=True).get() == ["a", "b"]
+
+    def test_options_field_without_postgres(self):
+        field = Question._meta.get_field("options")
+        sqlite = MagicMock(vendor="sqlite")
+        assert field.db_type(sqlite) == "text"
+        assert field.get_placeholder(["a", "b"], None, sqlite) == "%s"
+        value = field.get_db_prep_value(("a", "b"), sqlite)
+        assert value == '["a", "b"]'
+        assert field.from_db_value(value, None, sqlite) == ["a", "b"]
+        assert field.get_db_prep_value(None, sqlite) is None
+
+    @pytest.mark.django_db
+    def test_leaderboard_matches_the_portable_query(self, user):
+        other = factories.user_factory(username="other")
+        third = factories.user_factory(username="third")
+        game = factories.game_factory(users=(user, other, third))
+        question = factories.question_factory(game=game, respondent=user, points=2)
+        factories.selection_factory(user=user, question=question, option_idx=0)
+        factories.selection_factory(user=other, question=question, option_idx=0)
+        factories.selection_factory(user=third, question=question, option_idx=1)
+        assert utils.score_ready_questions([question.pk]) == [question.pk]
+        leaderboard.refresh(concurrently=False)
+
+        rows = list(
+            Leaderboard.objects.order_by("user_id").values_list(
+                "user_id", "points", "games", "guesses", "accuracy"
+            )
+        )
+        assert rows == [
+            (user.pk, 2, 1, 0, None),
+            (other.pk, 2, 1, 1, 1.0),
+            (third.pk, 0, 1, 1, 0.0),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(leaderboard.SELECT_ROWS + " ORDER BY s.user_id")
+            assert [tuple(row) for row in cursor.fetchall()] == rows
+
+    @pytest.mark.django_db
+    def test_refresh_without_postgres(self):
+        with (
+            patch.object(leaderboard.connections["default"], "vendor", "sqlite"),
+            patch.object(leaderboard.connections["default"], "cursor") as cursor,
+        ):
+            leaderboard.refresh()
+        execute = cursor.return_value.__enter__.return_value.execute
+        statements = [call.args[0] for call in execute.call_args_list]
+        assert "DELETE FROM forcedfun_leaderboard" in statements
+        assert any(
+            s.startswith("INSERT INTO forcedfun_leaderboard") for s in statements
+        )
+
+
+class TestInvites:
+    def test_code_round_trip(self):
+        game = Game(pk=1, slug="game")
+        code = invites.make_code(game)
+        assert code == invites.make_code(game)
+        assert invites.read_code(code) == invites.Invite(game_id=1, slug="game")
+        assert invites.read_code(code[:-1]) is None
+        wrong_shape = signing.Signer(salt=invites.SALT).sign_object(1)
+        assert invites.read_code(wrong_shape) is None
+
+    @pytest.mark.django_db
+    def test_game_id_for_slug(self, django_assert_num_queries):
+        cache.clear()
+        # unknown slugs are cached for GAME_ID_MISSING_CACHE_SECONDS
+        with django_assert_num_queries(1):
+            assert invites.game_id_for_slug("game") is None
+            assert invites.game_id_for_slug("game") is None
+        with patch.object(cache, "get", return_value=None):
+            with django_assert_num_queries(1):
+                assert invites.game_id_for_slug("game") is None
+        # until a game is created with the slug
+        game = factories.game_factory(slug="game")
+        with django_assert_num_queries(1):
+            assert invites.game_id_for_slug("game") == game.pk
+            assert invites.game_id_for_slug("game") == game.pk
+
+        # renaming forgets the old slug, also of a game loaded from the database
+        game = Game.objects.get(pk=game.pk)
+        game.slug = "renamed"
+        game.save()
+        assert invites.game_id_for_slug("game") is None
+        assert invites.game_id_for_slug("renamed") == game.pk
+        game.slug = "again"
+        game.save()
+        assert invites.game_id_for_slug("renamed") is None
+        game.delete()
+        assert invites.game_id_for_slug("again") is None
+
+    @pytest.mark.django_db
+    def test_join(self, user, django_assert_num_queries):
+        game = factories.game_factory()
+        with django_assert_num_queries(1):
+            assert invites.join(game.pk, user.pk)
+        assert not invites.join(game.pk, user.pk)
+        assert not invites.join(game.pk + 1, user.pk)
+        assert list(game.users.all()) == [user]
+
+
+@pytest.mark.django_db(databases="__all__")
+class TestShards:
+    def test_placement(self, sharded, settings):
+        assert [shards.for_slug(slug) for slug in ["game4", "game1", "game2"]] == (
+            sharded
+        )
+        assert shards.first_id("shard2") == 2 * settings.SHARD_ID_SPAN + 1
+        assert shards.for_id(1) == "default"
+        assert shards.for_id(shards.first_id("shard2") + 1) == "shard2"
+        assert shards.for_url_kwargs({"code": "x"}) is None
+
+    def test_router(self, sharded, user):
+        with shards.using("shard1"):
+            game = factories.game_factory(slug="game1", users=(user,))
+            factories.question_factory(game=game, respondent=user)
+        assert game.pk >= shards.first_id("shard1")
+        assert not Game.objects.exists()
+        question = Question.objects.using("shard1").get()
+        # reached from an instance of the shard
+        assert question.game == game
+        assert list(game.questions.all()) == [question]
+        assert question.respondent == user
+        mirrored = User.objects.using("shard1").get()
+        assert mirrored.username == "user"
+        assert not mirrored.has_usable_password()
+
+        assert shards.locate_game("game1") == "shard1"
+        assert shards.for_url_kwargs({"question_pk": question.pk}) == "shard1"
+        # a game not moved yet by rebalance_shards
+        with shards.using("default"):
+            factories.game_factory(slug="game2")
+        assert shards.locate_game("game2") == "default"
+        assert shards.locate_game("nope") == shards.for_slug("nope")
+
+    def test_prepare_after_migrate(self, sharded):
+        shards.prepare_after_migrate(apps.get_app_config("forcedfun"), "shard2")
+        with shards.using("shard2"):
+            game = factories.game_factory(slug="game2")
+        assert shards.for_id(game.pk) == "shard2"
+
+    def test_prepare_sqlite(self, sharded):
+        connection = shards.connections["shard1"]
+        with (
+            patch.object(connection, "vendor", "sqlite"),
+            patch.object(connection, "cursor") as cursor,
+        ):
+            shards.prepare("shard1")
+        execute = cursor.return_value.__enter__.return_value.execute
+        statements = [call.args[0] for call in execute.call_args_list]
+        assert statements.count("DELETE FROM sqlite_sequence WHERE name = %s") == len(
+            shards.SEQUENCE_TABLES
+        )
+
+    def test_rebalance_shards_command(self, settings, user):
+        other = factories.user_factory(username="other")
+        created_at = {}
+        for slug in ["game4", "game1", "game2"]:
+            game = factories.game_factory(slug=slug, users=(user, other))
+            question = factories.question_factory(game=game, respondent=user)
+            selection = factories.selection_factory(user=other, question=question)
+            answers.record([selection])
+            created_at[slug] = question.created_at
+        factories.game_factory(slug="game5")
+        settings.SHARDS = ["default", "shard1", "shard2"]
+        # left by a move that failed before deleting from the source
+        with shards.using("shard1"):
+            game = Game.objects.using("default").get(slug="game1")
+            Game.objects.create(pk=game.pk, slug="game1")
+
+        out = io.StringIO()
+        call_command("rebalance_shards", "--dry-run", stdout=out)
+        assert out.getvalue().endswith("Would move 3 games\n")
+        assert Game.objects.using("default").count() == 4
+
+        out = io.StringIO()
+        call_command("rebalance_shards", stdout=out)
+        assert "game1: default -> shard1" in out.getvalue()
+        assert out.getvalue().endswith("Moved 3 games\n")
+        for alias, slug in zip(settings.SHARDS, ["game4", "game1", "game2"]):
+            with shards.using(alias):
+                game = Game.objects.get(slug=slug)
+                assert set(game.users.values_list("username", flat=True)) == {
+                    "user",
+                    "other",
+                }
+                question = game.questions.get()
+                assert question.created_at == created_at[slug]
+                assert question.selections.get().user_id == other.pk
+                grid = answers.read(answers.game_rows(game.pk), [], user.pk)
+                assert [row.question_id for row in grid.rows] == [question.pk]
+
+        out = io.StringIO()
+        call_command("rebalance_shards", stdout=out)
+        assert out.getvalue() == "Moved 0 games\n"
+
+
+@pytest.mark.django_db
+class TestAnswerMatrix:
+    def test_record_and_read(self, user, django_assert_num_queries):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        first = factories.question_factory(game=game, respondent=other)
+        second = factories.question_factory(game=game, respondent=user)
+        factories.question_factory(game=game, respondent=other)
+        selections = [
+            factories.selection_factory(user=other, question=first, option_idx=1),
+            factories.selection_factory(user=user, question=first, option_idx=0),
+            factories.selection_factory(user=user, question=second, option_idx=1),
+        ]
+        with django_assert_num_queries(2):
+            answers.record(selections)
+        # recording a selection again changes nothing
+        answers.record(selections[:1])
+        first.answer_idx = 1
+        first.scored_at = timezone.now()
+        first.save()
+        # a player who joined late adds a byte to the rows they answer
+        third = factories.user_factory(username="third")
+        game.users.add(third)
+        answers.record(
+            [factories.selection_factory(user=third, question=second, option_idx=1)],
+            scored=[first, second],
+        )
+
+        rows = answers.game_rows(game.pk)
+        assert [(row.user_ids, bytes(row.picks), row.answer) for row in rows] == [
+            ([other.pk, user.pk], bytes([2, 1]), 2),
+            ([user.pk, third.pk], bytes([2, 2]), 0),
+            ([], b"", 0),
+        ]
+        member_ids = [user.pk, other.pk, third.pk]
+        grid = answers.read(rows, member_ids, third.pk)
+        assert grid == answers.read(answers.build([first.pk, second.pk]), [], third.pk)
+        assert grid.user_ids == [user.pk, other.pk, third.pk]
+        assert [row.question_id for row in grid.rows] == [first.pk, second.pk]
+        assert grid.rows[0].cells == [
+            answers.Cell(
+                option_idx=0, is_respondent=False, correct=False, answered=True
+            ),
+            answers.Cell(option_idx=1, is_respondent=True, correct=None, answered=True),
+            answers.Cell(
+                option_idx=None, is_respondent=False, correct=None, answered=False
+            ),
+        ]
+        assert [player.accuracy for player in grid.accuracy] == [0.0, None, None]
+        assert not hasattr(grid.rows[0].cells[0], "__dict__")
+
+        # the second question is not scored, only who answered it shows to
+        # a player who did not
+        grid = answers.read(rows, member_ids, other.pk)
+        assert [cell.option_idx for cell in grid.rows[1].cells] == [None] * 3
+        assert [cell.answered for cell in grid.rows[1].cells] == [True, False, True]
+        assert [cell.option_idx for cell in grid.rows[0].cells] == [0, 1, None]
+
+    def test_missing_rows_are_rebuilt(self, user):
+        question = factories.question_factory(respondent=user)
+        selection = factories.selection_factory(user=user, question=question)
+        AnswerRow.objects.all().delete()
+        answers.record([selection])
+        [row] = answers.game_rows(question.game_id)
+        assert (row.user_ids, bytes(row.picks)) == ([user.pk], b"\x01")
+        AnswerRow.objects.all().delete()
+        question.answer_idx = 0
+        question.scored_at = timezone.now()
+        question.save()
+        answers.record([], scored=[question])
+        [row] = answers.game_rows(question.game_id)
+        assert str(row) == f"self.question_id={question.pk}"
+        assert row.answer == 1
+        answers.record([])
+
+    def test_rebuild_command(self):
+        game = factories.game_factory()
+        question = factories.question_factory(game=game)
+        out = io.StringIO()
+        AnswerRow.objects.all().delete()
+        call_command("rebuild_answer_matrix", game.slug, stdout=out)
+        call_command("rebuild_answer_matrix", all=True, stdout=out)
+        assert out.getvalue() == (
+            "Rebuilt 1 answer matrices\nRebuilt 1 answer matrices\n"
+        )
+        assert AnswerRow.objects.get().question == question
+        with pytest.raises(CommandError, match="Pass game slugs or --all"):
+            call_command("rebuild_answer_matrix")
+        with pytest.raises(CommandError, match="Unknown games: missing"):
+            call_command("rebuild_answer_matrix", "missing")
+
+
+class RecordingSink(outbox.Sink):
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def deliver(self, events):
+        if self.fail:
+            raise ConnectionError("sink is down")
+        self.batches.append([event.kind for event in events])
+
+
+@pytest.mark.django_db
+class TestOutbox:
+    def test_relay(self, user, settings, django_assert_num_queries):
+        settings.OUTBOX_MAX_ATTEMPTS = 2
+        selection = factories.selection_factory(user=user)
+        outbox.emit([selection], scored=[selection.question])
+        outbox.emit([])
+        sink = RecordingSink()
+        with django_assert_num_queries(4):
+            batch = outbox.relay(batch_size=1, sinks=[sink])
+        assert batch == outbox.Batch(delivered=1)
+        assert outbox.relay(sinks=[sink]) == outbox.Batch(delivered=1)
+        assert outbox.relay(sinks=[sink]) == outbox.Batch()
+        assert sink.batches == [["selection.created"], ["question.scored"]]
+
+        outbox.emit([selection])
+        down = RecordingSink(fail=True)
+        failed = outbox.Batch(failed=1, error="ConnectionError: sink is down")
+        assert outbox.relay(sinks=[sink, down]) == failed
+        assert outbox.relay(sinks=[down]) == failed
+        # given up after OUTBOX_MAX_ATTEMPTS
+        assert outbox.relay(sinks=[sink]) == outbox.Batch()
+        event = OutboxEvent.objects.get(delivered_at__isnull=True)
+        assert (event.attempts, event.last_error) == (2, failed.error)
+        assert str(event) == f"selection.created {event.pk}"
+
+    def test_sinks(self, user, settings, tmp_path):
+        settings.OUTBOX_FILE = str(tmp_path / "outbox.jsonl")
+        selection = factories.selection_factory(user=user)
+        outbox.emit([selection])
+        events = list(OutboxEvent.objects.all())
+
+        outbox.get_sinks(["file"])[0].deliver(events)
+        line = json.loads((tmp_path / "outbox.jsonl").read_text())
+        assert line["kind"] == "selection.created"
+        assert line["payload"]["selection"] == selection.pk
+
+        with patch("urllib.request.urlopen") as urlopen:
+            outbox.get_sinks(["http"])[0].deliver(events)
+        request = urlopen.call_args.args[0]
+        assert request.full_url == settings.OUTBOX_HTTP_URL
+        assert json.loads(request.data)["events"][0]["id"] == events[0].pk
+
+        seen = []
+        outbox.handler("test.kind")(seen.append)
+        try:
+            events[0].kind = "test.kind"
+            outbox.get_sinks()[0].deliver(events)
+        finally:
+            del outbox.handlers.handlers["test.kind"]
+        assert seen == events
+
+        with pytest.raises(ImproperlyConfigured, match="Unknown outbox sink 'nope'"):
+            outbox.get_sinks(["nope"])
+        with pytest.raises(TypeError, match="abstract method 'deliver'"):
+            outbox.Sink()
+
+    def test_relay_command(self, user, settings, tmp_path):
+        settings.OUTBOX_FILE = str(tmp_path / "outbox.jsonl")
+        settings.OUTBOX_SINKS = ["file"]
+        game = factories.game_factory(users=(user,))
+        for _ in range(3):
+            question = factories.question_factory(game=game, respondent=user)
+            outbox.emit([factories.selection_factory(user=user, question=question)])
+        out = io.StringIO()
+        call_command("relay_outbox", batch_size=2, stdout=out)
+        assert out.getvalue() == "Delivered 3 events\n"
+        assert len((tmp_path / "outbox.jsonl").read_text().splitlines()) == 3
+
+        outbox.emit([Selection.objects.first()])
+        with patch.object(outbox.FileSink, "deliver", side_effect=OSError("full")):
+            with pytest.raises(CommandError, match="1 events not delivered"):
+                call_command("relay_outbox", stdout=out)
+            err = io.StringIO()
+            with patch("time.sleep", side_effect=[None, KeyboardInterrupt]):
+                call_command("relay_outbox", "--loop", stdout=out, stderr=err)
+        assert err.getvalue().count("OSError: full") == 2
+        call_command("relay_outbox", sinks="handlers", stdout=out)
+        assert out.getvalue().endswith("Delivered 1 events\n")
+
+
+@pytest.mark.django_db(databases="__all__")
+class TestPurge:
+    def play(self, game, respondent, player):
+        question = factories.question_factory(game=game, respondent=respondent)
+        for user in [respondent, player]:
+            factories.selection_factory(user=user, question=question, points=1)
+        return question
+
+    def test_games(self, user, django_capture_on_commit_callbacks):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        kept = factories.game_factory(slug="kept", users=(user, other))
+        for _ in range(2):
+            self.play(game, user, other)
+        kept_question = self.play(kept, other, user)
+        assert leaderboard.refresh_if_stale()
+
+        reports = []
+        with django_capture_on_commit_callbacks(execute=True):
+            with patch("time.sleep") as sleep:
+                result = purge.games(
+                    [game.pk],
+                    batch_size=3,
+                    sleep=1,
+                    report=lambda *args: reports.append(args),
+                )
+        # between the 4 batches
+        assert sleep.call_count == 3
+        assert reports == [
+            ("forcedfun.Selection", 3),
+            ("forcedfun.Selection", 4),
+            ("forcedfun.Question", 2),
+            ("forcedfun.Game_users", 2),
+        ]
+        assert +result.deleted == {
+            "forcedfun.Selection": 4,
+            "forcedfun.Question": 2,
+            "forcedfun.AnswerRow": 2,
+            "forcedfun.Game_users": 2,
+            "forcedfun.Game": 1,
+        }
+        assert list(Game.objects.all()) == [kept]
+        assert list(Question.objects.all()) == [kept_question]
+        assert Selection.objects.count() == 2
+        # for the refresh job
+        assert leaderboard.refresh_if_stale()
+        assert Leaderboard.objects.get(user=user).points == 1
+
+    def test_users(self, sharded, user, django_capture_on_commit_callbacks):
+        other = factories.user_factory(username="other")
+        profile = RequestProfile.objects.create(
+            user=other, path="/", duration_ms=1, sql_ms=1, n_queries=1
+        )
+        game = factories.game_factory(slug="game4", users=(user, other))
+        self.play(game, user, other)
+        answered = self.play(game, other, user)
+        with shards.using("shard1"):
+            sharded_game = factories.game_factory(slug="game1", users=(user, other))
+            self.play(sharded_game, user, other)
+            answers.record(list(Selection.objects.all()))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            result = purge.users([other.pk])
+        assert result.deleted["auth.User"] == 1
+        assert not User.objects.using("shard1").filter(username="other").exists()
+        assert User.objects.using("shard1").filter(username="user").exists()
+        # the question they answered goes with everyone's selections of it
+        assert not Question.objects.filter(pk=answered.pk).exists()
+        for alias, game in [("default", game), ("shard1", sharded_game)]:
+            with shards.using(alias):
+                assert set(Selection.objects.values_list("user", flat=True)) == {
+                    user.pk
+                }
+                assert list(game.users.all()) == [user]
+                rows = answers.game_rows(game.pk)
+                assert [row.user_ids for row in rows] == [[user.pk]]
+        profile.refresh_from_db()
+        assert profile.user is None
+        assert leaderboard.refresh_if_stale()
+        assert list(Leaderboard.objects.values_list("user", flat=True)) == [user.pk]
+
+    def test_command(self, user):
+        with pytest.raises(CommandError, match="Pass --game, --user or --queued"):
+            call_command("purge")
+        with pytest.raises(CommandError, match="Unknown game: nope"):
+            call_command("purge", "--game", "nope")
+        with pytest.raises(CommandError, match="Unknown users: nope"):
+            call_command("purge", "--user", "nope")
+        out = io.StringIO()
+        call_command(
+            "purge", "--game", factories.game_factory(slug="solo").slug, stdout=out
+        )
+        assert out.getvalue() == "Deleted 1 forcedfun.Game\n"
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        self.play(game, user, other)
+
+        out = io.StringIO()
+        call_command(
+            "purge", "--game", game.slug, "--user", "other", "--sleep", "0", stdout=out
+        )
+        assert "forcedfun.Selection: 2 deleted" in out.getvalue()
+        assert out.getvalue().endswith(
+            "Deleted 1 auth.User, 1 forcedfun.AnswerRow, 1 forcedfun.Game, "
+            "2 forcedfun.Game_users, 1 forcedfun.Question, 2 forcedfun.Selection\n"
+        )
+        assert list(User.objects.all()) == [user]
+
+    def test_drain(self, sharded, user):
+        other = factories.user_factory(username="other")
+        with shards.using("shard1"):
+            game = factories.game_factory(slug="game1", users=(user, other))
+            self.play(game, user, other)
+        # queued before the game moved to shard1
+        purge.enqueue("game", [game.pk], shard="default")
+        purge.enqueue("user", [other.pk])
+        LeaderboardState.objects.update(stale_since=None)
+        out = io.StringIO()
+        with patch("time.sleep", side_effect=KeyboardInterrupt):
+            call_command("purge", "--queued", "--loop", "--sleep", "0", stdout=out)
+        assert out.getvalue().endswith(
+            "Deleted 1 auth.User, 1 forcedfun.AnswerRow, 1 forcedfun.Game, "
+            "2 forcedfun.Game_users, 1 forcedfun.Question, 2 forcedfun.Selection\n"
+        )
+        assert not Game.objects.using("shard1").exists()
+        assert not PendingPurge.objects.exists()
+        # refreshed by the job
+        assert LeaderboardState.objects.get().refreshed_at is not None
+        # an empty queue deletes and refreshes nothing
+        call_command("purge", "--queued", stdout=out)
+        assert purge.drain().deleted == {}
+
+
+class TestRateLimit:
+    def test_parse_rate(self):
+        assert ratelimit.Rate.parse("10/m") == ratelimit.Rate(10, 10 / 60)
+
+    def test_token_bucket(self, tmp_path):
+        store = ratelimit.BucketStore(str(tmp_path / "buckets"))
+        rate = ratelimit.Rate(capacity=2, per_second=1)
+        assert store.take("a", rate, now=0) == 0
+        assert store.take("a", rate, now=0) == 0
+        assert store.take("a", rate, now=0) == 1
+        assert store.take("b", rate, now=0) == 0
+        # refilled, and shared with another process opening the file
+        other = ratelimit.BucketStore(str(tmp_path / "buckets"))
+        assert other.take("a", rate, now=1.5) == 0
+        assert other.take("a", rate, now=1.5) == pytest.approx(0.5)
+
+    def test_full_slots_evict_the_least_recently_used(self, tmp_path):
+        store = ratelimit.BucketStore(str(tmp_path / "buckets"), n_slots=1)
+        rate = ratelimit.Rate(capacity=1, per_second=1)
+        assert store.take("a", rate, now=0) == 0
+        assert store.take("a", rate, now=0) == 1
+        assert store.take("b", rate, now=0) == 0
+        assert store.take("a", rate, now=0) == 0
+
+
+class TestGunicorn:
+    @pytest.mark.django_db
+    def test_warm_up(self):
+        timings = warmup.warm_up(templates=True, database=True)
+        assert set(timings) == {"templates", "urls", "database"}
+        assert warmup.load_templates() > 0
+
+    def test_when_ready_warms_up_the_preloaded_master(self):
+        server = MagicMock()
+        server.cfg.preload_app = False
+        gunicorn_conf.when_ready(server)
+        server.log.info.assert_not_called()
+        server.cfg.preload_app = True
+        gunicorn_conf.when_ready(server)
+        server.log.info.assert_called_once()
+
+    @pytest.mark.django_db
+    def test_post_worker_init(self):
+        worker = MagicMock()
+        worker.cfg.preload_app = True
+        gunicorn_conf.post_worker_init(worker)
+        assert set(worker.log.info.call_args.args[-1]) == {"database"}
+        with patch.object(warmup, "ping_database", side_effect=OSError):
+            gunicorn_conf.post_worker_init(worker)
+        worker.log.exception.assert_called_once()
+
+    def test_benchmark_startup_command(self):
+        out = io.StringIO()
+        call_command("benchmark_startup", runs=1, path="/health/", stdout=out)
+        assert "median time to first response" in out.getvalue()
+
+    def test_benchmark_startup_command_timeout(self):
+        with patch("forcedfun.management.commands.benchmark_startup.get") as get:
+            get.return_value = None
+            with pytest.raises(CommandError, match="No response"):
+                call_command("benchmark_startup", runs=1, timeout=0)
+
+
+class TestAnalytics:
+    @pytest.fixture
+    def game(self, user):
+        respondent = factories.user_factory(username="respondent")
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(respondent, other, user))
+        for respondent_idx, other_idx, user_idx in ((0, 0, 1), (1, 1, 1)):
+            question = factories.question_factory(game=game, respondent=respondent)
+            factories.selection_factory(
+                user=respondent, question=question, option_idx=respondent_idx
+            )
+            factories.selection_factory(
+                user=other, question=question, option_idx=other_idx
+            )
+            factories.selection_factory(
+                user=user, question=question, option_idx=user_idx
+            )
+        # the respondent has not answered yet, so nothing is guessed
+        question = factories.question_factory(game=game, respondent=respondent)
+        factories.selection_factory(user=user, question=question)
+        return game
+
+    def test_report(self, game):
+        report = analytics.report(Game.objects.all(), chunk_size=2)
+        assert report["users"] == [
+            {
+                "user": "user",
+                "guesses": 2,
+                "accuracy": 0.5,
+                "asked": 0,
+                "majority_rate": None,
+            },
+            {
+                "user": "respondent",
+                "guesses": 0,
+                "accuracy": None,
+                "asked": 2,
+                "majority_rate": 1.0,
+            },
+            {
+                "user": "other",
+                "guesses": 2,
+                "accuracy": 1.0,
+                "asked": 0,
+                "majority_rate": None,
+            },
+        ]
+        assert report["games"] == [
+            {
+                "game": game.slug,
+                "questions": 3,
+                "guesses": 4,
+                "difficulty": 0.25,
+                "agreement": {
+                    "users": ["user", "respondent", "other"],
+                    "matrix": [
+                        [1.0, 0.5, 0.5],
+                        [0.5, 1.0, 1.0],
+                        [0.5, 1.0, 1.0],
+                    ],
+                },
+            }
+        ]
+
+    @pytest.mark.django_db(databases="__all__")
+    def test_report_of_every_shard(self, sharded, user):
+        other = factories.user_factory(username="other")
+        for alias, slug in [("shard2", "game2"), ("default", "game4")]:
+            with shards.using(alias):
+                game = factories.game_factory(slug=slug, users=(user, other))
+                question = factories.question_factory(game=game, respondent=other)
+                factories.selection_factory(user=other, question=question)
+                factories.selection_factory(user=user, question=question)
+        report = analytics.report(Game.objects.all())
+        assert [game["game"] for game in report["games"]] == ["game4", "game2"]
+        assert [(user["user"], user["guesses"]) for user in report["users"]] == [
+            ("user", 2),
+            ("other", 0),
+        ]
+
+    @pytest.mark.django_db
+    def test_empty_report(self):
+        assert analytics.report(Game.objects.all()) == {"users": [], "games": []}
+
+    def test_command(self, game, tmp_path):
+        out = io.StringIO()
+        call_command("analytics", game.slug, output=tmp_path, save=True, stdout=out)
+        report = json.loads((tmp_path / "report.json").read_text())
+        assert AnalyticsReport.objects.get().report == report
+
+        call_command("analytics", format="csv", output=tmp_path, stdout=out)
+        assert (tmp_path / "users.csv").read_text().splitlines()[:2] == [
+            "user,guesses,accuracy,asked,majority_rate",
+            "user,2,0.5,0,",
+        ]
+        assert (tmp_path / "games.csv").read_text().splitlines()[1] == (
+            f"{game.slug},3,4,0.25"
+        )
+        agreement = (tmp_path / f"agreement-{game.slug}.csv").read_text()
+        assert agreement.splitlines()[0] == ",user,respondent,other"
+
+    def test_command_without_numpy(self, tmp_path):
+        with patch.dict("sys.modules", {"numpy": None}):
+            with pytest.raises(CommandError, match="numpy is required"):
+                call_command("analytics", output=tmp_path)
+
+
 @pytest.mark.django_db
 def test_user_in_game_check_or_302(user, authenticated_request):
     game = factories.game_factory(users=())
@@ -130,7 +1132,538 @@ def test_user_in_game_check_or_302(user, authenticated_request):
             authenticated_request, game, redirect_to="index"
         )
 
-    # happy path does not explode
+    # happy path does not explode, membership is memoized per request
     game.users.add(user)
+    authenticated_request.loader = Loader()
     authenticated_request.user = user
     utils.user_in_game_check_or_302(authenticated_request, game, redirect_to="index")
+
+
+def test_getint():
+    assert utils.getint("3") == 3
+    assert utils.getint("three") is None
+    assert utils.getint(None) is None
+
+
+class TestKeysetPage:
+    def test_decode_cursor(self):
+        assert pagination.decode_cursor("1.2", n_keys=2) == (1, 2)
+        assert pagination.decode_cursor("1.2", n_keys=1) is None
+        assert pagination.decode_cursor("1.x", n_keys=2) is None
+
+    @pytest.mark.django_db
+    def test_pages_do_not_overlap(self):
+        respondent = factories.user_factory()
+        game = factories.game_factory(users=(respondent,))
+        questions = [
+            factories.question_factory(game=game, respondent=respondent, points=points)
+            for points in (2, 1, 2, 1, 3)
+        ]
+        expected = sorted(questions, key=lambda q: (q.points, q.id), reverse=True)
+
+        cursor = None
+        seen = []
+        while True:
+            page = pagination.keyset_page(
+                game.questions.all(), keys=("points", "id"), cursor=cursor, per_page=2
+            )
+            seen.extend(page.object_list)
+            if page.next_cursor is None:
+                break
+            cursor = page.next_cursor
+
+        assert seen == expected
+
+    def test_merge_pages(self):
+        Row = collections.namedtuple("Row", "id")
+        pages = [
+            pagination.KeysetPage([Row(5), Row(3)], next_cursor="3"),
+            pagination.KeysetPage([Row(4)], next_cursor=None),
+        ]
+        page = pagination.merge_pages(pages, keys=("id",), per_page=2)
+        assert page == pagination.KeysetPage([Row(5), Row(4)], next_cursor="4")
+        page = pagination.merge_pages(pages[1:], keys=("id",), per_page=2)
+        assert page == pagination.KeysetPage([Row(4)], next_cursor=None)
+
+    @pytest.mark.django_db
+    def test_invalid_cursor_is_the_first_page(self):
+        selection = factories.selection_factory()
+        page = pagination.keyset_page(
+            Selection.objects.all(), keys=("id",), cursor="nope", per_page=1
+        )
+        assert page.object_list == [selection]
+        assert page.next_cursor is None
+
+
+class TestReadModels:
+    @pytest.mark.django_db
+    def test_game_rows(self, user, django_assert_num_queries):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        question = factories.question_factory(
+            game=game, respondent=other, points=2, scored_at=timezone.now()
+        )
+        factories.selection_factory(user=user, question=question, points=2)
+        factories.question_factory(game=game, respondent=user, points=3)
+
+        with django_assert_num_queries(1):
+            scores = readmodels.player_scores(game)
+        assert scores == [
+            readmodels.PlayerScore(id=other.pk, username="other", points=0),
+            readmodels.PlayerScore(id=user.pk, username="user", points=2),
+        ]
+        assert not hasattr(scores[0], "__dict__")
+
+        with django_assert_num_queries(1):
+            page = readmodels.question_page(
+                game.questions.all(), cursor=None, per_page=1
+            )
+        assert page.object_list == [
+            readmodels.QuestionRow(
+                id=page.object_list[0].id,
+                options=["option1", "option2"],
+                points=3,
+                scored_at=None,
+                respondent_username="user",
+            )
+        ]
+        page = readmodels.question_page(
+            game.questions.all(), cursor=page.next_cursor, per_page=1
+        )
+        assert page.object_list == [readmodels.question_row(question)]
+        assert page.next_cursor is None
+
+    @pytest.mark.django_db
+    def test_player_selections(self, user):
+        other = factories.user_factory(username="other")
+        third = factories.user_factory(username="third")
+        game = factories.game_factory(users=(user, other, third))
+        question = factories.question_factory(game=game, respondent=user)
+        factories.selection_factory(user=other, question=question, option_idx=1)
+        players = readmodels.player_selections(question, question.selections.all())
+        assert [(p.username, p.option_idx, p.option_text) for p in players] == [
+            ("other", 1, "option2"),
+            ("third", None, None),
+        ]
+
+    @pytest.mark.django_db
+    def test_pending_questions(self, user, django_assert_num_queries):
+        other = factories.user_factory(username="other")
+        now = timezone.now()
+        new = factories.game_factory(slug="new", users=(user, other))
+        pending = factories.question_factory(game=new, respondent=other, points=1)
+        factories.question_factory(game=new, respondent=other, points=2)
+        answered = factories.game_factory(slug="answered", users=(user, other))
+        question = factories.question_factory(game=answered, respondent=user)
+        factories.selection_factory(user=user, question=question)
+        waiting = factories.game_factory(slug="waiting", users=(user, other))
+        factories.question_factory(game=waiting, respondent=other, scored_at=now)
+        factories.question_factory(game=waiting, respondent=other, points=2)
+        released = factories.game_factory(slug="released", users=(user, other))
+        factories.question_factory(
+            game=released,
+            respondent=other,
+            scored_at=now - utils.RELEASE_DELAY - timedelta(minutes=1),
+        )
+        next_question = factories.question_factory(
+            game=released, respondent=user, points=2
+        )
+        factories.question_factory(
+            game=factories.game_factory(slug="elsewhere", users=(other,)),
+            respondent=other,
+        )
+
+        with django_assert_num_queries(1):
+            questions = readmodels.pending_questions(user.id)
+        assert [(q.id, q.game_slug) for q in questions] == [
+            (pending.id, "new"),
+            (next_question.id, "released"),
+        ]
+        assert questions[0].respondent_username == "other"
+        assert readmodels.pending_questions(other.id)[0].game_slug == "answered"
+
+
+class TestLoader:
+    @pytest.mark.django_db
+    def test_load_many_batches_and_memoizes(self, django_assert_num_queries):
+        users = [factories.user_factory(username=f"user{i}") for i in range(3)]
+        loader = Loader()
+        with django_assert_num_queries(1):
+            loaded = loader.load_many(User, [user.pk for user in users] + [0])
+            assert loader.load(User, users[0].pk) is loaded[users[0].pk]
+        assert 0 not in loaded
+
+    @pytest.mark.django_db
+    def test_get_or_404(self):
+        user = factories.user_factory()
+        loader = Loader()
+        assert loader.get_or_404(User, user.pk) == user
+        with pytest.raises(Http404):
+            loader.get_or_404(User, 0)
+        with pytest.raises(Http404):
+            loader.question_or_404(0)
+
+    @pytest.mark.django_db
+    def test_question_relations_are_loaded_once(self, django_assert_num_queries):
+        selection = factories.selection_factory()
+        loader = Loader()
+        with django_assert_num_queries(3):
+            question = loader.question_or_404(selection.question_id)
+            assert loader.question_or_404(selection.question_id) is question
+            assert loader.load(User, question.respondent_id) is question.respondent
+            assert question.game.slug == "gamedefault"
+            assert loader.game_user_ids(question.game) == {selection.user_id}
+            assert loader.game_user_ids(question.game) == {selection.user_id}
+            assert loader.user_selection(question, selection.user_id) == selection
+            assert loader.user_selection(question, 0) is None
+
+    @pytest.mark.django_db
+    def test_forget_selections(self):
+        question = factories.question_factory()
+        loader = Loader()
+        assert loader.question_selections(question) == []
+        selection = factories.selection_factory(
+            user=question.respondent, question=question
+        )
+        assert loader.question_selections(question) == []
+        assert not loader.has_selection(question, question.respondent_id)
+        loader.forget_selections(question)
+        assert loader.has_selection(question, question.respondent_id)
+        assert loader.question_selections(question) == [selection]
+        assert loader.has_selection(question, question.respondent_id)
+        loader.forget_selections(question)
+
+
+class TestQueryInspection:
+    def test_fingerprint(self):
+        assert sql.fingerprint(
+            "SELECT * FROM t WHERE a = 'x''y' AND b = 12 AND c IN (%s, %s, %s)"
+        ) == sql.fingerprint("SELECT *  FROM t WHERE a = 'z' AND b = 3 AND c IN (%s)")
+
+    def test_inspect_queries(self):
+        queries = [
+            sql.QueryRecord(sql="SELECT 1 WHERE id = %s", params=(i,), duration=0)
+            for i in (1, 2, 3, 3)
+        ]
+        report = sql.inspect_queries(queries, url_name="name", threshold=3)
+        assert report.repeated == {"SELECT ? WHERE id = ?": 4}
+        assert report.duplicates == {"SELECT 1 WHERE id = %s": 2}
+        assert report.has_problems
+        assert "repeated 4x" in str(report)
+        assert "duplicate 2x" in str(report)
+
+        report = sql.inspect_queries(queries[:3], url_name="name", threshold=3)
+        assert not report.has_problems
+
+        # the same statement on another shard
+        queries[3].alias = "shard1"
+        report = sql.inspect_queries(queries, url_name="name", threshold=4)
+        assert not report.has_problems
+
+    @pytest.mark.django_db(databases="__all__")
+    def test_slow_query_recorder(self):
+        recorder = sql.SlowQueryRecorder(threshold=0)
+        with sql.execute_wrapper(recorder):
+            User.objects.using("shard1").exists()
+            with pytest.raises(DatabaseError), transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT * FROM nope")
+        shard_query, failed = [q for q in recorder.queries if "SAVEPOINT" not in q.sql]
+        assert (shard_query.alias, shard_query.error) == ("shard1", "")
+        assert failed.alias == "default"
+        assert failed.error.startswith("ProgrammingError") or failed.error.startswith(
+            "OperationalError"
+        )
+
+    def test_call_site_outside_the_package(self):
+        assert sql.call_site() == ""
+
+    @pytest.mark.django_db
+    @pytest.mark.postgres
+    def test_explain(self):
+        assert "actual time" in sql.explain("SELECT %s", (1,))
+        assert sql.explain("UPDATE auth_user SET username = username", ()) == ""
+
+    @pytest.fixture()
+    def n_plus_one_middleware(self, db):
+        def get_response(request):
+            for user in User.objects.all():
+                User.objects.filter(pk=user.pk).exists()
+            return HttpResponse()
+
+        for i in range(4):
+            factories.user_factory(username=f"user{i}")
+        return QueryInspectMiddleware(get_response)
+
+    def test_off(self, n_plus_one_middleware, rf, settings):
+        settings.QUERY_INSPECT_MODE = "off"
+        assert n_plus_one_middleware(rf.get("/")).status_code == 200
+
+    def test_raise(self, n_plus_one_middleware, rf):
+        with pytest.raises(QueryInspectError):
+            n_plus_one_middleware(rf.get("/"))
+
+    def test_warn(self, n_plus_one_middleware, rf, settings):
+        settings.QUERY_INSPECT_MODE = "warn"
+        with pytest.warns(QueryInspectWarning):
+            n_plus_one_middleware(rf.get("/"))
+
+    def test_log(self, n_plus_one_middleware, rf, settings, tmp_path):
+        settings.QUERY_INSPECT_MODE = "log"
+        settings.QUERY_INSPECT_REPORT = tmp_path / "report.jsonl"
+        n_plus_one_middleware(rf.get("/"))
+        line = json.loads(settings.QUERY_INSPECT_REPORT.read_text())
+        assert line["path"] == "/"
+        assert line["n_queries"] == 5
+
+    def test_ignores_unknown_modes(self, n_plus_one_middleware, rf, settings):
+        settings.QUERY_INSPECT_MODE = "unknown"
+        assert n_plus_one_middleware(rf.get("/")).status_code == 200
+
+
+class TestProfiling:
+    def test_sampling_profiler(self):
+        profiler = profiling.SamplingProfiler(interval=0.001)
+        profiler.start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        profiler.stop()
+        assert profiler.samples
+        stack, weight = profiler.samples[0]
+        assert stack[-1][0] == "test_sampling_profiler"
+        assert weight > 0
+
+    def test_sampling_profiler_unknown_thread(self):
+        profiler = profiling.SamplingProfiler(interval=0.001, thread_id=-1)
+        profiler.start()
+        time.sleep(0.01)
+        profiler.stop()
+        assert profiler.samples == []
+
+    def test_to_speedscope(self):
+        frame = ("view", "views.py", 1)
+        speedscope = profiling.to_speedscope(
+            name="GET /",
+            samples=[((frame,), 0.5), ((frame, ("render", "t.py", 2)), 0.25)],
+            queries=[sql.QueryRecord(sql="SELECT 1", params=(), duration=0.1)],
+        )
+        frames = speedscope["shared"]["frames"]
+        assert [f["name"] for f in frames] == ["view", "render", "SQL: SELECT ?"]
+        stacks, queries = speedscope["profiles"]
+        assert stacks["samples"] == [[0], [0, 1]]
+        assert stacks["endValue"] == 0.75
+        assert queries["samples"] == [[2]]
+
+
+class TestTracing:
+    def test_disabled_span_is_a_noop(self, settings):
+        settings.TRACING_EXPORTER = ""
+        with tracing.span("noop") as span:
+            assert span is None
+            assert tracing.current_trace_id() == ""
+
+    def test_nested_spans_export_one_trace(self, settings, tmp_path):
+        settings.TRACING_EXPORTER = "file"
+        settings.TRACING_FILE = tmp_path / "traces.jsonl"
+
+        @tracing.traced
+        def child():
+            return tracing.current_trace_id()
+
+        with tracing.span("root", flag=True, rows=2, name="x") as root:
+            assert child() == root.trace_id
+            with pytest.raises(ValueError):
+                with tracing.span("error"):
+                    raise ValueError
+
+        (line,) = settings.TRACING_FILE.read_text().splitlines()
+        (resource_spans,) = json.loads(line)["resourceSpans"]
+        spans = resource_spans["scopeSpans"][0]["spans"]
+        assert [span["name"] for span in spans] == ["child", "error", "root"]
+        assert {span["traceId"] for span in spans} == {root.trace_id}
+        assert spans[0]["parentSpanId"] == root.span_id
+        assert spans[1]["attributes"] == [
+            {"key": "exception.type", "value": {"stringValue": "ValueError"}}
+        ]
+        assert spans[2]["parentSpanId"] == ""
+        assert spans[2]["attributes"] == [
+            {"key": "flag", "value": {"boolValue": True}},
+            {"key": "rows", "value": {"intValue": "2"}},
+            {"key": "name", "value": {"stringValue": "x"}},
+        ]
+
+    def test_console_exporter(self, settings, capsys):
+        settings.TRACING_EXPORTER = "console"
+        with tracing.span("root"):
+            pass
+        assert '"name": "root"' in capsys.readouterr().err
+
+    def test_unknown_exporter_drops_the_trace(self, settings, capsys):
+        settings.TRACING_EXPORTER = "unknown"
+        with tracing.span("root"):
+            pass
+        assert capsys.readouterr().err == ""
+
+
+class TestLoadTest:
+    # live_server threads share one in-memory SQLite connection
+    @pytest.mark.postgres
+    @pytest.mark.django_db(transaction=True)
+    def test_simulates_a_game(self, live_server):
+        out = io.StringIO()
+        call_command(
+            "loadtest", base_url=live_server.url, players=3, questions=2, stdout=out
+        )
+        output = out.getvalue()
+        assert "selection-create" in output
+        assert "error rate 0.0%" in output
+        assert "scoring: 2/2 questions scored correctly" in output
+        assert not Game.objects.exists()
+        assert not User.objects.exists()
+
+    @pytest.mark.django_db(transaction=True)
+    def test_unreachable_server(self):
+        out = io.StringIO()
+        with pytest.raises(CommandError):
+            call_command(
+                "loadtest",
+                base_url="http://127.0.0.1:9",
+                players=1,
+                keep=True,
+                stdout=out,
+            )
+        assert "error rate 100.0%" in out.getvalue()
+        assert Game.objects.exists()
+
+    @pytest.mark.django_db
+    def test_check_scoring_skips_unscored_questions(self):
+        question = factories.question_factory()
+        assert check_scoring([question]) == 0
+
+    def test_check_scoring_with_streaks(self, user, settings):
+        settings.SCORING_RULE = "streak"
+        respondent = factories.user_factory(username="respondent")
+        game = factories.game_factory(users=(respondent, user))
+        questions = []
+        for _ in range(2):
+            question = factories.question_factory(game=game, respondent=respondent)
+            for player in [respondent, user]:
+                factories.selection_factory(user=player, question=question)
+            utils.score_questions([question])
+            questions.append(question)
+        assert Selection.objects.get(user=user, question=questions[1]).points == 2
+        assert check_scoring(questions) == 2
+
+    @pytest.mark.django_db
+    def test_check_scoring_catches_wrong_points(self, user):
+        respondent_selection = factories.selection_factory(option_idx=0, points=1)
+        question = respondent_selection.question
+        factories.selection_factory(question=question, user=user, option_idx=0)
+        question.scored_at = timezone.now()
+        question.save()
+        assert check_scoring([question]) == 0
+
+    def test_csrf_token(self):
+        player = Player("http://testserver", "username", "password")
+        assert player.csrf_token() == ""
+        for name in ("sessionid", "csrftoken"):
+            player.cookies.set_cookie(
+                http.cookiejar.Cookie(
+                    0,
+                    name,
+                    "value",
+                    None,
+                    False,
+                    "testserver",
+                    False,
+                    False,
+                    "/",
+                    True,
+                    False,
+                    None,
+                    False,
+                    None,
+                    None,
+                    {},
+                )
+            )
+        assert player.csrf_token() == "value"
+
+    def test_percentile(self):
+        assert percentile([3, 1, 2], 50) == 2
+        assert percentile([1], 99) == 1
+
+
+class TestBenchmarks:
+    @pytest.mark.django_db
+    def test_benchmark_command(self, tmp_path):
+        output = tmp_path / "results.json"
+        out = io.StringIO()
+        call_command(
+            "benchmark",
+            sizes="10,20",
+            db_max_size=10,
+            repeat=1,
+            output=output,
+            stdout=out,
+        )
+        results = json.loads(output.read_text())["results"]
+        names = {(result["name"], result["size"]) for result in results}
+        assert ("score_selections", 20) in names
+        assert ("score_selections_db", 10) in names
+        assert ("score_selections_db", 20) not in names
+        assert all(result["peak_bytes"] > 0 for result in results)
+        assert not User.objects.filter(username__startswith="benchmark-").exists()
+
+        # compare against itself with a generous tolerance
+        call_command(
+            "benchmark",
+            benchmark=["option_percentages"],
+            sizes="10",
+            output=tmp_path / "again.json",
+            compare=output,
+            tolerance=1000,
+            stdout=out,
+        )
+
+    def test_benchmark_command_regression(self, tmp_path):
+        baseline = tmp_path / "baseline.json"
+        result = benchmarks.Result(
+            name="option_percentages",
+            size=10,
+            seconds=0,
+            mean_seconds=0,
+            peak_bytes=0,
+        )
+        baseline.write_text(json.dumps({"results": [dataclasses.asdict(result)]}))
+        with pytest.raises(CommandError):
+            call_command(
+                "benchmark",
+                benchmark=["option_percentages"],
+                sizes="10",
+                output=tmp_path / "results.json",
+                compare=baseline,
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+
+
+def test_option_percentages():
+    assert utils.option_percentages([0, 0, 1], n_options=2) == [67, 33]
+    assert utils.option_percentages([], n_options=2) == [0, 0]
+
+
+@pytest.mark.django_db
+def test_released_question(user):
+    game = factories.game_factory(users=(user,))
+    assert utils.released_question(game) is None
+    first = factories.question_factory(game=game, respondent=user)
+    assert utils.released_question(game) == first
+    first.scored_at = timezone.now()
+    first.save()
+    second = factories.question_factory(game=game, respondent=user, points=2)
+    assert utils.released_question(game) is None
+    first.scored_at = timezone.now() - timedelta(hours=2)
+    first.save()
+    assert utils.released_question(game) == second
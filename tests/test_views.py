@@ -1,14 +1,33 @@
+import json
 from unittest.mock import MagicMock
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db import connection
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import Client
 from django.urls import reverse
 from django.utils import timezone
 
 from forcedfun import factories
+from forcedfun import invites
+from forcedfun import leaderboard
+from forcedfun import middleware
+from forcedfun import ratelimit
+from forcedfun import utils
+from forcedfun import shards
 from forcedfun.errors import Http302
+from forcedfun.models import Leaderboard
+from forcedfun.models import LeaderboardState
+from forcedfun.models import OutboxEvent
 from forcedfun.models import Question
+from forcedfun.models import RequestProfile
 from forcedfun.models import Selection
+from forcedfun.models import SlowQuery
 from forcedfun.views import QuestionScoreView
 from forcedfun.views import SelectionCreateView
 
@@ -59,6 +78,100 @@ class TestIndexView:
         assert response.status_code == 200
         assert game.users.count() == 1
 
+    def test_pending_questions(self, user_client, user):
+        game = factories.game_factory(users=(user,))
+        question = factories.question_factory(game=game)
+        response = user_client.get(reverse("index"))
+        url = reverse("selection-create", kwargs={"question_pk": question.pk})
+        assert url.encode() in response.content
+
+    def test_unknown_slug(self, user_client):
+        cache.clear()
+        response = user_client.get(reverse("index") + "?slug=nope")
+        assert b"Game does not exist" in response.content
+
+
+class TestGameGridView:
+    def test_grid(self, user_client, user):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        question = factories.question_factory(game=game, respondent=other)
+        for player, option_idx in [(other, 1), (user, 1)]:
+            client = Client()
+            client.force_login(player)
+            url = reverse("selection-create", kwargs={"question_pk": question.pk})
+            client.post(url, data={"option_idx": option_idx})
+        response = user_client.get(reverse("game-grid", kwargs={"slug": game.slug}))
+        assert [name for name, _ in response.context["players"]] == ["user", "other"]
+        assert b"100%" in response.content
+
+    def test_hides_picks_of_unscored_questions(self, user_client, user):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        question = factories.question_factory(game=game, respondent=other)
+        client = Client()
+        client.force_login(other)
+        url = reverse("selection-create", kwargs={"question_pk": question.pk})
+        client.post(url, data={"option_idx": 1})
+
+        url = reverse("game-grid", kwargs={"slug": game.slug})
+        response = user_client.get(url)
+        [row] = response.context["rows"]
+        assert [(cell.option_idx, cell.answered) for cell in row.cells] == [
+            (None, False),
+            (None, True),
+        ]
+        assert b"<b>" not in response.content
+        # the respondent sees their own pick
+        [row] = client.get(url).context["rows"]
+        assert [cell.option_idx for cell in row.cells] == [None, 1]
+
+    def test_not_a_member(self, user_client):
+        game = factories.game_factory()
+        response = user_client.get(reverse("game-grid", kwargs={"slug": game.slug}))
+        assert response.status_code == 302
+
+
+class TestJoinView:
+    def test_invite_link(self, user_client, user):
+        game = factories.game_factory()
+        url = reverse("join", kwargs={"code": invites.make_code(game)})
+        response = user_client.get(url)
+        assert response.url == reverse("game-detail", kwargs={"slug": game.slug})
+        assert list(game.users.all()) == [user]
+
+        response = user_client.get(response.url)
+        assert url.encode() in response.content
+
+    def test_already_a_member(self, user_client, user):
+        game = factories.game_factory(users=(user,))
+        url = reverse("join", kwargs={"code": invites.make_code(game)})
+        response = user_client.get(url)
+        assert response.url == reverse("game-detail", kwargs={"slug": game.slug})
+        assert list(game.users.all()) == [user]
+
+    def test_deleted_game(self, user_client, user):
+        game = factories.game_factory()
+        code = invites.make_code(game)
+        game_id, slug = game.pk, game.slug
+        game.delete()
+        for url in [
+            reverse("join", kwargs={"code": code}),
+            reverse("index") + f"?slug={slug}",
+        ]:
+            # deleted in another process, this one still has its id cached
+            cache.set(invites.slug_key(slug), game_id)
+            response = user_client.get(url, follow=True)
+            assert response.redirect_chain == [(reverse("index"), 302)]
+            assert b"This game no longer exists." in response.content
+        assert invites.game_id_for_slug(slug) is None
+
+    def test_invalid_code(self, user_client, user):
+        response = user_client.get(
+            reverse("join", kwargs={"code": "nope"}), follow=True
+        )
+        assert b"This invite link is not valid." in response.content
+
 
 @pytest.mark.parametrize(
     "name, method",
@@ -81,6 +194,113 @@ class TestGameDetailView:
         response = user_client.get(url)
         assert response.status_code == 200
 
+    def test_paginates_scored_questions(self, user_client, user, settings):
+        settings.PAGE_SIZE = 2
+        game = factories.game_factory(users=(user,))
+        for points in (1, 2, 3):
+            factories.question_factory(
+                game=game, respondent=user, points=points, scored_at=timezone.now()
+            )
+        url = reverse("game-detail", kwargs={"slug": game.slug})
+        response = user_client.get(url)
+        numbered_questions = response.context["numbered_questions"]
+        assert [n for n, _ in numbered_questions] == [3, 2]
+        assert [q.points for _, q in numbered_questions] == [3, 2]
+
+        next_page = (
+            f"?after={response.context['next_cursor']}"
+            f"&start={response.context['next_start']}"
+        )
+        response = user_client.get(url + next_page)
+        numbered_questions = response.context["numbered_questions"]
+        assert [(n, q.points) for n, q in numbered_questions] == [(1, 1)]
+        assert response.context["next_cursor"] is None
+
+
+class TestSelectionHistoryView:
+    def test_ok(self, user_client, user, settings):
+        settings.PAGE_SIZE = 1
+        game = factories.game_factory(users=(user,))
+        first, second = (
+            factories.selection_factory(
+                user=user,
+                question=factories.question_factory(game=game, respondent=user),
+            )
+            for _ in range(2)
+        )
+        url = reverse("selection-history")
+        response = user_client.get(url)
+        assert response.status_code == 200
+        assert response.context["selections"] == [second]
+
+        response = user_client.get(url + f"?after={response.context['next_cursor']}")
+        assert response.context["selections"] == [first]
+
+
+class TestLeaderboardView:
+    def test_ranks_players_across_pages(self, user_client, user, settings):
+        settings.PAGE_SIZE = 1
+        other = factories.user_factory(username="other")
+        question = factories.question_factory(respondent=user, scored_at=timezone.now())
+        factories.selection_factory(user=user, question=question, points=1)
+        factories.selection_factory(user=other, question=question, points=2)
+        leaderboard.refresh()
+
+        url = reverse("leaderboard")
+        response = user_client.get(url)
+        assert [(rank, row.user) for rank, row in response.context["ranked_rows"]] == [
+            (1, other)
+        ]
+        assert b"100%" in response.content
+
+        next_page = (
+            f"?after={response.context['next_cursor']}"
+            f"&start={response.context['next_start']}"
+        )
+        response = user_client.get(url + next_page)
+        assert [(rank, row.user) for rank, row in response.context["ranked_rows"]] == [
+            (2, user)
+        ]
+        assert response.context["next_cursor"] is None
+
+    @pytest.mark.django_db(databases="__all__")
+    def test_sums_the_shards(self, sharded, user_client, user):
+        other = factories.user_factory(username="other")
+        for alias, slug, points in [("default", "game4", 1), ("shard1", "game1", 0)]:
+            with shards.using(alias):
+                question = factories.question_factory(
+                    game=factories.game_factory(slug=slug),
+                    respondent=other,
+                    scored_at=timezone.now(),
+                )
+                factories.selection_factory(user=user, question=question, points=points)
+                factories.selection_factory(user=other, question=question, points=2)
+        leaderboard.refresh()
+        response = user_client.get(reverse("leaderboard"))
+        rows = [
+            (rank, row.user, row.points, row.games, row.guesses, row.accuracy)
+            for rank, row in response.context["ranked_rows"]
+        ]
+        assert rows == [(1, other, 4, 2, 0, None), (2, user, 1, 2, 2, 0.5)]
+
+    def test_scoring_leaves_the_refresh_to_the_job(
+        self, admin_client, admin_user, django_capture_on_commit_callbacks
+    ):
+        leaderboard.refresh_if_stale()
+        selection = factories.selection_factory(user=admin_user)
+        question = selection.question
+        other = factories.user_factory(username="other")
+        factories.selection_factory(user=other, question=question)
+        url = reverse("question-score", kwargs={"pk": question.pk})
+        with django_capture_on_commit_callbacks(execute=True):
+            admin_client.post(url)
+        assert not Leaderboard.objects.filter(user=other).exists()
+        assert LeaderboardState.objects.get().stale_since is not None
+
+        assert leaderboard.refresh_if_stale()
+        assert Leaderboard.objects.get(user=other).points == 1
+        assert not leaderboard.refresh_if_stale()
+
 
 class TestQuestionDetailView:
     def test_ok(self, user_client, user):
@@ -176,21 +396,461 @@ class TestSelectionCreateView:
 
     def test_post_ok(self, user_client, user):
         question = factories.question_factory(respondent=user)
-        data = {
-            "option_idx": 0,
-            "option_text": question.options[0],
-        }
+        data = {"option_idx": 0}
         url = reverse("selection-create", kwargs={"question_pk": question.pk})
         response = user_client.post(url, data=data, follow=True)
         assert response.status_code == 200, response.content.decode()
         assert Selection.objects.count() == 1, response.content.decode()
 
+    def test_post_fetches_each_row_once(
+        self, user_client, user, django_assert_max_num_queries
+    ):
+        question = factories.question_factory(respondent=user)
+        data = {"option_idx": 0}
+        url = reverse("selection-create", kwargs={"question_pk": question.pk})
+        # session, user, question with game and respondent, members, duplicate
+        # check, question lock, insert, answer fields, the selections to
+        # score, the answer row lock and update and the outbox event, plus a
+        # savepoint
+        with django_assert_max_num_queries(15):
+            response = user_client.post(url, data=data)
+        assert response.status_code == 302
+
+    def test_post_writes_events_with_the_selection(self, user_client, user):
+        other = factories.user_factory(username="other")
+        question = factories.question_factory(
+            game=factories.game_factory(users=(user, other)), respondent=other
+        )
+        factories.selection_factory(user=other, question=question, option_idx=1)
+        url = reverse("selection-create", kwargs={"question_pk": question.pk})
+        with patch("forcedfun.outbox.emit", side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                user_client.post(url, data={"option_idx": 1})
+        assert not Selection.objects.filter(user=user).exists()
+
+        user_client.post(url, data={"option_idx": 1})
+        assert [
+            (event.kind, event.payload["question"])
+            for event in OutboxEvent.objects.order_by("id")
+        ] == [("selection.created", question.pk), ("question.scored", question.pk)]
+
+    def test_post_leaves_a_question_scored_meanwhile(self, user_client, user):
+        other = factories.user_factory(username="other")
+        question = factories.question_factory(
+            game=factories.game_factory(users=(user, other)), respondent=other
+        )
+        factories.selection_factory(user=other, question=question, option_idx=1)
+        lock_unscored = utils.lock_unscored
+
+        def score_first(question_ids):
+            # the admin's action commits before this answer takes the lock
+            Question.objects.filter(pk__in=question_ids).update(
+                scored_at=timezone.now()
+            )
+            return lock_unscored(question_ids)
+
+        url = reverse("selection-create", kwargs={"question_pk": question.pk})
+        with patch("forcedfun.utils.lock_unscored", side_effect=score_first):
+            response = user_client.post(url, data={"option_idx": 1})
+        assert response.status_code == 302
+        assert Selection.objects.get(user=user).points is None
+        assert not OutboxEvent.objects.filter(kind="question.scored").exists()
+
     def test_post_error(self, user_client, user):
         question = factories.question_factory(respondent=user)
-        data = {
-            "option_idx": 0,
-        }
+        data = {"option_idx": len(question.options)}
         url = reverse("selection-create", kwargs={"question_pk": question.pk})
         response = user_client.post(url, data=data, follow=True)
         assert response.status_code == 200
         assert Selection.objects.count() == 0
+
+
+class TestSelectionBatchCreateView:
+    def post(self, client, selections):
+        url = reverse("selection-batch-create")
+        data = json.dumps({"selections": selections})
+        return client.post(url, data=data, content_type="application/json")
+
+    def test_post_ok(self, user_client, user):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        question1 = factories.question_factory(game=game, respondent=other)
+        factories.selection_factory(user=other, question=question1, option_idx=1)
+        question2 = factories.question_factory(game=game, respondent=user)
+        solo_question = factories.question_factory(
+            game=factories.game_factory(slug="sologame", users=(user,)),
+            respondent=user,
+        )
+        not_member_question = factories.question_factory(
+            game=factories.game_factory(slug="othergame"), respondent=other
+        )
+        response = self.post(
+            user_client,
+            [
+                {"question": question1.pk, "option_idx": 1},
+                {"question": question2.pk, "option_idx": 0},
+                {"question": solo_question.pk, "option_idx": 0},
+                {"question": question2.pk, "option_idx": 1},
+                {"question": question1.pk + 1000, "option_idx": 0},
+                {"question": not_member_question.pk, "option_idx": 0},
+                {"question": question1.pk, "option_idx": 5},
+            ],
+        )
+        assert response.status_code == 201, response.content.decode()
+        data = response.json()
+        assert [s["question"] for s in data["created"]] == [
+            question1.pk,
+            question2.pk,
+            solo_question.pk,
+        ]
+        assert [(e["index"], e["error"]) for e in data["errors"]] == [
+            (3, "Question already answered"),
+            (4, "Question not found"),
+            (5, "Question not found"),
+            (6, "Question already answered"),
+        ]
+        # the solo question has no selections to score besides the respondent's
+        assert data["scored"] == [question1.pk]
+        question1.refresh_from_db()
+        assert question1.scored_at is not None
+        assert Selection.objects.get(question=question1, user=user).points == 1
+        question2.refresh_from_db()
+        assert (question2.answer_idx, question2.answer_text) == (0, "option1")
+        assert question2.scored_at is None
+
+        response = self.post(user_client, [{"question": question1.pk, "option_idx": 0}])
+        assert response.status_code == 400
+        assert response.json()["errors"][0]["error"] == "Question already answered"
+
+    def test_post_invalid_option(self, user_client, user):
+        question = factories.question_factory(respondent=user)
+        response = self.post(user_client, [{"question": question.pk, "option_idx": 2}])
+        assert response.status_code == 400
+        assert response.json()["errors"][0]["error"] == "Invalid option"
+
+    @pytest.mark.parametrize(
+        "body", ["", "[]", '{"selections": [{"question": 1}]}', '{"selections": 1}']
+    )
+    def test_post_invalid_body(self, user_client, body):
+        url = reverse("selection-batch-create")
+        response = user_client.post(url, data=body, content_type="application/json")
+        assert response.status_code == 400
+        assert response.json() == {"error": "Invalid JSON body"}
+
+    def test_post_query_count_does_not_grow_with_answers(
+        self, user_client, user, django_assert_max_num_queries
+    ):
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        selections = []
+        for _ in range(10):
+            question = factories.question_factory(game=game, respondent=other)
+            factories.selection_factory(user=other, question=question)
+            selections.append({"question": question.pk, "option_idx": 0})
+        # session, user, questions, answered, the unscored questions locked,
+        # insert, those to score, their selections, points
+        # and scored_at, the answer row lock and update and the outbox events
+        # of both, plus a savepoint
+        with django_assert_max_num_queries(18):
+            response = self.post(user_client, selections)
+        assert len(response.json()["scored"]) == 10
+
+
+class TestGameStateView:
+    def test_full_state_and_deltas(self, user_client, user, settings):
+        settings.GAME_STATE_OVERLAP_SECONDS = 0
+        other = factories.user_factory(username="other")
+        game = factories.game_factory(users=(user, other))
+        question = factories.question_factory(game=game, respondent=other, answer_idx=1)
+        factories.selection_factory(user=other, question=question, option_idx=1)
+        url = reverse("game-state", kwargs={"slug": game.slug})
+        response = user_client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["leaderboard"] == [
+            {"user": "other", "points": 0},
+            {"user": "user", "points": 0},
+        ]
+        # the first question is released before anything is scored
+        assert [q["id"] for q in data["questions"]] == [question.pk]
+        assert data["questions"][0]["answer_idx"] is None
+        assert data["selections"] == []
+
+        batch_url = reverse("selection-batch-create")
+        body = json.dumps({"selections": [{"question": question.pk, "option_idx": 1}]})
+        user_client.post(batch_url, data=body, content_type="application/json")
+        factories.question_factory(game=game, respondent=user)
+
+        response = user_client.get(url + f"?since={data['cursor']}")
+        data = response.json()
+        assert data["leaderboard"] == [
+            {"user": "other", "points": 1},
+            {"user": "user", "points": 1},
+        ]
+        # the next question waits an hour after the last one was scored
+        assert [q["id"] for q in data["questions"]] == [question.pk]
+        assert data["questions"][0]["answer_idx"] == 1
+        assert data["selections"] == [
+            {"question": question.pk, "option_idx": 1, "points": 1}
+        ]
+
+        response = user_client.get(url + f"?since={data['cursor']}")
+        data = response.json()
+        assert (data["leaderboard"], data["questions"], data["selections"]) == (
+            [],
+            [],
+            [],
+        )
+
+    def test_invalid_cursor(self, user_client, user):
+        game = factories.game_factory(users=(user,))
+        url = reverse("game-state", kwargs={"slug": game.slug})
+        response = user_client.get(url + "?since=yesterday")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize(
+        "since", ["-62135596800000000", "10" * 20, "-1" + "0" * 30]
+    )
+    def test_out_of_range_cursor(self, user_client, user, since):
+        game = factories.game_factory(users=(user,))
+        url = reverse("game-state", kwargs={"slug": game.slug})
+        response = user_client.get(url + f"?since={since}")
+        assert response.status_code == 400
+
+    def test_not_a_member(self, user_client):
+        game = factories.game_factory()
+        url = reverse("game-state", kwargs={"slug": game.slug})
+        response = user_client.get(url)
+        assert response.status_code == 403
+
+
+@pytest.mark.django_db(databases="__all__")
+class TestShardMiddleware:
+    def test_views_use_the_shard_of_the_game(self, sharded, user_client, user):
+        other = factories.user_factory(username="other")
+        with shards.using("shard2"):
+            game = factories.game_factory(slug="game2", users=(user, other))
+            question = factories.question_factory(game=game, respondent=user)
+        with shards.using("shard1"):
+            joinable = factories.game_factory(slug="game1", users=(other,))
+            other_question = factories.question_factory(game=joinable, respondent=other)
+
+        response = user_client.get(reverse("index"))
+        assert [q.id for q in response.context["pending_questions"]] == [question.pk]
+        response = user_client.get(reverse("game-detail", kwargs={"slug": "game2"}))
+        assert response.status_code == 200
+        url = reverse("selection-create", kwargs={"question_pk": question.pk})
+        response = user_client.post(url, data={"option_idx": 0})
+        assert response.status_code == 302
+        selection = Selection.objects.using("shard2").get()
+        assert selection.user_id == user.pk
+        assert OutboxEvent.objects.using("shard2").count() == 1
+
+        response = user_client.get(reverse("index") + "?slug=game1")
+        assert response.url == reverse("game-detail", kwargs={"slug": "game1"})
+        assert joinable.users.count() == 2
+        response = user_client.post(
+            reverse("selection-batch-create"),
+            data=json.dumps(
+                {"selections": [{"question": other_question.pk, "option_idx": 1}]}
+            ),
+            content_type="application/json",
+        )
+        assert response.status_code == 201
+        response = user_client.get(reverse("selection-history"))
+        # by id, so by shard first
+        assert response.context["selections"] == [
+            selection,
+            Selection.objects.using("shard1").get(),
+        ]
+
+    def test_join(self, sharded, user_client, user):
+        with shards.using("shard1"):
+            game = factories.game_factory(slug="game1")
+        user_client.get(reverse("join", kwargs={"code": invites.make_code(game)}))
+        assert list(game.users.all()) == [user]
+
+
+class TestRateLimitMiddleware:
+    @pytest.fixture(autouse=True)
+    def ratelimit(self, settings, tmp_path):
+        settings.RATELIMIT_ENABLED = True
+        settings.RATELIMIT_FILE = str(tmp_path / "buckets")
+        settings.RATELIMITS = {**settings.RATELIMITS, "register": "2/m"}
+
+    @pytest.mark.django_db
+    def test_rejects_without_queries(self, client, django_assert_num_queries):
+        url = reverse("register")
+        data = {"username": "user1", "password1": "x", "password2": "y"}
+        client.post(url, data=data)
+        client.post(url, data=data)
+        with django_assert_num_queries(0):
+            response = client.post(url, data=data)
+        assert response.status_code == 429
+        assert response["Retry-After"] == "30"
+        # only the marked methods count
+        assert client.get(url).status_code == 200
+        # other clients have their own bucket
+        response = client.post(url, data=data, REMOTE_ADDR="10.0.0.1")
+        assert response.status_code == 200
+
+    @pytest.mark.django_db
+    def test_behind_a_proxy(self, client, settings):
+        settings.RATELIMIT_IP_META = "HTTP_X_FORWARDED_FOR"
+        url = reverse("register")
+        data = {"username": "user1", "password1": "x", "password2": "y"}
+        for spoofed in ["1.1.1.1", "2.2.2.2", "3.3.3.3"]:
+            response = client.post(
+                url, data=data, HTTP_X_FORWARDED_FOR=f"{spoofed}, 10.0.0.2"
+            )
+        assert response.status_code == 429
+
+    def test_client_ip(self, rf, settings):
+        settings.RATELIMIT_IP_META = "HTTP_X_FORWARDED_FOR"
+        request = rf.get("/", HTTP_X_FORWARDED_FOR="1.1.1.1, 10.0.0.2, 10.0.0.3")
+        assert ratelimit.client_ip(request) == "10.0.0.3"
+        settings.RATELIMIT_TRUSTED_PROXIES = 2
+        assert ratelimit.client_ip(request) == "10.0.0.2"
+        settings.RATELIMIT_TRUSTED_PROXIES = 4
+        assert ratelimit.client_ip(request) == "1.1.1.1"
+        # without the proxy's header, the peer's address
+        for request in [
+            rf.get("/", REMOTE_ADDR="10.0.0.9"),
+            rf.get("/", REMOTE_ADDR="10.0.0.9", HTTP_X_FORWARDED_FOR=" "),
+        ]:
+            assert ratelimit.client_ip(request) == "10.0.0.9"
+
+    def test_per_user_limit(self, user_client, user, settings):
+        settings.RATELIMITS = {**settings.RATELIMITS, "selection-batch-create": "1/m"}
+        url = reverse("selection-batch-create")
+        data = {"selections": []}
+        response = user_client.post(url, data=data, content_type="application/json")
+        assert response.status_code == 400
+        # a new session is the same user
+        client = Client()
+        client.force_login(user)
+        response = client.post(url, data=data, content_type="application/json")
+        assert response.status_code == 429
+        # an anonymous client from the same address falls back to its IP
+        response = Client().post(url, data=data, content_type="application/json")
+        assert response.status_code == 302
+
+
+class TestProfileMiddleware:
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+
+    def test_superuser_header(self, admin_client, admin_user):
+        response = admin_client.get(reverse("health"), HTTP_X_PROFILE="1")
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        assert profile.user == admin_user
+        assert profile.url_name == "health"
+        with profile.file.open() as f:
+            speedscope = json.load(f)
+        assert len(speedscope["profiles"]) == 2
+
+    def test_query_flag_is_ignored_for_other_users(self, user_client):
+        response = user_client.get(reverse("index") + "?profile")
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response
+        assert not RequestProfile.objects.exists()
+
+    @pytest.mark.django_db
+    def test_sample_rate(self, client, settings):
+        settings.PROFILE_SAMPLE_RATE = 1
+        response = client.get(reverse("login"))
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        assert profile.user is None
+
+
+class TestSlowQueryMiddleware:
+    @pytest.mark.postgres
+    def test_records_slow_queries(self, user_client, user, settings):
+        settings.SLOW_QUERY_THRESHOLD_MS = 0
+        settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 1
+        game = factories.game_factory(users=(user,))
+        url = reverse("game-detail", kwargs={"slug": game.slug})
+        with patch.object(middleware.slow_query_logger, "info") as info:
+            response = user_client.get(url)
+        assert response.status_code == 200
+        slow_queries = SlowQuery.objects.filter(url_name="game-detail")
+        assert info.call_count == slow_queries.count() > 0
+        call_sites = {slow_query.call_site for slow_query in slow_queries}
+        assert any(site.startswith("forcedfun/views.py") for site in call_sites)
+        assert all(slow_query.explain for slow_query in slow_queries)
+
+        settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 0
+        user_client.get(url)
+        assert SlowQuery.objects.filter(explain="").exists()
+
+    @pytest.mark.django_db
+    def test_records_failed_queries(self, rf, settings):
+        settings.SLOW_QUERY_THRESHOLD_MS = 0
+        settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 1
+
+        def get_response(request):
+            # Django turns the error into a 500 before it reaches the middleware
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute("SELECT * FROM nope")
+            except DatabaseError:
+                return HttpResponse(status=500)
+
+        with patch.object(middleware.slow_query_logger, "info") as info:
+            middleware.SlowQueryMiddleware(get_response)(rf.get("/"))
+        logged = [json.loads(call.args[0]) for call in info.call_args_list]
+        assert any(entry["error"] for entry in logged)
+        slow_query = SlowQuery.objects.get(sql="SELECT * FROM nope")
+        assert slow_query.explain == ""
+
+    def test_fast_queries_are_not_recorded(self, user_client):
+        response = user_client.get(reverse("index"))
+        assert response.status_code == 200
+        assert not SlowQuery.objects.exists()
+
+
+class TestTracingMiddleware:
+    @pytest.fixture()
+    def traces(self, settings, tmp_path):
+        settings.TRACING_EXPORTER = "file"
+        settings.TRACING_FILE = tmp_path / "traces.jsonl"
+
+        def read():
+            lines = settings.TRACING_FILE.read_text().splitlines()
+            return [
+                json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+                for line in lines
+            ]
+
+        return read
+
+    def test_view_phases(self, admin_client, admin_user, traces):
+        respondent_selection = factories.selection_factory()
+        question = respondent_selection.question
+        question.game.users.add(admin_user)
+        factories.selection_factory(question=question, user=admin_user)
+        url = reverse("question-score", kwargs={"pk": question.pk})
+        with patch.object(middleware.sentry_sdk, "set_tag") as set_tag:
+            response = admin_client.post(url)
+        (spans,) = traces()
+        names = {span["name"] for span in spans}
+        assert {"score_selections", "bulk_update", "db.query"} <= names
+        root = spans[-1]
+        assert root["name"] == "POST question-score"
+        assert response["X-Trace-Id"] == root["traceId"]
+        set_tag.assert_called_once_with("trace_id", root["traceId"])
+
+    def test_render_and_membership_check(self, user_client, user, traces):
+        question = factories.question_factory(respondent=user)
+        factories.selection_factory(user=user, question=question)
+        user_client.get(reverse("question-detail", kwargs={"pk": question.pk}))
+        (spans,) = traces()
+        names = {span["name"] for span in spans}
+        assert {"user_in_game_check_or_302", "render"} <= names
+
+    def test_unresolved_path(self, client, traces):
+        response = client.get("/does-not-exist/")
+        (spans,) = traces()
+        assert spans[-1]["name"] == "GET /does-not-exist/"
+        assert response["X-Trace-Id"] == spans[-1]["traceId"]